@@ -17,7 +17,6 @@ namespace UWB {
 
         if (serial_port_->Open() > 0) {
             is_serial_opened_ = true;
-            sleep(1); // wait for serial port
         
             thread update_data_thread(&UWBManager::readSerialData, this);
             update_data_thread.detach();
@@ -59,12 +58,17 @@ namespace UWB {
                     data_vector.emplace_back(data_string[i]);
                 }
                 processRawData(data_vector);
+                is_frame_received_ = true;
             }
 
             usleep(1000 * 20);
         }
     }
 
+    bool UWBManager::isFrameReceived() {
+        return is_frame_received_;
+    }
+
     UWBData UWBManager::getUWBState() {
         if (uwb_data_Q_->size() != 0) {
             uwb_data_ = uwb_data_Q_->pop();
@@ -91,7 +95,6 @@ namespace UWB {
         setAnchorPosition(-4.34, 1.13); // set Anchor 2 position
         if (anchor_pos_list_.size() == 3) { // require anchor position num 
             uwb_system_is_active_ = true;
-            sleep(1); //wait for uwb_manager init
             thread localize_tag_thread(&UWBLocalizeSystem::caculateTagPosition, this);
             localize_tag_thread.detach();
         }
@@ -118,8 +121,10 @@ namespace UWB {
 
         UWBData uwb_data;
         while (uwb_system_is_active_) {
-            uwb_data = uwb_manager_->getUWBState();
-            processMLE(uwb_data);
+            if (uwb_manager_->isFrameReceived()) { // no fixed startup wait, solve once data arrived
+                uwb_data = uwb_manager_->getUWBState();
+                processMLE(uwb_data);
+            }
             usleep(1000 * 20);
         }
     }
@@ -2,6 +2,7 @@
 #define UWB_MANAGER_H_
 
 #include <thread>
+#include <atomic>
 #include <array>
 #include <algorithm>
 #include <math.h>
@@ -40,10 +41,12 @@ namespace UWB {
         ~UWBManager();
 
         UWBData getUWBState();
+        bool isFrameReceived();
         void closeUWBManager();
 
         private:
         bool is_serial_opened_ = false;
+        atomic<bool> is_frame_received_{false};
         BlockQueue<UWBData> *uwb_data_Q_ = new BlockQueue<UWBData>(5);
         UWBData uwb_data_;
 
@@ -0,0 +1,73 @@
+import threading
+from collections import deque
+
+
+class BlockQueue():
+    """ Bounded blocking queue, python side of UWB_HHEV.OS/include/BlockQueue.h """
+
+    def __init__(self, max_size = 1000, drop_oldest = False):
+
+        self.max_size_ = max_size
+        self.drop_oldest_ = drop_oldest # False: push blocks while full, True: overwrite the oldest item
+        self.queue_ = deque()
+        self.lock_ = threading.Lock()
+        self.not_empty_ = threading.Condition(self.lock_)
+        self.not_full_ = threading.Condition(self.lock_)
+        self.exit_ = False
+        self.dropped_count = 0
+
+    def push(self, item, timeout = None) -> bool:
+        with self.lock_:
+            if len(self.queue_) >= self.max_size_:
+                if self.drop_oldest_:
+                    self.queue_.popleft()
+                    self.dropped_count += 1
+                else:
+                    self.not_full_.wait_for(lambda: len(self.queue_) < self.max_size_ or self.exit_, timeout)
+                    if self.exit_ or len(self.queue_) >= self.max_size_:
+                        self.dropped_count += 1
+                        return False
+            if self.exit_:
+                return False
+            self.queue_.append(item)
+            self.not_empty_.notify()
+        return True
+
+    def pop(self, timeout = None):
+        # returns None on timeout or once the queue is released and drained
+        with self.lock_:
+            if not self.queue_:
+                self.not_empty_.wait_for(lambda: self.queue_ or self.exit_, timeout)
+                if not self.queue_:
+                    return None
+            item = self.queue_.popleft()
+            self.not_full_.notify()
+        return item
+
+    def popAll(self, timeout = None) -> list:
+        with self.lock_:
+            if not self.queue_:
+                self.not_empty_.wait_for(lambda: self.queue_ or self.exit_, timeout)
+            items = list(self.queue_)
+            self.queue_.clear()
+            self.not_full_.notify_all()
+        return items
+
+    def setDropOldest(self, drop_oldest) -> bool:
+        # returns the previous policy; a pusher already waiting keeps waiting for room
+        with self.lock_:
+            previous, self.drop_oldest_ = self.drop_oldest_, drop_oldest
+        return previous
+
+    def size(self) -> int:
+        with self.lock_:
+            return len(self.queue_)
+
+    def releaseAllCV(self):
+        with self.lock_:
+            self.exit_ = True
+            self.not_empty_.notify_all()
+            self.not_full_.notify_all()
+
+    def isReleased(self) -> bool:
+        return self.exit_
@@ -0,0 +1,508 @@
+import numpy as np
+import struct
+import time
+
+# pycdr2 / XCDR1 little endian, alignment is counted after the 4 byte encapsulation header
+CDR_LE_HEADER = b'\x00\x01\x00\x00'
+CDR_HEADER_SIZE = 4
+
+_UINT32 = struct.Struct('<I')
+_FLOAT32 = struct.Struct('<f')
+_STAMP = struct.Struct('<II')
+_UWB_STATE = struct.Struct('<ddi')
+_UWB_DELTA_HEAD = struct.Struct('<IIII')
+DELTA_LIMIT = 32767 # mm, int16 delta range
+
+
+class CDRWriter():
+    """ Reusable CDR output buffer """
+
+    def __init__(self, size = 1024):
+
+        self.buffer_ = bytearray(size)
+        self.pos_ = 0
+        self.reset()
+
+    def reset(self):
+        self.buffer_[:CDR_HEADER_SIZE] = CDR_LE_HEADER
+        self.pos_ = CDR_HEADER_SIZE
+
+    def reserve(self, size):
+        if self.pos_ + size > len(self.buffer_):
+            self.buffer_.extend(bytes(max(self.pos_ + size - len(self.buffer_), len(self.buffer_))))
+
+    def align(self, alignment):
+        padding = -(self.pos_ - CDR_HEADER_SIZE) % alignment
+        if padding:
+            self.reserve(padding)
+            self.buffer_[self.pos_:self.pos_ + padding] = bytes(padding)
+            self.pos_ += padding
+
+    def writeStruct(self, packer, *values):
+        self.reserve(packer.size)
+        packer.pack_into(self.buffer_, self.pos_, *values)
+        self.pos_ += packer.size
+
+    def writeBytes(self, data):
+        self.reserve(len(data))
+        self.buffer_[self.pos_:self.pos_ + len(data)] = data
+        self.pos_ += len(data)
+
+    def writeString(self, text):
+        data = text.encode()
+        self.align(4)
+        self.writeStruct(_UINT32, len(data) + 1)
+        self.writeBytes(data)
+        self.writeBytes(b'\x00')
+
+    def writeSequence(self, array, dtype):
+        array = np.asarray(array, dtype=dtype)
+        self.align(4)
+        self.writeStruct(_UINT32, len(array))
+        if len(array):
+            self.align(array.itemsize)
+            self.writeBytes(array.tobytes())
+
+    def getBytes(self) -> bytes:
+        return bytes(memoryview(self.buffer_)[:self.pos_])
+
+
+def encodeStringSequence(names) -> bytes:
+    # block for a List[str] starting 4-aligned; every item keeps 4-alignment so the block is position independent
+    writer = CDRWriter()
+    writer.writeStruct(_UINT32, len(names))
+    for name in names:
+        writer.writeString(name)
+    writer.align(4)
+    return bytes(memoryview(writer.buffer_)[CDR_HEADER_SIZE:writer.pos_])
+
+
+class UWBStateEncoder():
+    """ UWBState serializer writing into one reusable buffer """
+
+    def __init__(self):
+
+        self.buffer_ = bytearray(CDR_LE_HEADER + bytes(_UWB_STATE.size))
+
+    def encode(self, position_x, position_y, tag_id) -> bytes:
+        _UWB_STATE.pack_into(self.buffer_, CDR_HEADER_SIZE, position_x, position_y, tag_id)
+        return bytes(self.buffer_)
+
+
+class UWBStampedBatchEncoder():
+    """ Packs K fixes of M tags into one UWBStampedBatch, buffers are reused between batches """
+
+    _STAMP = struct.Struct('<II')
+
+    def __init__(self, frame_id = 'uwb', capacity = 256):
+
+        self.frame_id_ = frame_id
+        self.tag_id_ = np.zeros(capacity, dtype='<i4')
+        self.fix_stamp_ = np.zeros(capacity, dtype=np.float64)
+        self.position_ = np.zeros((2, capacity), dtype='<f4')
+        self.size_ = 0
+        self.writer_ = CDRWriter(64 + capacity * 16)
+
+    def __len__(self) -> int:
+        return self.size_
+
+    def isFull(self) -> bool:
+        return self.size_ == len(self.tag_id_)
+
+    def addFix(self, tag_id, position_x, position_y, stamp):
+        # stamp: monotonic time of the fix
+        index = self.size_
+        self.tag_id_[index] = tag_id
+        self.fix_stamp_[index] = stamp
+        self.position_[0, index] = position_x
+        self.position_[1, index] = position_y
+        self.size_ += 1
+
+    def encode(self) -> bytes:
+        size = self.size_
+        self.size_ = 0
+        return self.encodeArrays(time.time(), self.tag_id_[:size], self.fix_stamp_[:size] - time.monotonic(),
+                                 self.position_[0, :size], self.position_[1, :size])
+
+    def encodeArrays(self, wall_time, tag_id, time_offset, position_x, position_y) -> bytes:
+        writer = self.writer_
+        writer.reset()
+        writer.writeStruct(self._STAMP, int(wall_time), int((wall_time % 1) * 1e9))
+        writer.writeString(self.frame_id_)
+        writer.writeSequence(tag_id, '<i4')
+        writer.writeSequence(time_offset, '<f4')
+        writer.writeSequence(position_x, '<f4')
+        writer.writeSequence(position_y, '<f4')
+        return writer.getBytes()
+
+
+class UWBStateStampedEncoder():
+    """ UWBStateStamped serializer, stamps are monotonic and converted to wall time here """
+
+    _TAIL = struct.Struct('<ddiff')
+
+    def __init__(self, frame_id = 'uwb'):
+
+        self.writer_ = CDRWriter(128)
+        self.frame_id_ = frame_id
+        self.seq_ = 0
+
+    def encode(self, position_x, position_y, tag_id, receive_stamp, solve_stamp, publish_stamp) -> bytes:
+        wall_time = time.time() - (time.monotonic() - receive_stamp)
+        writer = self.writer_
+        writer.reset()
+        writer.writeStruct(_STAMP, int(wall_time), int((wall_time % 1) * 1e9))
+        writer.writeString(self.frame_id_)
+        writer.align(4)
+        writer.writeStruct(_UINT32, self.seq_)
+        writer.align(8)
+        writer.writeStruct(self._TAIL, position_x, position_y, tag_id,
+                           solve_stamp - receive_stamp, publish_stamp - receive_stamp)
+        self.seq_ = (self.seq_ + 1) & 0xffffffff
+        return writer.getBytes()
+
+
+class OverViewStateEncoder():
+    """ OverViewState serializer, the joint name block is encoded once per name list """
+
+    _BATTERY = struct.Struct('<fff')
+
+    def __init__(self):
+
+        self.writer_ = CDRWriter()
+        self.joint_name_ = None
+        self.joint_name_block_ = b''
+
+    def encode(self, battery_state, joint_state) -> bytes:
+        joint_name_block = getattr(joint_state, 'name_block', None) # JointStatesView carries the encoded names
+        if joint_name_block is None:
+            joint_name = joint_state.name
+            if joint_name != self.joint_name_:
+                self.joint_name_block_ = encodeStringSequence(joint_name)
+                self.joint_name_ = list(joint_name)
+            joint_name_block = self.joint_name_block_
+        writer = self.writer_
+        writer.reset()
+        writer.writeStruct(self._BATTERY, battery_state.voltage, battery_state.capacity, battery_state.percentage)
+        writer.writeBytes(joint_name_block)
+        writer.writeSequence(joint_state.velocity, '<f8')
+        return writer.getBytes()
+
+
+class FleetStateEncoder():
+    """ FleetState serializer, the robot name block is rebuilt only when a robot joins """
+
+    def __init__(self):
+
+        self.writer_ = CDRWriter(4096)
+        self.robot_num_ = None
+        self.robot_name_block_ = b''
+
+    def encode(self, snapshot) -> bytes:
+        # snapshot: FleetTable.getSnapshot()
+        robot_name = snapshot['robot_name']
+        if len(robot_name) != self.robot_num_: # rows are append-only
+            self.robot_name_block_ = encodeStringSequence(robot_name)
+            self.robot_num_ = len(robot_name)
+        wall_time = time.time()
+        writer = self.writer_
+        writer.reset()
+        writer.writeStruct(_STAMP, int(wall_time), int((wall_time % 1) * 1e9))
+        writer.writeBytes(self.robot_name_block_)
+        writer.writeSequence(snapshot['battery'][:, 0], '<f4')
+        writer.writeSequence(snapshot['battery'][:, 2], '<f4')
+        writer.writeSequence(snapshot['position'][:, 0], '<f8')
+        writer.writeSequence(snapshot['position'][:, 1], '<f8')
+        writer.writeSequence(snapshot['tag_id'], '<i4')
+        writer.writeSequence(snapshot['age'], '<f4')
+        return writer.getBytes()
+
+
+class UWBZoneEventEncoder():
+    """ UWBZoneEvent serializer, the monotonic fix stamp is converted to wall time here """
+
+    _HEAD = struct.Struct('<IIiB')
+    _POSITION = struct.Struct('<dd')
+
+    def __init__(self):
+
+        self.writer_ = CDRWriter(128)
+
+    def encode(self, event) -> bytes:
+        # event: uwb_spatial_index.ZoneEvent
+        wall_time = time.time() - (time.monotonic() - event.stamp)
+        writer = self.writer_
+        writer.reset()
+        writer.writeStruct(self._HEAD, int(wall_time), int((wall_time % 1) * 1e9), event.tag_id, int(event.entered))
+        writer.writeString(event.zone)
+        writer.align(8)
+        writer.writeStruct(self._POSITION, event.position_x, event.position_y)
+        return writer.getBytes()
+
+
+class UWBDeltaEncoder():
+    """ UWBDeltaState serializer, updates are mm offsets against the tag position of the last keyframe """
+
+    def __init__(self, max_tag_num = 256):
+
+        self.writer_ = CDRWriter(64 + max_tag_num * 12)
+        self.key_position_ = np.zeros((max_tag_num, 2), dtype=np.int64) # mm
+        self.in_keyframe_ = np.zeros(max_tag_num, dtype=bool)
+        self.has_keyframe_ = False
+        self.seq_ = 0
+        self.keyframe_seq_ = 0
+
+    def encodeKeyframe(self, tag_ids, positions) -> bytes:
+        # positions: (N, 2) meter
+        tag_ids = np.asarray(tag_ids, dtype=np.int64)
+        position_mm = np.rint(np.asarray(positions, dtype=np.float64).reshape(-1, 2) * 1000).astype(np.int64)
+        self.in_keyframe_[:] = False
+        self.in_keyframe_[tag_ids] = True
+        self.key_position_[tag_ids] = position_mm
+        self.has_keyframe_ = True
+        self.keyframe_seq_ = self.seq_
+        return self.encodeMessage(tag_ids, position_mm.reshape(-1), ())
+
+    def encodeDelta(self, tag_ids, positions) -> bytes:
+        # None when a keyframe is needed first: a tag missing from it or moved beyond the int16 range
+        tag_ids = np.asarray(tag_ids, dtype=np.int64)
+        if not self.has_keyframe_ or not np.all(self.in_keyframe_[tag_ids]):
+            return None
+        delta = np.rint(np.asarray(positions, dtype=np.float64).reshape(-1, 2) * 1000).astype(np.int64) - self.key_position_[tag_ids]
+        if np.any(np.abs(delta) > DELTA_LIMIT):
+            return None
+        return self.encodeMessage(tag_ids, (), delta.reshape(-1))
+
+    def encodeMessage(self, tag_ids, position, delta) -> bytes:
+        wall_time = time.time()
+        writer = self.writer_
+        writer.reset()
+        writer.writeStruct(_UWB_DELTA_HEAD, int(wall_time), int((wall_time % 1) * 1e9), self.seq_, self.keyframe_seq_)
+        writer.writeSequence(tag_ids, '<u1')
+        writer.writeSequence(position, '<i4')
+        writer.writeSequence(delta, '<i2')
+        self.seq_ = (self.seq_ + 1) & 0xffffffff
+        return writer.getBytes()
+
+
+def decodeUWBDeltaSeq(payload) -> int:
+    return _UWB_DELTA_HEAD.unpack_from(payload, CDR_HEADER_SIZE)[2]
+
+
+class UWBDeltaDecoder():
+    """ Receiver side of UWBDeltaEncoder, keeps the keyframe and counts lost messages """
+
+    def __init__(self, max_tag_num = 256):
+
+        self.key_position_ = np.zeros((max_tag_num, 2), dtype=np.int64) # mm
+        self.keyframe_seq_ = None
+        self.last_seq_ = None
+        self.lost_count = 0
+        self.skipped_count = 0 # updates against a keyframe that was not received
+
+    def decode(self, payload) -> list:
+        # [(tag_id, x, y), ...] in meter, None until the keyframe of an update is known
+        _, _, seq, keyframe_seq = _UWB_DELTA_HEAD.unpack_from(payload, CDR_HEADER_SIZE)
+        if self.last_seq_ is not None:
+            lost = (seq - self.last_seq_ - 1) & 0xffffffff
+            if lost < 0x80000000: # otherwise a publisher restart
+                self.lost_count += lost
+        self.last_seq_ = seq
+        tag_ids, pos = _readSequence(payload, CDR_HEADER_SIZE + _UWB_DELTA_HEAD.size, '<u1')
+        position, pos = _readSequence(payload, pos, '<i4')
+        delta, pos = _readSequence(payload, pos, '<i2')
+        tag_ids = tag_ids.astype(np.int64)
+        if seq == keyframe_seq:
+            self.key_position_[tag_ids] = position.reshape(-1, 2)
+            self.keyframe_seq_ = keyframe_seq
+            position_mm = self.key_position_[tag_ids]
+        elif keyframe_seq != self.keyframe_seq_:
+            self.skipped_count += 1
+            return None
+        else:
+            position_mm = self.key_position_[tag_ids] + delta.reshape(-1, 2)
+        return [(int(tag_id), x / 1000, y / 1000) for tag_id, (x, y) in zip(tag_ids, position_mm.tolist())]
+
+
+def decodeUWBState(payload) -> tuple:
+    # (position_x, position_y, tag_id) straight from a UWBState payload
+    return _UWB_STATE.unpack_from(payload, CDR_HEADER_SIZE)
+
+
+def _align(pos, alignment) -> int:
+    # pos is an absolute payload offset, alignment is counted after the encapsulation header
+    return pos + (-(pos - CDR_HEADER_SIZE) % alignment)
+
+
+def _skipString(payload, pos) -> int:
+    pos = _align(pos, 4)
+    return pos + 4 + _UINT32.unpack_from(payload, pos)[0]
+
+
+def _readString(payload, pos) -> str:
+    pos = _align(pos, 4)
+    size = _UINT32.unpack_from(payload, pos)[0]
+    return bytes(payload[pos + 4:pos + 3 + size]).decode()
+
+
+def _readSequence(payload, pos, dtype) -> tuple:
+    # (array view, offset after the sequence), empty sequences carry no element alignment
+    dtype = np.dtype(dtype)
+    pos = _align(pos, 4)
+    size = _UINT32.unpack_from(payload, pos)[0]
+    pos += 4
+    if size == 0:
+        return np.zeros(0, dtype=dtype), pos
+    pos = _align(pos, dtype.itemsize)
+    return np.frombuffer(payload, dtype=dtype, count=size, offset=pos), pos + size * dtype.itemsize
+
+
+def _float32Field(index):
+    def getter(self):
+        return _FLOAT32.unpack_from(self.payload_, self.bodyOffset() + 4 * index)[0]
+    return property(getter)
+
+
+class CDRView():
+    """ Read-only view over a raw CDR payload, fields are decoded on access without copying the payload """
+
+    def __init__(self, payload):
+
+        self.payload_ = memoryview(payload)
+
+    @property
+    def stamp_sec(self) -> int:
+        return _STAMP.unpack_from(self.payload_, CDR_HEADER_SIZE)[0]
+
+    @property
+    def stamp_nsec(self) -> int:
+        return _STAMP.unpack_from(self.payload_, CDR_HEADER_SIZE)[1]
+
+    @property
+    def frame_id(self) -> str:
+        return _readString(self.payload_, CDR_HEADER_SIZE + _STAMP.size)
+
+
+class BatteryStateView(CDRView):
+    """ Lazy BatteryState, numeric fields sit at a fixed offset after frame_id """
+
+    _STATUS = struct.Struct('<3B?')
+
+    def __init__(self, payload):
+
+        super().__init__(payload)
+        self.body_offset_ = None
+
+    def bodyOffset(self) -> int:
+        if self.body_offset_ is None:
+            self.body_offset_ = _align(_skipString(self.payload_, CDR_HEADER_SIZE + _STAMP.size), 4)
+        return self.body_offset_
+
+    voltage = _float32Field(0)
+    temperature = _float32Field(1)
+    current = _float32Field(2)
+    charge = _float32Field(3)
+    capacity = _float32Field(4)
+    design_capacity = _float32Field(5)
+    percentage = _float32Field(6)
+
+    def getStatus(self) -> tuple:
+        # (power_supply_status, power_supply_health, power_supply_technology, present)
+        return self._STATUS.unpack_from(self.payload_, self.bodyOffset() + 28)
+
+    @property
+    def power_supply_status(self) -> int:
+        return self.getStatus()[0]
+
+    @property
+    def power_supply_health(self) -> int:
+        return self.getStatus()[1]
+
+    @property
+    def power_supply_technology(self) -> int:
+        return self.getStatus()[2]
+
+    @property
+    def present(self) -> bool:
+        return self.getStatus()[3]
+
+
+class JointStatesView(CDRView):
+    """ Lazy JointStates, float64 sequences are NumPy views into the payload """
+
+    def __init__(self, payload):
+
+        super().__init__(payload)
+        self.offsets_ = None
+
+    def getOffsets(self) -> dict:
+        # one pass over the string lengths, names themselves are not decoded
+        if self.offsets_ is None:
+            payload = self.payload_
+            pos = _align(_skipString(payload, CDR_HEADER_SIZE + _STAMP.size), 4)
+            offsets = {'name': pos}
+            name_num = _UINT32.unpack_from(payload, pos)[0]
+            pos += 4
+            for _ in range(name_num):
+                pos = _skipString(payload, pos)
+            offsets['name_end'] = pos
+            for field in ('position', 'velocity', 'effort'):
+                pos = _align(pos, 4)
+                size = _UINT32.unpack_from(payload, pos)[0]
+                pos += 4
+                if size:
+                    pos = _align(pos, 8)
+                offsets[field] = (pos, size)
+                pos += 8 * size
+            self.offsets_ = offsets
+        return self.offsets_
+
+    def getArray(self, field) -> np.ndarray:
+        pos, size = self.getOffsets()[field]
+        return np.frombuffer(self.payload_, dtype='<f8', count=size, offset=pos)
+
+    @property
+    def name(self) -> list:
+        pos = self.getOffsets()['name']
+        names = list()
+        name_num = _UINT32.unpack_from(self.payload_, pos)[0]
+        pos += 4
+        for _ in range(name_num):
+            names.append(_readString(self.payload_, pos))
+            pos = _skipString(self.payload_, pos)
+        return names
+
+    @property
+    def name_block(self) -> memoryview:
+        # raw List[str] encoding, 4-aligned start, reusable as is in another 4-aligned message
+        offsets = self.getOffsets()
+        return self.payload_[offsets['name']:offsets['name_end']]
+
+    @property
+    def position(self) -> np.ndarray:
+        return self.getArray('position')
+
+    @property
+    def velocity(self) -> np.ndarray:
+        return self.getArray('velocity')
+
+    @property
+    def effort(self) -> np.ndarray:
+        return self.getArray('effort')
+
+
+class UWBStateStampedView(CDRView):
+    """ Lazy UWBStateStamped, enough for sequence and latency accounting """
+
+    _TAIL = struct.Struct('<ddiff')
+
+    @property
+    def seq(self) -> int:
+        return _UINT32.unpack_from(self.payload_, self.seqOffset())[0]
+
+    def seqOffset(self) -> int:
+        return _align(_skipString(self.payload_, CDR_HEADER_SIZE + _STAMP.size), 4)
+
+    def getTail(self) -> tuple:
+        # (position_x, position_y, tag_id, solve_latency, publish_latency)
+        return self._TAIL.unpack_from(self.payload_, _align(self.seqOffset() + 4, 8))
@@ -0,0 +1,73 @@
+import numpy as np
+import threading
+import time
+
+MAX_ROBOT_NUM = 1024
+
+
+class FleetTable():
+    """ Latest state per robot, rows are assigned on first sight of a robot name """
+
+    def __init__(self, max_robot_num = MAX_ROBOT_NUM):
+
+        self.index_ = dict() # robot name -> row
+        self.robot_names_ = list()
+        self.battery_ = np.zeros((max_robot_num, 3), dtype=np.float32) # voltage, capacity, percentage
+        self.position_ = np.zeros((max_robot_num, 2))
+        self.tag_id_ = np.full(max_robot_num, -1, dtype=np.int32)
+        self.stamp_ = np.zeros(max_robot_num) # last sample of any topic
+        self.joint_state_ = [None] * max_robot_num # latest JointStates (or lazy view) per row
+        self.version_ = 0 # bumped when a robot is added
+        self.lock_ = threading.Lock() # only taken to add a row
+
+    def getIndex(self, robot_name) -> int:
+        index = self.index_.get(robot_name)
+        if index is None:
+            with self.lock_:
+                index = self.index_.get(robot_name)
+                if index is None:
+                    index = len(self.robot_names_)
+                    if index == len(self.stamp_):
+                        raise IndexError("fleet table full ({} robots)".format(index))
+                    self.robot_names_.append(robot_name)
+                    self.index_[robot_name] = index
+                    self.version_ += 1
+        return index
+
+    def updateBattery(self, robot_name, voltage, capacity, percentage, stamp = None):
+        index = self.getIndex(robot_name)
+        self.battery_[index] = (voltage, capacity, percentage)
+        self.stamp_[index] = time.monotonic() if stamp is None else stamp
+
+    def updateJointState(self, robot_name, joint_state, stamp = None):
+        index = self.getIndex(robot_name)
+        self.joint_state_[index] = joint_state
+        self.stamp_[index] = time.monotonic() if stamp is None else stamp
+
+    def updatePosition(self, robot_name, position_x, position_y, tag_id, stamp = None):
+        index = self.getIndex(robot_name)
+        self.position_[index, 0] = position_x
+        self.position_[index, 1] = position_y
+        self.tag_id_[index] = tag_id
+        self.stamp_[index] = time.monotonic() if stamp is None else stamp
+
+    def getRobotNames(self) -> list:
+        return self.robot_names_[:]
+
+    def getJointState(self, robot_name):
+        index = self.index_.get(robot_name)
+        return None if index is None else self.joint_state_[index]
+
+    def getSnapshot(self, stamp = None) -> dict:
+        # column copies of the first N rows, age relative to stamp (time.monotonic())
+        if stamp is None:
+            stamp = time.monotonic()
+        robot_num = len(self.robot_names_)
+        return {'robot_name': self.robot_names_[:robot_num],
+                'battery': self.battery_[:robot_num].copy(),
+                'position': self.position_[:robot_num].copy(),
+                'tag_id': self.tag_id_[:robot_num].copy(),
+                'age': (stamp - self.stamp_[:robot_num]).astype(np.float32)}
+
+    def __len__(self) -> int:
+        return len(self.robot_names_)
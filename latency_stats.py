@@ -0,0 +1,103 @@
+import numpy as np
+
+SUB_BUCKET_BITS = 6 # 32 sub buckets per power of two above 64 us, buckets at most ~3 % of the value wide
+SUB_BUCKET_NUM = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_NUM >> 1
+
+
+class LatencyHistogram():
+    """ HDR-style log-linear histogram of latencies in microsecond, one writer thread """
+
+    def __init__(self, max_value = 100.0):
+
+        # max_value: second, larger samples land in the last bucket
+        self.max_us_ = int(max_value * 1e6)
+        self.counts_ = np.zeros(self.bucketIndex(self.max_us_) + 1, dtype=np.int64)
+        self.count = 0
+        self.sum_ = 0.0
+        self.min_ = None
+        self.max_ = 0.0
+
+    @staticmethod
+    def bucketIndex(value_us) -> int:
+        if value_us < SUB_BUCKET_NUM:
+            return value_us
+        shift = value_us.bit_length() - SUB_BUCKET_BITS
+        return shift * SUB_BUCKET_HALF + (value_us >> shift)
+
+    @staticmethod
+    def bucketValue(index) -> float:
+        # middle of the bucket in microsecond
+        if index < SUB_BUCKET_NUM:
+            return float(index)
+        shift = index // SUB_BUCKET_HALF - 1
+        return ((index - shift * SUB_BUCKET_HALF) << shift) + ((1 << shift) - 1) / 2
+
+    def record(self, value):
+        # value: second
+        value = max(float(value), 0.0)
+        value_us = min(int(value * 1e6), self.max_us_)
+        self.counts_[self.bucketIndex(value_us)] += 1
+        self.count += 1
+        self.sum_ += value
+        if self.min_ is None or value < self.min_:
+            self.min_ = value
+        if value > self.max_:
+            self.max_ = value
+
+    def percentile(self, percent) -> float:
+        # second, None when empty
+        if self.count == 0:
+            return None
+        rank = max(int(np.ceil(self.count * percent / 100.0)), 1)
+        index = int(np.searchsorted(np.cumsum(self.counts_), rank))
+        return self.bucketValue(index) * 1e-6
+
+    def getStats(self) -> dict:
+        if self.count == 0:
+            return {'count': 0}
+        return {'count': self.count,
+                'mean': self.sum_ / self.count,
+                'min': self.min_,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'p999': self.percentile(99.9),
+                'max': self.max_}
+
+    def reset(self):
+        self.counts_[:] = 0
+        self.count = 0
+        self.sum_ = 0.0
+        self.min_ = None
+        self.max_ = 0.0
+
+
+class PipelineStats():
+    """ Named counters and latency histograms, each name is written by a single thread """
+
+    def __init__(self):
+
+        self.counters_ = dict()
+        self.histograms_ = dict()
+
+    def count(self, name, value = 1):
+        self.counters_[name] = self.counters_.get(name, 0) + value
+
+    def getHistogram(self, name) -> LatencyHistogram:
+        histogram = self.histograms_.get(name)
+        if histogram is None:
+            histogram = self.histograms_.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def record(self, name, value):
+        self.getHistogram(name).record(value)
+
+    def getStats(self) -> dict:
+        return {'counters': dict(self.counters_),
+                'latency': {name: histogram.getStats() for name, histogram in list(self.histograms_.items())}}
+
+    def reset(self):
+        self.counters_.clear()
+        for histogram in list(self.histograms_.values()):
+            histogram.reset()
@@ -0,0 +1,256 @@
+import asyncio
+import signal
+import sys
+import time
+import serial
+from uwb_frame_parser import FRAME_HEADER, UWBFrameParser
+from uwb_serial_link import SerialLink
+from uwb_tag_table import TagTable
+
+
+class AsyncDropQueue():
+    """ asyncio counterpart of BlockQueue(drop_oldest = True), use from the loop thread only """
+
+    def __init__(self, max_size = 64):
+
+        self.queue_ = asyncio.Queue()
+        self.max_size_ = max_size
+        self.drop_oldest_ = True # False: keep every item, the queue grows past max_size
+        self.dropped_count = 0
+
+    def push(self, item) -> bool:
+        if self.drop_oldest_ and self.queue_.qsize() >= self.max_size_:
+            self.queue_.get_nowait()
+            self.dropped_count += 1
+        self.queue_.put_nowait(item)
+        return True
+
+    def setDropOldest(self, drop_oldest) -> bool:
+        previous, self.drop_oldest_ = self.drop_oldest_, drop_oldest
+        return previous
+
+    async def pop(self):
+        return await self.queue_.get()
+
+    def size(self) -> int:
+        return self.queue_.qsize()
+
+    def releaseAllCV(self):
+        pass # waiters are released by task cancellation
+
+
+class AsyncUWBManager():
+    """ UWBManager replacement reading the serial port from the event loop """
+
+    STALL_CHECK_PERIOD = 0.25 # second
+
+    def __init__(self, port = '/dev/ttyUSB0', baudrate = 115200, readiness = None, frame_check = False):
+
+        # one master per manager: tag ids of another anchor network would collide in the table and the solver
+        self.loop_ = asyncio.get_running_loop()
+        self.serial_link_ = SerialLink(port, baudrate, readiness = readiness)
+        self.frame_parser_ = UWBFrameParser(header = FRAME_HEADER, check_sum = True) if frame_check else UWBFrameParser()
+        self.range_table_ = TagTable() # written from the loop thread only
+        self.frame_queue_ = AsyncDropQueue(64)
+        self.active_flag_ = False
+        self.stall_timer_ = None
+
+    def startFetchDistance(self):
+        self.active_flag_ = True
+        if self.serial_link_.connected:
+            self.loop_.add_reader(self.serial_link_.fileno(), self.updateSensorData)
+        else:
+            self.scheduleReconnect()
+        self.stall_timer_ = self.loop_.call_later(self.STALL_CHECK_PERIOD, self.checkStall)
+
+    def updateSensorData(self):
+        try:
+            frames = self.frame_parser_.readFrom(self.serial_link_.serial_port_)
+        except (serial.SerialException, OSError) as e:
+            self.serial_link_.error_count += 1
+            self.dropLink("read failed: {}".format(e))
+            return
+        stamp = time.monotonic()
+        self.serial_link_.updateRate(len(frames), stamp)
+        for tag_data in frames:
+            self.range_table_.update(tag_data[3], ranges = tag_data[:3], stamp = stamp)
+            self.frame_queue_.push((tag_data, stamp))
+
+    def checkStall(self):
+        # the reader only runs when data arrives, so a silent port is caught by this timer
+        if self.serial_link_.isStalled():
+            self.dropLink("stalled", stalled = True)
+        self.stall_timer_ = self.loop_.call_later(self.STALL_CHECK_PERIOD, self.checkStall)
+
+    def dropLink(self, reason, stalled = False):
+        self.loop_.remove_reader(self.serial_link_.fileno())
+        self.serial_link_.lost(reason, stalled)
+        self.scheduleReconnect()
+
+    def scheduleReconnect(self):
+        self.loop_.call_later(self.serial_link_.getRetryDelay(), self.reconnect)
+
+    def reconnect(self):
+        # pyserial opens in a few ms, fine to do on the loop thread
+        if not self.active_flag_:
+            return
+        if self.serial_link_.open():
+            self.frame_parser_.reset()
+            self.loop_.add_reader(self.serial_link_.fileno(), self.updateSensorData)
+        else:
+            self.scheduleReconnect()
+
+    def getUWBDistance(self, tag_id = None) -> list:
+        if tag_id is None:
+            tag_id = self.range_table_.last_tag_id
+            if tag_id is None:
+                return None
+        return self.range_table_.getRanges(tag_id)
+
+    def getRangeTable(self) -> TagTable:
+        return self.range_table_
+
+    def getFrameQueue(self) -> AsyncDropQueue:
+        return self.frame_queue_
+
+    def getFrameStats(self) -> dict:
+        stats = self.frame_parser_.getStats()
+        stats['link'] = self.serial_link_.getStats()
+        return stats
+
+    def closeUWBPort(self):
+        # the reader runs on the loop thread, so no read can be in flight here
+        self.active_flag_ = False
+        if self.stall_timer_ is not None:
+            self.stall_timer_.cancel()
+        if self.serial_link_.connected:
+            self.loop_.remove_reader(self.serial_link_.fileno())
+        self.serial_link_.close()
+        print("UWB port closed complete")
+
+
+class AsyncRobotStatusManager():
+    """ Runs a RobotStatusManager on one asyncio event loop """
+
+    def __init__(self, status_manager):
+
+        self.status_manager_ = status_manager
+        self.stop_event_ = None
+        self.status_queue_ = None
+        self.tasks_ = list()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        manager = self.status_manager_
+        self.stop_event_ = asyncio.Event()
+        self.status_queue_ = AsyncDropQueue(64)
+        manager.status_queue_ = self.status_queue_
+
+        try:
+            # the serial ports open and the solver starts first, zenoh.open holds the GIL and stalls the loop
+            if manager.is_uwb_master:
+                uwb_manager = AsyncUWBManager(manager.getUWBPort(), manager.zenoh_arg_.baudrate,
+                                              readiness = manager.readiness_, frame_check = manager.zenoh_arg_.frame_check)
+                manager.createUWBSystem(uwb_manager)
+                manager.beginStartupBuffering()
+                manager.uwb_system.initAnchorPos()
+                self.tasks_.append(asyncio.create_task(self.localizeLoop()))
+                await self.waitFor(lambda: manager.readiness_.isSet('first_frame'), manager.STARTUP_FRAME_WAIT)
+            manager.zenoh_session_ = manager.openZenohSession()
+            manager.declarePublishers()
+            manager.declareQueryables()
+            manager.declareStatusSubscribers(self.loopCallback)
+            self.tasks_.append(asyncio.create_task(self.publishLoop()))
+            await self.waitFor(lambda: manager.getStartupBacklog() == 0, manager.STARTUP_DRAIN_TIME)
+            manager.endStartupBuffering()
+            if manager.fleet_table_ is not None:
+                manager.declareFleetSubscribers() # the table takes writes from zenoh threads directly
+                self.tasks_.append(asyncio.create_task(self.fleetLoop()))
+
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, self.stop_event_.set)
+            loop.add_reader(sys.stdin.fileno(), self.readCommand)
+            await self.stop_event_.wait()
+        finally:
+            await self.shutdown()
+
+    async def waitFor(self, condition, timeout):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            await asyncio.sleep(0.005)
+
+    def loopCallback(self, listener):
+        # zenoh calls back on its own threads, hop to the loop before touching state
+        loop = asyncio.get_running_loop()
+        def callback(sample):
+            loop.call_soon_threadsafe(listener, sample)
+        return callback
+
+    def readCommand(self):
+        cmd = sys.stdin.readline()
+        if cmd == '' or cmd.strip() == 'q':
+            self.stop_event_.set()
+
+    async def localizeLoop(self):
+        uwb_system = self.status_manager_.uwb_system
+        frame_queue = uwb_system.uwb_manager_.getFrameQueue()
+        time_out_count = 0
+        while True:
+            uwb_system.expireTags()
+            try:
+                tag_data, stamp = await asyncio.wait_for(frame_queue.pop(), uwb_system.FRAME_TIME_OUT)
+            except asyncio.TimeoutError:
+                time_out_count += 1
+                uwb_system.stats_.count('timeouts')
+                if time_out_count == uwb_system.TIME_OUT_COUNT:
+                    uwb_system.stats_.count('connection_lost')
+                    print(" UWB Master Connection Lost ") # the uwb manager reconnects, keep publishing
+                continue
+            if time_out_count >= uwb_system.TIME_OUT_COUNT:
+                print(" UWB Master Connection Restored ")
+            time_out_count = 0
+            uwb_system.readiness_.set('first_frame', stamp)
+            if not any(tag_data) == 0:
+                uwb_system.processMLE(tag_data, stamp)
+
+    async def publishLoop(self):
+        print("Robot Status Start Publish....")
+        try:
+            while True:
+                self.status_manager_.checkTimers()
+                try:
+                    item = await asyncio.wait_for(self.status_queue_.pop(), self.status_manager_.nextTimeout())
+                    self.status_manager_.handleStatusEvent(item)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.status_manager_.flushUWB()
+            print("Robot Status Publish end")
+
+    async def fleetLoop(self):
+        period = 1.0 / self.status_manager_.zenoh_arg_.fleet_rate
+        next_time = time.monotonic()
+        while True:
+            next_time += period
+            await asyncio.sleep(max(next_time - time.monotonic(), 0.0))
+            self.status_manager_.pubFleetState()
+
+    async def shutdown(self):
+        loop = asyncio.get_running_loop()
+        manager = self.status_manager_
+        loop.remove_reader(sys.stdin.fileno())
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        for task in self.tasks_:
+            task.cancel()
+        await asyncio.gather(*self.tasks_, return_exceptions=True)
+        self.tasks_.clear()
+
+        manager.undeclareStatusSubscribers()
+        manager.undeclareFleetSubscribers()
+        manager.undeclareQueryables()
+        if manager.uwb_system is not None:
+            manager.uwb_system.closeSystem()
+        manager.undeclarePublishers()
+        if manager.zenoh_session_ is not None:
+            manager.zenoh_session_.close()
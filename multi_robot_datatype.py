@@ -1,6 +1,6 @@
 from pycdr2 import IdlStruct
 from dataclasses import dataclass
-from pycdr2.types import int8, int32, uint32, uint8, float64, float32, sequence, array
+from pycdr2.types import int8, int16, int32, uint32, uint8, float64, float32, sequence, array
 from typing import List
 
 @dataclass
@@ -69,4 +69,58 @@ class PoseStamped(IdlStruct, typename="PoseStemped"):
     quat_x: float64
     quat_y: float64
     quat_z: float64
-    quat_w: float64
\ No newline at end of file
+    quat_w: float64
+
+@dataclass
+class UWBStampedBatch(IdlStruct, typename="UWBStampedBatch"):
+    stamp_sec: uint32
+    stamp_nsec: uint32
+    frame_id: str
+    tag_id: List[int32]
+    time_offset: List[float32] # second, fix time relative to stamp
+    position_x: List[float32]
+    position_y: List[float32]
+
+@dataclass
+class FleetState(IdlStruct, typename="FleetState"):
+    stamp_sec: uint32
+    stamp_nsec: uint32
+    robot_name: List[str]
+    battery_voltage: List[float32]
+    battery_percentage: List[float32]
+    position_x: List[float64]
+    position_y: List[float64]
+    tag_id: List[int32] # -1 before the first uwb_state
+    age: List[float32] # second since the last sample of the robot
+
+@dataclass
+class UWBStateStamped(IdlStruct, typename="UWBStateStamped"):
+    stamp_sec: uint32 # wall clock time the frame was received
+    stamp_nsec: uint32
+    frame_id: str
+    seq: uint32 # per topic, gaps mean lost samples
+    position_x: float64
+    position_y: float64
+    tag_id: int32
+    solve_latency: float32 # second, frame receipt -> solve
+    publish_latency: float32 # second, frame receipt -> put
+
+@dataclass
+class UWBDeltaState(IdlStruct, typename="UWBDeltaState"):
+    stamp_sec: uint32
+    stamp_nsec: uint32
+    seq: uint32 # per topic, gaps mean lost updates
+    keyframe_seq: uint32 # seq of the keyframe the deltas refer to, equal to seq on a keyframe
+    tag_id: List[uint8]
+    position: List[int32] # keyframe only, mm, x0 y0 x1 y1 ...
+    delta: List[int16] # updates only, mm against the keyframe position of each tag, x0 y0 x1 y1 ...
+
+@dataclass
+class UWBZoneEvent(IdlStruct, typename="UWBZoneEvent"):
+    stamp_sec: uint32
+    stamp_nsec: uint32
+    tag_id: int32
+    entered: uint8 # 1 entered the zone, 0 left it or its track expired inside
+    zone: str
+    position_x: float64
+    position_y: float64
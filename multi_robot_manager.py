@@ -1,22 +1,65 @@
 import argparse
-import curses
 import zenoh
 import json
-from dataclasses import dataclass
-from datetime import datetime
-from pycdr2 import IdlStruct
-from pycdr2.types import int8, int32, uint32, uint8, float64, float32, sequence, array
-from typing import List
 import threading
 import traceback
 import time
-from multi_robot_datatype import BatteryState, OverViewState, JointStates, UWBState
-from uwb_manager import UWBLocalizationSystem
+import numpy as np
+from block_queue import BlockQueue
+from readiness_events import ReadinessEvents
+from cdr_codec import UWBStateEncoder, UWBStateStampedEncoder, UWBStampedBatchEncoder, UWBDeltaEncoder, UWBZoneEventEncoder, OverViewStateEncoder, FleetStateEncoder, BatteryStateView, JointStatesView, decodeUWBState
+from fleet_table import FleetTable
+from uwb_history import PositionHistory, parseSelector
+from latency_stats import PipelineStats
+from uwb_publish_policy import PublishPolicy
+
+UWB_STATE_SIZE = 24 # CDR header, position_x, position_y, tag_id
+NEAR_RADIUS = 1.0 # meter, default radius of near=<tag> queries
+
+
+def getArgParser() -> argparse.ArgumentParser:
+    arg_parser = argparse.ArgumentParser(prog='robot-manager',
+                                            description='zenoh robot manager')
+    arg_parser.add_argument('-e', '--connect', type=str, metavar='ENDPOINT', action='append')
+    arg_parser.add_argument('-l', '--listen', type=str, metavar='ENDPOINT', action='append')
+    arg_parser.add_argument('-m', '--mode', type=str, default='client')
+    arg_parser.add_argument('-c', '--config', type=str, metavar='FILE')
+    arg_parser.add_argument('-robot', '--robot', type=str, default='turtlebot', choices=['turtlebot', 'spider'])
+    arg_parser.add_argument('-id', '--id', type=str, default='1')
+    arg_parser.add_argument('--pub-on-change', action='store_true', help='skip samples equal to the last published one')
+    arg_parser.add_argument('--lazy-decode', action='store_true', help='keep the latest raw battery/joint sample and decode fields on access')
+    arg_parser.add_argument('--batch-period', type=float, default=0.0, metavar='SECOND',
+                            help='publish fixes as one UWBStampedBatch per period on uwb_batch instead of one UWBState per fix')
+    arg_parser.add_argument('--fleet', action='store_true', help='aggregate every robot under the input prefix into one fleet_state')
+    arg_parser.add_argument('--fleet-rate', type=float, default=10.0, metavar='HZ')
+    arg_parser.add_argument('--input-prefix', type=str, default='rt')
+    arg_parser.add_argument('--stamped', action='store_true', help='publish UWBStateStamped with receive time, sequence and stage latencies on uwb_state_stamped')
+    arg_parser.add_argument('--stats-period', type=float, default=1.0, metavar='SECOND', help='pipeline stats on uwb_stats as json, 0 to disable')
+    arg_parser.add_argument('--history-size', type=int, default=1024, help='fixes kept per tag for history queries')
+    arg_parser.add_argument('--history-age', type=float, default=60.0, metavar='SECOND', help='history older than this is evicted')
+    arg_parser.add_argument('--frame-check', action='store_true', help='uwb frames start with 0x55 and carry a checksum at byte 14, drop those that do not')
+    arg_parser.add_argument('--async', dest='use_async', action='store_true', help='run on one asyncio event loop')
+    arg_parser.add_argument('-p', '--port', type=str, metavar='DEVICE', action='append', help='uwb serial port, one master per manager (uwb_ingest.py serves several)')
+    arg_parser.add_argument('-b', '--baudrate', type=int, default=115200)
+    arg_parser.add_argument('--position-bus', type=str, nargs='?', const='', default=None, metavar='PATH',
+                            help='also write tag positions to a shared-memory bus for local readers (default /dev/shm/uwb_position_bus)')
+    arg_parser.add_argument('--dead-band', type=float, default=0.0, metavar='METER', help='skip fixes that moved less than this since the last publish of the tag')
+    arg_parser.add_argument('--max-rate', type=float, default=0.0, metavar='HZ', help='publish each tag at most this often, the latest fix of an interval goes out when it ends, 0 for every fix')
+    arg_parser.add_argument('--min-rate', type=float, default=0.0, metavar='HZ', help='publish a tag at least this often while it has fixes, dead-band or not')
+    arg_parser.add_argument('--heartbeat', type=float, default=0.0, metavar='SECOND', help='republish every known tag this often, even without fixes')
+    arg_parser.add_argument('--delta', action='store_true', help='publish UWBDeltaState on uwb_delta: mm offsets against a periodic keyframe, with sequence numbers')
+    arg_parser.add_argument('--keyframe-period', type=float, default=5.0, metavar='SECOND')
+
+    return arg_parser
 
 
 class RobotStatusManager():
-    
-    def __init__(self, is_uwb_master = True):  
+
+    DELTA_COALESCE = 0.01 # second, longest a delta waits for more fixes while the status queue is busy
+    STARTUP_FRAME_WAIT = 0.2 # second, a streaming master sends its first frame well within this
+    STARTUP_DRAIN_TIME = 1.0 # second, longest the startup backlog is kept whole
+
+    def __init__(self, zenoh_arg, is_uwb_master = True):  
 
         """ private definition """
         self.zenoh_config_ = None
@@ -29,29 +72,47 @@ class RobotStatusManager():
         self.joint_state = None
         self.uwb_state = None
         self.is_uwb_master = is_uwb_master
+        self.status_queue_ = BlockQueue(64, drop_oldest = True) # fixes and subscriber updates to publish
+        self.publish_on_change_ = False
+        self.lazy_decode_ = False
+        self.last_payload_ = dict()
+        self.publishers_ = dict() # key -> declared zenoh publisher
+        self.uwb_state_encoder_ = UWBStateEncoder()
+        self.zone_event_encoder_ = UWBZoneEventEncoder()
+        self.uwb_batch_encoder_ = None
+        self.overview_encoder_ = OverViewStateEncoder()
+        self.batch_period_ = 0.0
+        self.batch_deadline_ = None
+        self.fleet_table_ = None # fleet mode only
+        self.fleet_encoder_ = FleetStateEncoder()
+        self.fleet_subs_ = list()
+        self.fleet_stop_event_ = threading.Event()
+        self.thread_pub_fleet = None
+        self.position_history_ = None
+        self.queryables_ = list()
+        self.overview_payload_ = None # last published overview, served to queries
+        self.stamped_ = False
+        self.uwb_stamped_encoder_ = None
+        self.stats_ = PipelineStats() # publish side, one writer thread per counter
+        self.stats_period_ = 0.0
+        self.stats_deadline_ = None
+        self.readiness_ = ReadinessEvents() # serial open, first frame / fix, zenoh up, first publish
+        self.startup_drop_policy_ = None # (status queue, frame queue) drop_oldest while buffering the startup
+        self.publish_policy_ = PublishPolicy() # publishes every fix unless configured
+        self.delta_encoder_ = None # delta mode only
+        self.delta_pending_ = dict() # tag id -> (x, y, fix) waiting for the next delta
+        self.delta_deadline_ = None
+        self.keyframe_period_ = 0.0
+        self.keyframe_deadline_ = None
+        self.uwb_system = None
 
         self.input_prefix_ = 'rt' #default setting
         """ public definition """
 
-        self.zenohInit()
-
+        self.zenohInit(zenoh_arg)
 
-    def setArgParser(self) -> argparse.ArgumentParser:
-        arg_parser = argparse.ArgumentParser(prog='robot-manager',
-                                                description='zenoh robot manager')
-        arg_parser.add_argument('-e', '--connect', type=str, metavar='ENDPOINT', action='append')
-        arg_parser.add_argument('-l', '--listen', type=str, metavar='ENDPOINT', action='append')
-        arg_parser.add_argument('-m', '--mode', type=str, default='client')
-        arg_parser.add_argument('-c', '--config', type=str, metavar='FILE')
-        arg_parser.add_argument('-robot', '--robot', type=str, default='turtlebot', choices=['turtlebot', 'spider'])
-        arg_parser.add_argument('-id', '--id', type=str, default='1')
 
-        return arg_parser
-        
-        
-    
-    def zenohInit(self):
-        zenoh_arg = self.setArgParser().parse_args()
+    def zenohInit(self, zenoh_arg):
         self.zenoh_config_ = zenoh.config_from_file(zenoh_arg.config) if zenoh_arg.config is not None else zenoh.Config()
         if zenoh_arg.mode is not None:
             self.zenoh_config_.insert_json5(zenoh.config.MODE_KEY, json.dumps(zenoh_arg.mode))
@@ -62,34 +123,371 @@ class RobotStatusManager():
 
         if zenoh_arg.robot == 'turtlebot':
             self.output_prefix_ = 'turtlebot' + zenoh_arg.id
+        else:
+            self.output_prefix_ = zenoh_arg.robot + zenoh_arg.id
+        self.publish_on_change_ = zenoh_arg.pub_on_change
+        self.lazy_decode_ = zenoh_arg.lazy_decode
+        self.zenoh_arg_ = zenoh_arg
+        self.batch_period_ = zenoh_arg.batch_period
+        self.uwb_batch_encoder_ = UWBStampedBatchEncoder(frame_id = self.output_prefix_)
+        self.uwb_stamped_encoder_ = UWBStateStampedEncoder(frame_id = self.output_prefix_)
+        self.stamped_ = zenoh_arg.stamped
+        self.stats_period_ = zenoh_arg.stats_period
+        self.uwb_state_key_ = 'rt/{}/uwb_state'.format(self.output_prefix_)
+        self.uwb_batch_key_ = 'rt/{}/uwb_batch'.format(self.output_prefix_)
+        self.uwb_stamped_key_ = 'rt/{}/uwb_state_stamped'.format(self.output_prefix_)
+        self.stats_key_ = 'rt/{}/uwb_stats'.format(self.output_prefix_)
+        self.uwb_delta_key_ = 'rt/{}/uwb_delta'.format(self.output_prefix_)
+        self.uwb_zone_key_ = 'rt/{}/uwb_zone_event'.format(self.output_prefix_)
+        self.overview_state_key_ = 'rt/{}/overview_state'.format(self.output_prefix_)
+        self.fleet_state_key_ = 'rt/fleet/fleet_state'
+        self.input_prefix_ = zenoh_arg.input_prefix
+        if zenoh_arg.fleet:
+            self.fleet_table_ = FleetTable()
+        self.position_history_ = PositionHistory(zenoh_arg.history_size, zenoh_arg.history_age)
+        self.publish_policy_ = PublishPolicy(zenoh_arg.dead_band, zenoh_arg.max_rate, zenoh_arg.min_rate, zenoh_arg.heartbeat)
+        if zenoh_arg.delta:
+            self.delta_encoder_ = UWBDeltaEncoder()
+            self.keyframe_period_ = zenoh_arg.keyframe_period
 
     
     def batteryStateListener(self, sample):
-        self.battery_state = BatteryState.deserialize(sample.payload)
+        if self.lazy_decode_:
+            self.battery_state = BatteryStateView(sample.payload)
+        else:
+            from multi_robot_datatype import BatteryState
+            self.battery_state = BatteryState.deserialize(sample.payload)
+        self.status_queue_.push(('battery', None))
         # print('[ voltage: {}, capacity: {}, percentage: {}]'.format(self.battery_state.voltage,
         #                                 self.battery_state.capacity, self.battery_state.percentage))
     
     def jointStateListener(self, sample):
-        self.joint_state = JointStates.deserialize(sample.payload)
+        if self.lazy_decode_:
+            self.joint_state = JointStatesView(sample.payload)
+        else:
+            from multi_robot_datatype import JointStates
+            self.joint_state = JointStates.deserialize(sample.payload)
+        self.status_queue_.push(('joint', None))
         # print('[name: {}, velocity: {}]'.format(self.joint_state.name, self.joint_state.velocity))
     
 
-    def getBatteryState(self) -> BatteryState:
+    def declareStatusSubscribers(self, wrap_callback = None):
+        # battery / joint state of this robot for the overview state, wrap_callback moves the listeners to another thread
+        if wrap_callback is None:
+            wrap_callback = lambda listener: listener
+        self.battery_state_sub_ = self.zenoh_session_.declare_subscriber(
+            '{}/battery_state'.format(self.input_prefix_), wrap_callback(self.batteryStateListener))
+        self.joint_state_sub_ = self.zenoh_session_.declare_subscriber(
+            '{}/joint_states'.format(self.input_prefix_), wrap_callback(self.jointStateListener))
+
+    def undeclareStatusSubscribers(self):
+        for subscriber in (self.battery_state_sub_, self.joint_state_sub_):
+            if subscriber is not None:
+                subscriber.undeclare()
+        self.battery_state_sub_ = None
+        self.joint_state_sub_ = None
+
+    def fleetBatteryStateListener(self, sample):
+        battery_state = BatteryStateView(sample.payload)
+        self.fleet_table_.updateBattery(self.getRobotName(sample), battery_state.voltage,
+                                        battery_state.capacity, battery_state.percentage)
+
+    def fleetJointStateListener(self, sample):
+        self.fleet_table_.updateJointState(self.getRobotName(sample), JointStatesView(sample.payload))
+
+    def fleetUWBStateListener(self, sample):
+        position_x, position_y, tag_id = decodeUWBState(sample.payload)
+        self.fleet_table_.updatePosition(self.getRobotName(sample), position_x, position_y, tag_id)
+
+    def getRobotName(self, sample) -> str:
+        # <input prefix>/<robot>/<topic>
+        return str(sample.key_expr).rsplit('/', 2)[-2]
+
+    def declareFleetSubscribers(self):
+        for topic, listener in (('battery_state', self.fleetBatteryStateListener),
+                                ('joint_states', self.fleetJointStateListener),
+                                ('uwb_state', self.fleetUWBStateListener)):
+            self.fleet_subs_.append(self.zenoh_session_.declare_subscriber(
+                '{}/*/{}'.format(self.input_prefix_, topic), listener))
+
+    def undeclareFleetSubscribers(self):
+        for subscriber in self.fleet_subs_:
+            subscriber.undeclare()
+        self.fleet_subs_.clear()
+
+    def getFleetTable(self) -> FleetTable:
+        return self.fleet_table_
+
+    def pubFleetState(self):
+        if len(self.fleet_table_):
+            self.putPayload(self.fleet_state_key_, self.fleet_encoder_.encode(self.fleet_table_.getSnapshot()))
+
+    def pubFleetStatus(self):
+        period = 1.0 / self.zenoh_arg_.fleet_rate
+        next_time = time.monotonic()
+        while True:
+            next_time += period
+            if self.fleet_stop_event_.wait(max(next_time - time.monotonic(), 0.0)):
+                break
+            self.pubFleetState()
+
+    def getBatteryState(self) -> 'BatteryState':
         if self.battery_state is not None:
             return self.battery_state
         
-    def getJointState(self) -> JointStates:
+    def getJointState(self) -> 'JointStates':
         if self.joint_state is not None:
             return self.joint_state
         
-    def pubUWBState(self):
-        self.zenoh_session_.put('rt/{}/uwb_state'.format(self.output_prefix_), self.generateUWBState().serialize())
+    def pubUWBState(self, tag_ids = None):
+        stamp = time.monotonic()
+        if tag_ids is None:
+            tag_ids = self.uwb_system.getTagIds()
+        for tag_id in tag_ids:
+            state = self.uwb_system.getTagPosition(tag_id, stamp)
+            if state is not None:
+                self.putPayload(self.uwb_state_key_, self.uwb_state_encoder_.encode(state[0], state[1], state[2]), tag_id)
+
+    def pubUWBStateStamped(self, fix):
+        publish_stamp = time.monotonic()
+        state = self.uwb_system.getTagPosition(fix.tag_id, publish_stamp)
+        if state is not None:
+            self.putPayload(self.uwb_stamped_key_, self.uwb_stamped_encoder_.encode(
+                state[0], state[1], state[2], fix.stamp, fix.solve_stamp, publish_stamp), fix.tag_id)
+
+    def recordPublish(self, fix):
+        publish_stamp = time.monotonic()
+        self.stats_.record('solve_to_publish', publish_stamp - fix.solve_stamp)
+        self.stats_.record('frame_to_publish', publish_stamp - fix.stamp)
+        self.markPublished(publish_stamp)
+
+    def markPublished(self, publish_stamp):
+        # time to first published fix, counted from process start
+        if self.readiness_.set('first_publish', publish_stamp):
+            print("UWB startup: {}".format(self.readiness_.format()))
+
+    def addUWBBatchFix(self, fix):
+        state = self.uwb_system.getTagPosition(fix.tag_id, fix.stamp)
+        if state is None:
+            return
+        if self.batch_deadline_ is None:
+            self.batch_deadline_ = time.monotonic() + self.batch_period_
+        self.uwb_batch_encoder_.addFix(fix.tag_id, state[0], state[1], fix.stamp)
+        if self.uwb_batch_encoder_.isFull():
+            self.pubUWBBatch()
+
+    def pubUWBBatch(self):
+        self.batch_deadline_ = None
+        if len(self.uwb_batch_encoder_):
+            publish_stamp = time.monotonic()
+            for stamp in self.uwb_batch_encoder_.fix_stamp_[:len(self.uwb_batch_encoder_)]:
+                self.stats_.record('frame_to_publish', publish_stamp - stamp)
+            self.putPayload(self.uwb_batch_key_, self.uwb_batch_encoder_.encode())
+            self.markPublished(publish_stamp)
+
+    def addUWBDelta(self, fix, position_x, position_y):
+        # fixes handled back to back go out as one UWBDeltaState once the status queue is idle
+        self.delta_pending_[fix.tag_id] = (position_x, position_y, fix)
+        if self.delta_deadline_ is None:
+            self.delta_deadline_ = time.monotonic() + self.DELTA_COALESCE
+
+    def pubUWBDelta(self):
+        self.delta_deadline_ = None
+        if not self.delta_pending_:
+            return
+        tag_ids = list(self.delta_pending_)
+        pending = list(self.delta_pending_.values())
+        payload = self.delta_encoder_.encodeDelta(tag_ids, [(position_x, position_y) for position_x, position_y, _ in pending])
+        if payload is None:
+            self.pubUWBKeyframe() # new tag or moved out of the int16 mm range, carries the pending fixes too
+        else:
+            self.delta_pending_.clear()
+            self.stats_.count('delta')
+            self.putPayload(self.uwb_delta_key_, payload)
+        for _, _, fix in pending:
+            self.recordPublish(fix)
+
+    def pubUWBKeyframe(self):
+        # every known tag in absolute mm, the base of the following deltas
+        self.keyframe_deadline_ = time.monotonic() + self.keyframe_period_
+        self.delta_pending_.clear()
+        self.delta_deadline_ = None
+        stamp = time.monotonic()
+        states = list()
+        for tag_id in self.uwb_system.getTagIds():
+            state = self.uwb_system.getTagPosition(tag_id, stamp)
+            if state is not None:
+                states.append(state)
+        if not states:
+            return
+        self.stats_.count('keyframe')
+        self.putPayload(self.uwb_delta_key_, self.delta_encoder_.encodeKeyframe(
+            [state[2] for state in states], [state[:2] for state in states]))
+        self.markPublished(stamp)
+
+    def pubZoneEvent(self, event):
+        print("UWB tag {} {} zone {}".format(event.tag_id, 'entered' if event.entered else 'left', event.zone))
+        self.putPayload(self.uwb_zone_key_, self.zone_event_encoder_.encode(event))
+
+    def pubHeartbeat(self):
+        if self.uwb_system is None:
+            return
+        if self.delta_encoder_ is not None:
+            self.pubUWBKeyframe()
+        else:
+            self.pubUWBState()
+
+    def flushUWB(self):
+        self.pubUWBBatch()
+        if self.delta_encoder_ is not None:
+            self.pubUWBDelta()
+
+    def nextTimeout(self):
+        # seconds until the next batch, delta, keyframe, held fix, heartbeat or stats publish is due, None when nothing is scheduled
+        deadlines = [deadline for deadline in (self.batch_deadline_, self.stats_deadline_, self.delta_deadline_,
+                                               self.keyframe_deadline_, self.publish_policy_.getPendingDeadline(),
+                                               self.publish_policy_.getHeartbeatDeadline())
+                     if deadline is not None]
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.monotonic(), 0.0)
+
+    def checkTimers(self):
+        now = time.monotonic()
+        for fix, position_x, position_y in self.publish_policy_.releaseDue(now):
+            self.pubUWBFix(fix, position_x, position_y)
+        if self.batch_deadline_ is not None and now >= self.batch_deadline_:
+            self.pubUWBBatch()
+        if self.delta_pending_ and (now >= self.delta_deadline_ or self.status_queue_.size() == 0):
+            self.pubUWBDelta()
+        if self.keyframe_deadline_ is not None and now >= self.keyframe_deadline_:
+            self.pubUWBKeyframe()
+        if self.publish_policy_.heartbeatDue(now):
+            self.pubHeartbeat()
+        if self.stats_period_ > 0 and (self.stats_deadline_ is None or now >= self.stats_deadline_):
+            self.stats_deadline_ = now + self.stats_period_
+            self.pubStats()
+
+    def getStats(self) -> dict:
+        stats = {'publish': self.stats_.getStats(),
+                 'status_queue_dropped': self.status_queue_.dropped_count,
+                 'startup': self.readiness_.getTimes(),
+                 'policy': self.getPolicyStats()}
+        if self.uwb_system is not None:
+            stats['uwb'] = self.uwb_system.getStats()
+        return stats
+
+    def getPolicyStats(self) -> dict:
+        # bytes saved against one UWBState per fix, the stream without dead-band, rate limit or delta frames
+        counters = self.stats_.counters_
+        sent_bytes = sum(counters.get(key + ':bytes', 0) for key in
+                         (self.uwb_state_key_, self.uwb_batch_key_, self.uwb_stamped_key_, self.uwb_delta_key_))
+        baseline_bytes = counters.get('fix', 0) * UWB_STATE_SIZE
+        stats = self.publish_policy_.getStats()
+        stats.update({'fixes': counters.get('fix', 0),
+                      'keyframes': counters.get('keyframe', 0),
+                      'deltas': counters.get('delta', 0),
+                      'sent_bytes': sent_bytes,
+                      'bytes_saved': baseline_bytes - sent_bytes})
+        return stats
+
+    def pubStats(self):
+        self.putPayload(self.stats_key_, json.dumps(self.getStats()).encode())
     
     def pubOverViewState(self):
-        self.zenoh_session_.put('rt/{}/overview_state'.format(self.output_prefix_), self.generateOverViewState().serialize())
+        self.overview_payload_ = self.overview_encoder_.encode(self.battery_state, self.joint_state)
+        self.putPayload(self.overview_state_key_, self.overview_payload_)
+
+    def declareQueryables(self):
+        self.queryables_.append(self.zenoh_session_.declare_queryable(self.uwb_state_key_, self.uwbStateQueryHandler))
+        self.queryables_.append(self.zenoh_session_.declare_queryable(self.overview_state_key_, self.overviewStateQueryHandler))
+
+    def undeclareQueryables(self):
+        for queryable in self.queryables_:
+            queryable.undeclare()
+        self.queryables_.clear()
+
+    def uwbStateQueryHandler(self, query):
+        # one UWBStampedBatch per query, zenoh consolidates replies on the same key into one
+        # no parameters: latest position per tag, _time=[t0..t1]: the history, tag=<id> filters
+        # near=<id>;radius=<m>: tags around tag <id> nearest first, zone=<name>: tags inside the zone
+        try:
+            selector = parseSelector(query.parameters)
+        except ValueError as e:
+            print("UWB state query {} rejected: {}".format(query.selector, e))
+            return
+        if '_time' in selector:
+            query.reply(zenoh.Sample(self.uwb_state_key_, self.encodeUWBHistory(selector.get('tag'), *selector['_time'])))
+            return
+        if self.uwb_system is None:
+            return
+        stamp = time.monotonic()
+        spatial_index = self.uwb_system.getSpatialIndex()
+        if 'near' in selector:
+            neighbors = spatial_index.getNeighbors(selector['near'], selector.get('radius', NEAR_RADIUS))
+            tag_ids = [tag_id for tag_id, _ in neighbors] if neighbors is not None else []
+        elif 'zone' in selector:
+            tag_ids = spatial_index.getZoneTags(selector['zone']) or []
+        else:
+            tag_ids = [selector['tag']] if 'tag' in selector else self.uwb_system.getTagIds()
+        query.reply(zenoh.Sample(self.uwb_state_key_, self.encodeUWBLatest(tag_ids, stamp)))
+
+    def overviewStateQueryHandler(self, query):
+        overview_payload = self.overview_payload_
+        if overview_payload is not None:
+            query.reply(zenoh.Sample(self.overview_state_key_, overview_payload))
 
+    def encodeUWBLatest(self, tag_ids, stamp = None) -> bytes:
+        # positions extrapolated to stamp, in the order of tag_ids, tags without a recent fix are left out
+        if stamp is None:
+            stamp = time.monotonic()
+        states = [state for state in (self.uwb_system.getTagPosition(tag_id, stamp) for tag_id in tag_ids) if state is not None]
+        positions = np.array([state[:2] for state in states]).reshape(-1, 2)
+        return UWBStampedBatchEncoder(self.output_prefix_).encodeArrays(
+            time.time(), [state[2] for state in states], np.zeros(len(states)), positions[:, 0], positions[:, 1])
 
-    def generateOverViewState(self) -> OverViewState:
+    def encodeUWBHistory(self, tag_id = None, start = None, end = None) -> bytes:
+        self.position_history_.evict()
+        tag_ids = [tag_id] if tag_id is not None else self.position_history_.getTagIds()
+        wall_time = time.time()
+        rows = [self.position_history_.query(tag_id, start, end) for tag_id in tag_ids]
+        stamps = np.concatenate([row[0] for row in rows]) if rows else np.zeros(0)
+        positions = np.concatenate([row[1] for row in rows]) if rows else np.zeros((0, 2))
+        history_tag_ids = np.repeat(tag_ids, [len(row[0]) for row in rows])
+        return UWBStampedBatchEncoder(self.output_prefix_).encodeArrays(
+            wall_time, history_tag_ids, stamps - wall_time, positions[:, 0], positions[:, 1])
+
+    def declarePublishers(self):
+        keys = [self.uwb_state_key_, self.uwb_batch_key_, self.uwb_stamped_key_, self.uwb_delta_key_, self.uwb_zone_key_,
+                self.overview_state_key_, self.stats_key_]
+        if self.fleet_table_ is not None:
+            keys.append(self.fleet_state_key_)
+        for key in keys:
+            self.publishers_[key] = self.zenoh_session_.declare_publisher(key)
+
+    def undeclarePublishers(self):
+        for publisher in self.publishers_.values():
+            publisher.undeclare()
+        self.publishers_.clear()
+
+    def putPayload(self, key, payload, change_key = None):
+        if self.publish_on_change_:
+            if self.last_payload_.get((key, change_key)) == payload:
+                return False
+            self.last_payload_[(key, change_key)] = payload
+        self.stats_.count(key) # counters are per key, so each has a single writer thread
+        self.stats_.count(key + ':bytes', len(payload))
+        publisher = self.publishers_.get(key)
+        if publisher is not None:
+            publisher.put(payload)
+        else:
+            self.zenoh_session_.put(key, payload)
+        return True
+
+
+    def generateOverViewState(self) -> 'OverViewState':
+        from pycdr2.types import float32
+        from multi_robot_datatype import OverViewState
         overview_state = OverViewState(battery_voltage = float32(self.battery_state.voltage),
                                             battery_percentage = float32(self.battery_state.percentage),
                                             battery_capacity = float32(self.battery_state.capacity),
@@ -98,56 +496,165 @@ class RobotStatusManager():
         print(overview_state)
         return overview_state
     
-    def generateUWBState(self):
-        state = self.uwb_system.getTagPosition()
-        uwb_state = UWBState(position_x = state[0],
-                             position_y = state[1],
-                             tag_id = state[2])
-        return uwb_state
+    def generateUWBState(self, tag_ids = None) -> list:
+        from multi_robot_datatype import UWBState
+        stamp = time.monotonic()
+        uwb_states = list()
+        if tag_ids is None:
+            tag_ids = self.uwb_system.getTagIds()
+        for tag_id in tag_ids:
+            state = self.uwb_system.getTagPosition(tag_id, stamp)
+            if state is None:
+                continue
+            uwb_states.append(UWBState(position_x = state[0],
+                                       position_y = state[1],
+                                       tag_id = state[2]))
+        return uwb_states
 
     def pubRobotStatus(self):
         print("Robot Status Start Publish....")
         self.update_thread_enable_ = True
         while self.update_thread_enable_:
-            if self.battery_state is not None and self.joint_state is not None:
-                self.pubOverViewState()
-            if self.is_uwb_master:
-                self.pubUWBState()
-            time.sleep(0.01)
+            self.checkTimers()
+            timeout = self.nextTimeout()
+            item = self.status_queue_.pop(timeout = 1.0 if timeout is None else timeout)
+            if item is not None:
+                self.handleStatusEvent(item)
+        self.flushUWB()
         print("Robot Status Publish end")
+
+    def pubUWBFix(self, fix, position_x, position_y):
+        # one fix that passed the publish policy, right away or once its max-rate interval ended
+        if self.delta_encoder_ is not None:
+            self.addUWBDelta(fix, position_x, position_y)
+            return
+        if self.batch_period_ > 0:
+            self.addUWBBatchFix(fix)
+            return
+        if self.stamped_:
+            self.pubUWBStateStamped(fix)
+        else:
+            self.pubUWBState([fix.tag_id])
+        self.recordPublish(fix)
+
+    def handleStatusEvent(self, item):
+        event, data = item
+        if event == 'fix':
+            if not self.is_uwb_master:
+                return
+            self.position_history_.add(data.tag_id, data.position_x, data.position_y,
+                                       time.time() - (time.monotonic() - data.stamp))
+            self.stats_.count('fix')
+            state = self.uwb_system.getTagPosition(data.tag_id, data.stamp)
+            if state is not None and self.publish_policy_.check(data.tag_id, state[0], state[1], fix = data):
+                self.pubUWBFix(data, state[0], state[1])
+        elif event == 'zone':
+            self.pubZoneEvent(data)
+        elif self.battery_state is not None and self.joint_state is not None:
+            self.pubOverViewState()
             
 
-    def activeStatusManager(self):
+    def openZenohSession(self):
         zenoh.init_logger()
         print("Initial Zenoh...")
+        zenoh_session = zenoh.open(self.zenoh_config_)
+        self.readiness_.set('zenoh_up')
+        return zenoh_session
+
+    def getUWBPort(self) -> str:
+        return self.zenoh_arg_.port[0] if self.zenoh_arg_.port else '/dev/ttyUSB0'
+
+    def createUWBSystem(self, uwb_manager = None):
+        # the solver stack (serial, numpy linalg, geometry grid) only loads on the uwb master
+        from uwb_manager import UWBLocalizationSystem, UWBManager
+        if uwb_manager is None:
+            uwb_manager = UWBManager(self.getUWBPort(), self.zenoh_arg_.baudrate, readiness = self.readiness_,
+                                     frame_check = self.zenoh_arg_.frame_check)
+        self.uwb_system = UWBLocalizationSystem(uwb_manager = uwb_manager, readiness = self.readiness_)
+        self.uwb_system.setFixQueue(self.status_queue_)
+        if self.zenoh_arg_.position_bus is not None:
+            self.uwb_system.openPositionBus(self.zenoh_arg_.position_bus or None)
+
+    def beginStartupBuffering(self):
+        # zenoh.open holds the GIL for its whole run (~0.7 s), the serial bytes of that time wait in the
+        # kernel and arrive as one burst afterwards, so nothing is dropped until the backlog is worked off
+        frame_queue = self.uwb_system.uwb_manager_.getFrameQueue() if self.uwb_system is not None else None
+        self.startup_drop_policy_ = (self.status_queue_.setDropOldest(False),
+                                     frame_queue.setDropOldest(False) if frame_queue is not None else None)
+
+    def getStartupBacklog(self) -> int:
+        backlog = self.status_queue_.size()
+        if self.uwb_system is not None:
+            backlog += self.uwb_system.uwb_manager_.getFrameQueue().size()
+        return backlog
+
+    def endStartupBuffering(self):
+        if self.startup_drop_policy_ is None:
+            return
+        status_drop, frame_drop = self.startup_drop_policy_
+        self.startup_drop_policy_ = None
+        self.status_queue_.setDropOldest(status_drop)
+        if frame_drop is not None:
+            self.uwb_system.uwb_manager_.getFrameQueue().setDropOldest(frame_drop)
+
+    def activeStatusManager(self):
+        # serial port, reader and solver come up first: zenoh.open would block them anyway
         if self.is_uwb_master:
-            self.uwb_system = UWBLocalizationSystem()
+            self.createUWBSystem()
+            self.beginStartupBuffering()
             self.uwb_system.startLocalizeTag()
+            self.readiness_.wait('first_frame', self.STARTUP_FRAME_WAIT)
+        self.zenoh_session_ = self.openZenohSession()
 
         self.update_thread_enable = True
-        self.zenoh_session_ = zenoh.open(self.zenoh_config_)
-        # self.battery_state_sub_ = self.zenoh_session_.declare_subscriber('{}/battery_state'.format(self.input_prefix_), self.batteryStateListener)
-        # self.joint_state_sub_ = self.zenoh_session_.declare_subscriber('{}/joint_states'.format(self.input_prefix_), self.jointStateListener)
-        time.sleep(1) # wait for uwb system poll data
+        self.declarePublishers()
+        self.declareQueryables()
+        self.declareStatusSubscribers()
+        if self.fleet_table_ is not None:
+            self.declareFleetSubscribers()
+            self.thread_pub_fleet = threading.Thread(target=self.pubFleetStatus, daemon=True)
+            self.thread_pub_fleet.start()
         self.thread_pub_status = threading.Thread(
             target=self.pubRobotStatus,
             daemon= True
         )
         self.thread_pub_status.start()
+        deadline = time.monotonic() + self.STARTUP_DRAIN_TIME
+        while self.getStartupBacklog() > 0 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.endStartupBuffering()
 
 
     def closeStatusManager(self):
         if self.update_thread_enable_:
             self.update_thread_enable_ = False
-        # self.battery_state_sub_.undeclare()
-        # self.joint_state_sub_.undeclare()
-        self.uwb_system.closeSystem()
+        self.status_queue_.releaseAllCV()
+        self.thread_pub_status.join()
+        if self.thread_pub_fleet is not None:
+            self.fleet_stop_event_.set()
+            self.thread_pub_fleet.join()
+        self.undeclareFleetSubscribers()
+        self.undeclareQueryables()
+        self.undeclareStatusSubscribers()
+        if self.uwb_system is not None:
+            self.uwb_system.closeSystem()
+        self.undeclarePublishers()
         self.zenoh_session_.close()
     
 
 if __name__ == "__main__":
 
-    manager = RobotStatusManager()
+    arg_parser = getArgParser()
+    zenoh_arg = arg_parser.parse_args()
+    if zenoh_arg.port is not None and len(zenoh_arg.port) > 1:
+        # tag ids of two anchor networks would share one tag table and solver
+        arg_parser.error("one uwb master per manager, run uwb_ingest.py {} for several".format(' '.join(zenoh_arg.port)))
+    manager = RobotStatusManager(zenoh_arg)
+    if manager.zenoh_arg_.use_async:
+        import asyncio
+        from multi_robot_async import AsyncRobotStatusManager
+        asyncio.run(AsyncRobotStatusManager(manager).run())
+        raise SystemExit(0)
     manager.activeStatusManager()
 
     while True:
@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+
+READINESS_EVENTS = ('serial_open', 'first_frame', 'first_fix', 'zenoh_up', 'first_publish')
+
+
+def processAge() -> float:
+    # seconds since the process was started, interpreter startup and imports included; 0 without /proc
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        return max(time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+class ReadinessEvents():
+    """ Startup milestones as events, each stamped once relative to process start """
+
+    def __init__(self, names = READINESS_EVENTS, start_stamp = None):
+
+        self.start_stamp = start_stamp if start_stamp is not None else time.monotonic() - processAge()
+        self.names_ = tuple(names)
+        self.events_ = {name: threading.Event() for name in self.names_}
+        self.stamps_ = dict() # name -> time.monotonic() when it was first set
+        self.lock_ = threading.Lock()
+
+    def set(self, name, stamp = None) -> bool:
+        # first call wins, True when this call marked the event; cheap enough for every frame
+        event = self.events_[name]
+        if event.is_set():
+            return False
+        with self.lock_:
+            if event.is_set():
+                return False
+            self.stamps_[name] = stamp if stamp is not None else time.monotonic()
+            event.set()
+        return True
+
+    def isSet(self, name) -> bool:
+        return self.events_[name].is_set()
+
+    def wait(self, name, timeout = None) -> bool:
+        return self.events_[name].wait(timeout)
+
+    def getElapsed(self, name) -> float:
+        # seconds from process start, None while the event is not set
+        stamp = self.stamps_.get(name)
+        return stamp - self.start_stamp if stamp is not None else None
+
+    def getTimes(self) -> dict:
+        return {name: round(self.getElapsed(name), 4) for name in self.names_ if name in self.stamps_}
+
+    def format(self) -> str:
+        return ", ".join("{} {:.3f} s".format(name, elapsed) for name, elapsed in self.getTimes().items())
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import pytest
+
+# the modules live in the repository root, not in a package
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+# earlier tests leave zenoh runtime threads behind, an ingest worker forked next to them can hang on their locks
+multiprocessing.set_start_method('forkserver', force = True)
+
+from multi_robot_manager import RobotStatusManager, getArgParser
+from uwb_manager import DEFAULT_ANCHOR_POS, UWBLocalizationSystem, UWBManager
+from uwb_simulator import SimulatedSerialPort, SimulatedTag, UWBSimulator, staticTrajectory
+
+
+def makePeerManager(port, *args, is_uwb_master = True) -> RobotStatusManager:
+    # zenoh peer listening on loopback only, no multicast scouting between test runs
+    manager = RobotStatusManager(getArgParser().parse_args(['-m', 'peer', '-l', 'tcp/127.0.0.1:{}'.format(port)] +
+                                                           list(args)), is_uwb_master = is_uwb_master)
+    manager.zenoh_config_.insert_json5('scouting/multicast/enabled', 'false')
+    return manager
+
+
+def makeSimulatedSystem(tag_pos = None, rate = 20.0, seed = None, duration = None) -> UWBLocalizationSystem:
+    # uwb system on the default anchors fed by a simulated serial port, tag_pos: tag id -> static (x, y)
+    tags = [SimulatedTag(tag_id, staticTrajectory(*position)) for tag_id, position in (tag_pos or {}).items()]
+    serial_port = SimulatedSerialPort(UWBSimulator(DEFAULT_ANCHOR_POS, tags, rate, seed = seed), duration)
+    uwb_system = UWBLocalizationSystem(uwb_manager = UWBManager(serial_port = serial_port), site_config = None)
+    uwb_system.verbose = False
+    return uwb_system
+
+
+def runScript(script, *args, cwd = None, timeout = 120) -> subprocess.CompletedProcess:
+    # a repository script's __main__ in a fresh interpreter, cwd decides which ./config it sees
+    return subprocess.run([sys.executable, os.path.join(REPO_PATH, script)] + [str(arg) for arg in args],
+                          cwd = cwd, capture_output = True, text = True, timeout = timeout)
+
+
+@pytest.fixture(scope = 'session')
+def run_script():
+    return runScript
+
+
+@pytest.fixture(scope = 'session')
+def peer_manager():
+    return makePeerManager
+
+
+@pytest.fixture(scope = 'session')
+def simulated_system():
+    return makeSimulatedSystem
+
+
+@pytest.fixture
+def uwb_system():
+    # solver stack on the default anchors with no reader thread, tests call processMLE directly
+    uwb_system = makeSimulatedSystem(duration = 0)
+    uwb_system.initAnchorPos()
+    return uwb_system
@@ -0,0 +1,44 @@
+import threading
+import time
+from block_queue import BlockQueue
+
+
+def test_drop_oldest_keeps_the_newest_items():
+    queue = BlockQueue(4, drop_oldest = True)
+    for item in range(10):
+        assert queue.push(item)
+    assert queue.dropped_count == 6
+    delivered = queue.popAll(timeout = 0)
+    assert delivered == [6, 7, 8, 9]
+    # every push is either delivered or counted
+    for item in range(7):
+        queue.push(item)
+    delivered += queue.popAll(timeout = 0)
+    assert len(delivered) + queue.dropped_count == 17 and queue.dropped_count == 9
+
+
+def test_blocking_push_counts_a_timeout_as_a_drop():
+    queue = BlockQueue(2)
+    assert queue.push(1) and queue.push(2)
+    start = time.monotonic()
+    assert not queue.push(3, timeout = 0.05)
+    assert time.monotonic() - start >= 0.05
+    assert queue.dropped_count == 1
+    assert queue.pop() == 1
+    assert queue.push(3, timeout = 0)
+    assert queue.popAll() == [2, 3]
+
+
+def test_release_wakes_waiters_and_drains():
+    queue = BlockQueue(1)
+    queue.push('last')
+    results = list()
+    pusher = threading.Thread(target = lambda: results.append(queue.push('blocked')))
+    pusher.start()
+    time.sleep(0.05)
+    queue.releaseAllCV()
+    pusher.join(1.0)
+    assert results == [False] and queue.isReleased()
+    # the consumer still gets what was queued, then None instead of blocking
+    assert queue.pop() == 'last'
+    assert queue.pop() is None
@@ -0,0 +1,55 @@
+import time
+import pytest
+from cdr_codec import FleetStateEncoder
+from fleet_table import FleetTable
+from multi_robot_datatype import BatteryState, FleetState, JointStates, UWBState
+
+BATTERY_STATE = BatteryState(1, 2, 'battery', 12.1, 25.0, -1.2, 1.5, 1.8, 1.8, 0.8, 2, 1, 3, True)
+JOINT_STATES = JointStates(1, 2, 'joint', ['left', 'right'], [0.0, 0.0], [0.5, -0.5], [0.0, 0.0])
+
+
+def test_rows_follow_first_sight():
+    fleet_table = FleetTable(max_robot_num = 2)
+    fleet_table.updatePosition('tb2', -2.0, 1.0, 3, stamp = 10.0)
+    fleet_table.updateBattery('tb1', 12.0, 1.8, 0.5, stamp = 10.5)
+    fleet_table.updateBattery('tb2', 11.5, 1.8, 0.25, stamp = 11.0)
+    snapshot = fleet_table.getSnapshot(stamp = 12.0)
+    assert snapshot['robot_name'] == ['tb2', 'tb1']
+    assert snapshot['tag_id'].tolist() == [3, -1] # -1 before the first uwb_state
+    assert snapshot['position'].tolist() == [[-2.0, 1.0], [0.0, 0.0]]
+    assert snapshot['battery'][:, 2].tolist() == [0.25, 0.5]
+    assert snapshot['age'].tolist() == [1.0, 1.5]
+    with pytest.raises(IndexError):
+        fleet_table.updateBattery('tb3', 12.0, 1.8, 0.5)
+
+    payload = FleetStateEncoder().encode(snapshot)
+    fleet_state = FleetState.deserialize(payload)
+    assert fleet_state.serialize() == payload
+    assert list(fleet_state.robot_name) == ['tb2', 'tb1'] and list(fleet_state.tag_id) == [3, -1]
+
+
+def test_fleet_mode_aggregates_wildcard_topics(peer_manager):
+    manager = peer_manager(17450, '--fleet', '--fleet-rate', '20', '--stats-period', '0', is_uwb_master = False)
+    manager.activeStatusManager()
+    fleet_states = list()
+    subscriber = manager.zenoh_session_.declare_subscriber(
+        manager.fleet_state_key_, lambda sample: fleet_states.append(FleetState.deserialize(sample.payload)))
+    try:
+        for robot_id in range(5):
+            manager.zenoh_session_.put('rt/tb{}/battery_state'.format(robot_id), BATTERY_STATE.serialize())
+            manager.zenoh_session_.put('rt/tb{}/uwb_state'.format(robot_id), UWBState(-2.0, 0.5 * robot_id, robot_id).serialize())
+        manager.zenoh_session_.put('rt/tb0/joint_states', JOINT_STATES.serialize())
+        deadline = time.monotonic() + 3.0
+        while time.monotonic() < deadline and (not fleet_states or len(fleet_states[-1].robot_name) < 5 or
+                                               list(fleet_states[-1].tag_id) != list(range(5))):
+            time.sleep(0.02)
+    finally:
+        subscriber.undeclare()
+        manager.closeStatusManager()
+
+    fleet_state = fleet_states[-1]
+    assert sorted(fleet_state.robot_name) == ['tb{}'.format(robot_id) for robot_id in range(5)]
+    for name, tag_id, position_y, voltage in zip(fleet_state.robot_name, fleet_state.tag_id, fleet_state.position_y,
+                                                 fleet_state.battery_voltage):
+        assert tag_id == int(name[2:]) and position_y == 0.5 * tag_id and abs(voltage - 12.1) < 1e-5
+    assert manager.getFleetTable().getJointState('tb0').name == ['left', 'right']
@@ -0,0 +1,19 @@
+import numpy as np
+from latency_stats import LatencyHistogram
+
+
+def test_percentiles_within_bucket_resolution():
+    # every value from 64 us to 10 s comes back within ~3 % (bucket width over the bucket start)
+    for value_us in np.unique(np.geomspace(64, 1e7, 2000).astype(np.int64)):
+        histogram = LatencyHistogram()
+        histogram.record(value_us * 1e-6)
+        reported = histogram.percentile(50) * 1e6
+        assert abs(reported - value_us) <= 0.032 * value_us
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for value_us in range(64):
+        histogram.record(value_us * 1e-6)
+    assert histogram.percentile(100) * 1e6 == 63.0
+    assert histogram.percentile(50) * 1e6 == 31.0
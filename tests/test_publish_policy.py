@@ -0,0 +1,52 @@
+import threading
+import time
+from uwb_publish_policy import PublishPolicy
+
+
+def test_rate_limit_publishes_the_latest_fix_when_the_interval_ends():
+    policy = PublishPolicy(max_rate = 10.0)
+    assert policy.check(1, 0.0, 0.0, now = 0.0, fix = 'a')
+    assert not policy.check(1, 0.1, 0.0, now = 0.05, fix = 'b')
+    assert not policy.check(1, 0.2, 0.0, now = 0.08, fix = 'c') # supersedes b
+    assert policy.getPendingDeadline() == 0.1
+    assert policy.releaseDue(now = 0.09) == []
+    assert policy.releaseDue(now = 0.1) == [('c', 0.2, 0.0)]
+    assert policy.getPendingDeadline() is None
+    assert policy.getStats()['published'] == 2 and policy.getStats()['suppressed_rate'] == 1
+    # the released fix opened a new interval
+    assert not policy.check(1, 0.3, 0.0, now = 0.15, fix = 'd')
+    assert policy.getPendingDeadline() == 0.2
+
+
+def test_held_fix_still_honours_the_dead_band():
+    policy = PublishPolicy(dead_band = 0.05, max_rate = 10.0)
+    assert policy.check(2, 1.0, 1.0, now = 0.0)
+    assert not policy.check(2, 1.01, 1.0, now = 0.05)
+    assert policy.releaseDue(now = 0.1) == []
+    assert policy.getStats()['suppressed_dead_band'] == 1
+
+
+def test_delta_path_records_publish_latency(peer_manager, simulated_system):
+    manager = peer_manager(17449, '--delta', '--max-rate', '5', '--stats-period', '0')
+    manager.zenoh_session_ = manager.openZenohSession()
+    manager.declarePublishers()
+    manager.uwb_system = simulated_system({tag_id: (-2.0, 0.5 * tag_id) for tag_id in (1, 2, 3)}, seed = 2)
+    manager.uwb_system.setFixQueue(manager.status_queue_)
+    manager.uwb_system.startLocalizeTag()
+    publish_thread = threading.Thread(target = manager.pubRobotStatus)
+    publish_thread.start()
+    time.sleep(1.5)
+    manager.uwb_system.closeSystem()
+    time.sleep(0.3) # held fixes go out once their interval ends
+    manager.update_thread_enable_ = False
+    manager.status_queue_.releaseAllCV()
+    publish_thread.join()
+    manager.undeclarePublishers()
+    manager.zenoh_session_.close()
+
+    policy = manager.getPolicyStats()
+    latency = manager.stats_.getStats()['latency']['frame_to_publish']
+    assert policy['fixes'] > 20
+    assert policy['published'] + policy['suppressed_rate'] + policy['suppressed_dead_band'] == policy['fixes']
+    assert policy['suppressed_rate'] > 0
+    assert latency['count'] == policy['published']
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import time
+from block_queue import BlockQueue
+from multi_robot_async import AsyncDropQueue
+
+
+def test_block_queue_keeps_startup_burst():
+    # while buffering, a burst larger than the queue waits for the consumer instead of dropping
+    queue = BlockQueue(8, drop_oldest = True)
+    assert queue.setDropOldest(False) is True
+    popped = list()
+
+    def consume():
+        time.sleep(0.1) # consumer starts late, like the publisher behind zenoh.open
+        while len(popped) < 100:
+            popped.extend(queue.popAll(timeout = 1.0))
+
+    consumer = threading.Thread(target = consume)
+    consumer.start()
+    for item in range(100):
+        assert queue.push(item, timeout = 2.0)
+    consumer.join()
+    assert popped == list(range(100))
+    assert queue.dropped_count == 0
+
+    assert queue.setDropOldest(True) is False
+    for item in range(10):
+        queue.push(item)
+    assert queue.dropped_count == 2
+
+
+def test_async_drop_queue_keeps_startup_burst():
+    async def run():
+        queue = AsyncDropQueue(8)
+        assert queue.setDropOldest(False) is True
+        for item in range(100):
+            queue.push(item)
+        assert queue.size() == 100 and queue.dropped_count == 0
+        queue.setDropOldest(True)
+        queue.push(100)
+        return queue.dropped_count
+
+    assert asyncio.run(run()) == 1
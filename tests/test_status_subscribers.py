@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+import pytest
+from multi_robot_async import AsyncRobotStatusManager
+from multi_robot_datatype import BatteryState, JointStates, OverViewState
+from cdr_codec import BatteryStateView, JointStatesView
+
+BATTERY_STATE = BatteryState(1, 2, 'battery', 12.1, 25.0, -1.2, 1.5, 1.8, 1.8, 0.8, 2, 1, 3, True)
+JOINT_STATES = JointStates(1, 2, 'joint', ['left', 'right'], [0.0, 0.0], [0.5, -0.5], [0.0, 0.0])
+
+
+@pytest.fixture
+def manager(peer_manager):
+    return peer_manager(17448, '--lazy-decode', '--stats-period', '0', is_uwb_master = False)
+
+
+def waitFor(condition, timeout = 3.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_lazy_decode_feeds_overview_state(manager):
+    manager.activeStatusManager()
+    try:
+        assert manager.battery_state_sub_ is not None and manager.joint_state_sub_ is not None
+        manager.zenoh_session_.put('rt/battery_state', BATTERY_STATE.serialize())
+        manager.zenoh_session_.put('rt/joint_states', JOINT_STATES.serialize())
+        assert waitFor(lambda: manager.overview_payload_ is not None)
+        assert isinstance(manager.battery_state, BatteryStateView)
+        assert isinstance(manager.joint_state, JointStatesView)
+        overview_state = OverViewState.deserialize(manager.overview_payload_)
+        assert abs(overview_state.battery_voltage - 12.1) < 1e-5
+        assert list(overview_state.joint_name) == ['left', 'right']
+    finally:
+        manager.closeStatusManager()
+    assert manager.battery_state_sub_ is None
+
+
+def test_async_listeners_run_on_the_loop(manager):
+    listener_threads = list()
+    battery_listener = manager.batteryStateListener
+    def recordThread(sample):
+        listener_threads.append(threading.current_thread())
+        battery_listener(sample)
+    manager.batteryStateListener = recordThread
+
+    async def run():
+        manager.zenoh_session_ = manager.openZenohSession()
+        manager.declareStatusSubscribers(AsyncRobotStatusManager(manager).loopCallback)
+        manager.zenoh_session_.put('rt/battery_state', BATTERY_STATE.serialize())
+        deadline = time.monotonic() + 3.0
+        while not listener_threads and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        manager.undeclareStatusSubscribers()
+        manager.zenoh_session_.close()
+
+    asyncio.run(run())
+    assert listener_threads == [threading.main_thread()]
+    assert abs(manager.battery_state.voltage - 12.1) < 1e-5
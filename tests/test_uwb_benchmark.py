@@ -0,0 +1,40 @@
+import json
+from uwb_benchmark import benchParser, benchSerialization, benchSolvers, compareResults
+
+
+def test_compare_flags_only_dropped_rates():
+    baseline = {'parser': {'feed_frames_per_s': 1000.0, 'bytes': 16},
+                'solver': {'linear_solve_fixes_per_s': 500.0, 'new_per_s': None}}
+    result = {'parser': {'feed_frames_per_s': 850.0, 'bytes': 99},
+              'solver': {'linear_solve_fixes_per_s': 350.0, 'new_per_s': 1.0},
+              'zenoh': {'latency_us_p50': 1e6}}
+    assert compareResults(result, baseline, 0.2) == [('solver.linear_solve_fixes_per_s', 500.0, 350.0)]
+    assert compareResults(result, baseline, 0.1) == [('parser.feed_frames_per_s', 1000.0, 850.0),
+                                                     ('solver.linear_solve_fixes_per_s', 500.0, 350.0)]
+
+
+def test_benchmarks_report_every_rate():
+    parser = benchParser(400)
+    assert set(parser) == {'processRawData_frames_per_s', 'frame_parser_feed_frames_per_s'}
+    solver = benchSolvers(400)
+    assert {'processMLE_fixes_per_s', 'linear_solve_fixes_per_s', 'levenberg_marquardt_solve_fixes_per_s',
+            'linear_solveBatch_fixes_per_s'} <= set(solver)
+    serialization = benchSerialization(20)
+    assert serialization['UWBState']['bytes'] == 24 and 'encoder_per_s' in serialization['UWBState']
+    for rates in (parser, solver):
+        assert all(value > 0 for value in rates.values())
+
+
+def test_cli_writes_json_and_fails_on_a_regression(tmp_path, run_script):
+    output = tmp_path / 'benchmark.json'
+    args = ['-n', 400, '--messages', 20, '-o', output]
+    assert run_script('uwb_benchmark.py', *args, cwd = tmp_path).returncode == 0
+    result = json.loads(output.read_text())
+    assert {'meta', 'parser', 'solver', 'serialization'} <= set(result)
+
+    result['solver']['linear_solveBatch_fixes_per_s'] *= 100.0
+    baseline = tmp_path / 'baseline.json'
+    baseline.write_text(json.dumps(result))
+    run = run_script('uwb_benchmark.py', *args, '--baseline', baseline, '--tolerance', 0.5, cwd = tmp_path)
+    assert run.returncode == 1
+    assert 'regression solver.linear_solveBatch_fixes_per_s' in run.stdout
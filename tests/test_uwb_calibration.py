@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from uwb_calibration import AnchorCalibrator, loadSiteConfig, saveSiteConfig
+from uwb_manager import DEFAULT_ANCHOR_POS
+
+TRUE_ANCHOR_POS = np.array(DEFAULT_ANCHOR_POS, dtype=np.float64)
+TRUE_RANGE_BIAS = np.array([0.15, -0.05, 0.25])
+
+
+def makeSession(row_num = 2000, nlos_prob = 0.0, seed = 7):
+    # a walk through the site: ranges with per-anchor bias, noise and optional nlos spikes, tag id column last
+    rng = np.random.default_rng(seed)
+    tag_pos = rng.uniform(TRUE_ANCHOR_POS.min(axis=0) - 1.0, TRUE_ANCHOR_POS.max(axis=0) + 1.0, (row_num, 2))
+    ranges = np.sqrt(np.sum((tag_pos[:, np.newaxis] - TRUE_ANCHOR_POS) ** 2, axis=2)) + TRUE_RANGE_BIAS
+    ranges += rng.normal(0.0, 0.02, ranges.shape)
+    ranges += (rng.random(ranges.shape) < nlos_prob) * rng.uniform(0.5, 1.5, ranges.shape)
+    return np.hstack((ranges, np.ones((row_num, 1))))
+
+
+def roughLayout(seed = 7):
+    # tape-measure guess: anchor 0 and the bearing to anchor 1 define the site frame, the rest is off by decimeters
+    rng = np.random.default_rng(seed)
+    initial = TRUE_ANCHOR_POS + rng.normal(0.0, 0.3, TRUE_ANCHOR_POS.shape)
+    initial[0] = TRUE_ANCHOR_POS[0]
+    initial[1] = TRUE_ANCHOR_POS[0] + 1.05 * (TRUE_ANCHOR_POS[1] - TRUE_ANCHOR_POS[0])
+    return initial
+
+
+def test_calibration_recovers_anchors_and_bias():
+    result = AnchorCalibrator(roughLayout()).calibrate(makeSession())
+    assert np.abs(result['anchor_pos'] - TRUE_ANCHOR_POS).max() < 0.03
+    assert np.abs(result['range_bias'] - TRUE_RANGE_BIAS).max() < 0.02
+    assert result['rms'] < 0.03
+
+
+def test_nlos_rows_are_left_out():
+    result = AnchorCalibrator(roughLayout()).calibrate(makeSession(nlos_prob = 0.03))
+    assert result['rows'] < 2000
+    assert np.abs(result['anchor_pos'] - TRUE_ANCHOR_POS).max() < 0.05
+    assert np.abs(result['range_bias'] - TRUE_RANGE_BIAS).max() < 0.03
+
+
+def test_too_few_rows_is_an_error():
+    with pytest.raises(ValueError):
+        AnchorCalibrator(roughLayout()).calibrate(makeSession(row_num = 5))
+
+
+def test_site_config_feeds_the_solver(tmp_path, simulated_system):
+    result = AnchorCalibrator(roughLayout()).calibrate(makeSession())
+    site_config_path = str(tmp_path / 'config' / 'uwb_site.json')
+    saveSiteConfig(site_config_path, result['anchor_pos'], result['range_bias'], rms = result['rms'])
+    assert np.allclose(loadSiteConfig(site_config_path)['range_bias'], result['range_bias'], atol = 1e-4)
+
+    uwb_system = simulated_system(duration = 0)
+    uwb_system.site_config_path_ = site_config_path
+    uwb_system.initAnchorPos()
+    biased = list(np.sqrt(np.sum((TRUE_ANCHOR_POS - (-2.0, 1.0)) ** 2, axis=1)) + TRUE_RANGE_BIAS)
+    uwb_system.processMLE(biased + [4])
+    fix = uwb_system.getTagFix(4)
+    assert abs(fix.position_x + 2.0) < 0.03 and abs(fix.position_y - 1.0) < 0.03
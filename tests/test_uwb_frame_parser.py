@@ -0,0 +1,38 @@
+from uwb_frame_parser import FRAME_HEADER, FRAME_LENGTH, UWBFrameParser, encodeFrame
+
+FRAME = encodeFrame([1.0, 2.0, 3.0], 3)
+TAIL_IN_PAYLOAD = encodeFrame([0.10, 2.0, 3.0], 2) # 10 cm, a 0x0a byte inside the frame
+
+
+def test_frames_are_found_by_their_tail():
+    # no header or checksum is assumed, like the original readline() decoder
+    frame = bytearray(FRAME)
+    frame[0] = 0x00
+    frame[14] = 0x00
+    frame_parser = UWBFrameParser()
+    assert frame_parser.feed(bytes(frame) + TAIL_IN_PAYLOAD) == [[1.0, 2.0, 3.0, 3], [0.1, 2.0, 3.0, 2]]
+    assert frame_parser.getStats()['corrupt'] == 0
+
+
+def test_resync_after_a_partial_frame():
+    frame_parser = UWBFrameParser()
+    frames = frame_parser.feed(FRAME[5:] + FRAME + TAIL_IN_PAYLOAD + FRAME)
+    assert frames == [[1.0, 2.0, 3.0, 3], [0.1, 2.0, 3.0, 2], [1.0, 2.0, 3.0, 3]]
+    assert frame_parser.getStats()['skipped_bytes'] == FRAME_LENGTH - 5
+
+
+def test_checksum_is_opt_in():
+    damaged = bytearray(FRAME)
+    damaged[8] ^= 1
+    assert UWBFrameParser().feed(bytes(damaged)) == [[1.0 + 2.56, 2.0, 3.0, 3]]
+    frame_parser = UWBFrameParser(header = FRAME_HEADER, check_sum = True)
+    assert frame_parser.feed(bytes(damaged) + FRAME) == [[1.0, 2.0, 3.0, 3]]
+    assert frame_parser.getStats()['corrupt'] == 1
+
+
+def test_repeating_tail_in_payload_never_locks_the_wrong_phase():
+    # a still tag at 2.66 m sends 0x0a at byte 7 of every frame, starting mid-frame must not invent positions
+    still = encodeFrame([2.66, 1.0, 2.0], 3)
+    frame_parser = UWBFrameParser()
+    assert frame_parser.feed((still * 10)[3:]) == []
+    assert frame_parser.feed(FRAME + still * 2) == [[1.0, 2.0, 3.0, 3], [2.66, 1.0, 2.0, 3], [2.66, 1.0, 2.0, 3]]
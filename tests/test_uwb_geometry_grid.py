@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+from uwb_manager import DEFAULT_ANCHOR_POS
+
+ANCHOR_POS = np.array(DEFAULT_ANCHOR_POS, dtype=np.float64)
+
+
+def rangesAt(position_x, position_y) -> list:
+    return np.sqrt(np.sum((ANCHOR_POS - (position_x, position_y)) ** 2, axis=1)).tolist()
+
+
+@pytest.mark.parametrize('position', [(-2.0, 1.0), (-1.0, -1.0), (-1.5, 2.0)])
+def test_grid_gates_frames_inside(uwb_system, position):
+    geometry_grid = uwb_system.getGeometryGrid()
+    assert geometry_grid.cellIndex(*position) is not None
+    ranges = rangesAt(*position)
+    assert geometry_grid.checkRanges(ranges)
+    ranges[2] += 1.0 # still passes the triangle test, no cell fits
+    assert not geometry_grid.checkRanges(ranges)
+
+
+@pytest.mark.parametrize('position', [(3.0, 2.0), (-8.0, 1.0), (0.0, 7.0)])
+def test_tags_outside_the_grid_still_solve(uwb_system, position):
+    assert uwb_system.getGeometryGrid().cellIndex(*position) is None
+    for tag_id in range(1, 4):
+        uwb_system.processMLE(rangesAt(*position) + [tag_id])
+    counters = uwb_system.getStats()['counters']
+    assert counters.get('fixes', 0) == 3 and counters.get('inconsistent', 0) == 0
+    fix = uwb_system.getTagFix(3)
+    assert abs(fix.position_x - position[0]) < 1e-3 and abs(fix.position_y - position[1]) < 1e-3
@@ -0,0 +1,62 @@
+import time
+from uwb_frame_parser import encodeFrame
+from uwb_ingest import UWBIngestManager
+from uwb_manager import DEFAULT_ANCHOR_POS, UWBLocalizationSystem
+from uwb_simulator import UWBSimulator, makeTags
+
+FRAME_NUM = 6000
+RANGES = [2.24, 3.05, 2.34] # tag at (-2, 1)
+
+
+def runCapture(capture_path, frame_num, **ingest_args):
+    ingest_manager = UWBIngestManager(['file:{}'.format(capture_path)], site_config = None, **ingest_args)
+    uwb_system = UWBLocalizationSystem(uwb_manager = ingest_manager.getSource(0), site_config = None)
+    uwb_system.verbose = False
+    uwb_system.startLocalizeTag()
+    deadline = time.monotonic() + 60.0
+    counters = uwb_system.getStats()['counters']
+    while time.monotonic() < deadline:
+        counters = uwb_system.getStats()['counters']
+        if sum(counters.get(name, 0) for name in ('fixes', 'rejected', 'inconsistent')) >= frame_num:
+            break
+        time.sleep(0.05)
+    frame_stats = ingest_manager.getSource(0).getFrameStats()
+    uwb_system.closeSystem()
+    return uwb_system, counters, frame_stats
+
+
+def test_replay_capture_is_not_dropped(tmp_path):
+    # a capture replays faster than the main process takes blocks, every frame must still reach it
+    simulator = UWBSimulator(DEFAULT_ANCHOR_POS, makeTags(4, seed = 3), 100.0, seed = 3)
+    capture_path = tmp_path / 'capture.bin'
+    capture_path.write_bytes(simulator.generateFrames(range(FRAME_NUM // 4)))
+
+    uwb_system, counters, frame_stats = runCapture(capture_path, FRAME_NUM)
+    assert counters['frame_queue_dropped'] == 0 and frame_stats['ring_dropped'] == 0
+    assert counters.get('fixes', 0) + counters.get('rejected', 0) + counters.get('inconsistent', 0) == FRAME_NUM
+    assert counters['fixes'] >= 0.95 * FRAME_NUM
+
+
+def test_fixes_are_solved_in_the_worker(tmp_path):
+    capture_path = tmp_path / 'capture.bin'
+    capture_path.write_bytes(encodeFrame(RANGES, 5) * 20)
+
+    uwb_system, counters, _ = runCapture(capture_path, 20)
+    fix = uwb_system.getTagFix(5)
+    assert counters['fixes'] == 20
+    assert fix.iterations > 0 and fix.solve_stamp >= fix.stamp
+    assert uwb_system.solver_.last_position_ == {} # the main process solver never ran
+
+
+def test_frame_check_reaches_the_workers(tmp_path):
+    damaged = bytearray(encodeFrame(RANGES, 5))
+    damaged[8] ^= 1
+    capture_path = tmp_path / 'capture.bin'
+    capture_path.write_bytes((bytes(damaged) + encodeFrame(RANGES, 6)) * 10)
+
+    _, counters, frame_stats = runCapture(capture_path, 20)
+    assert frame_stats['corrupt'] == 0 and frame_stats['frames'] == 20
+
+    _, counters, frame_stats = runCapture(capture_path, 10, frame_check = True)
+    assert frame_stats['corrupt'] == 10 and frame_stats['frames'] == 10
+    assert counters['fixes'] + counters.get('rejected', 0) + counters.get('inconsistent', 0) == 10
@@ -0,0 +1,73 @@
+import struct
+import pytest
+from uwb_position_bus import (BUS_SIZE, POSITION_BUS_MAGIC, POSITION_RECORD, RECORD_OFFSET, PositionBusReader,
+                              PositionBusWriter)
+from uwb_tag_table import MAX_TAG_NUM
+
+
+def test_record_layout_is_one_cache_line():
+    # readers in other languages map the file with these offsets
+    assert POSITION_RECORD.itemsize == 64
+    assert {name: POSITION_RECORD.fields[name][1] for name in POSITION_RECORD.names} == {
+        'version': 0, 'seq': 8, 'stamp': 16, 'position': 24, 'velocity': 40, 'gdop': 56, 'tag_id': 60}
+    assert RECORD_OFFSET == 64 and BUS_SIZE == 64 + MAX_TAG_NUM * 64
+
+
+def test_raw_bytes_match_the_documented_layout(tmp_path):
+    path = str(tmp_path / 'position_bus')
+    writer = PositionBusWriter(path)
+    writer.write(7, -2.0, 1.0, 0.5, -0.25, stamp = 123.5, gdop = 1.5)
+    writer.write(7, -2.5, 1.25, 0.5, -0.25, stamp = 124.0, gdop = 1.5)
+    with open(path, 'rb') as f:
+        raw_data = f.read()
+    assert len(raw_data) == BUS_SIZE
+    assert struct.unpack_from('<QQQ', raw_data, 0) == (POSITION_BUS_MAGIC, 1, MAX_TAG_NUM)
+    version, seq, stamp, x, y, vel_x, vel_y, gdop, tag_id = struct.unpack_from('<QQ5dfI', raw_data, RECORD_OFFSET + 7 * 64)
+    assert version % 2 == 0 and seq == 2
+    assert (stamp, x, y, vel_x, vel_y, gdop, tag_id) == (124.0, -2.5, 1.25, 0.5, -0.25, 1.5, 7)
+
+    reader = PositionBusReader(path)
+    assert reader.read(7) == (-2.5, 1.25, 0.5, -0.25, 124.0, 1.5, 2)
+    assert reader.read(8) is None and reader.getTagIds() == [7]
+    assert reader.getPosition(7, stamp = 125.0) == [-2.0, 1.0, 7]
+    assert reader.getPosition(7, stamp = 130.0) is None # older than max_age
+    writer.close()
+    assert not reader.isWriterAlive() and reader.read(7) is not None
+    reader.close()
+
+
+def test_restarted_writer_clears_old_tags(tmp_path):
+    path = str(tmp_path / 'position_bus')
+    writer = PositionBusWriter(path)
+    writer.write(3, 1.0, 2.0)
+    writer.close()
+    reader = PositionBusReader(path)
+    writer = PositionBusWriter(path)
+    assert reader.getTagIds() == [] and reader.isWriterAlive()
+    # a record left odd by a killed writer is skipped instead of read torn
+    writer.version_[5] += 1
+    writer.seq_[5] = 1
+    reader.MAX_RETRY = 100
+    assert reader.read(5) is None
+    writer.close()
+    reader.close()
+
+
+def test_reader_refuses_other_files(tmp_path):
+    path = tmp_path / 'not_a_bus'
+    path.write_bytes(bytes(BUS_SIZE))
+    with pytest.raises(ValueError):
+        PositionBusReader(str(path))
+
+
+def test_localization_system_publishes_tracked_fixes(tmp_path, uwb_system):
+    path = str(tmp_path / 'position_bus')
+    uwb_system.openPositionBus(path)
+    uwb_system.processMLE([2.236, 3.045, 2.344, 4], stamp = 50.0)
+    reader = PositionBusReader(path)
+    x, y, vel_x, vel_y, stamp, gdop, seq = reader.read(4)
+    assert (stamp, seq) == (50.0, 1)
+    assert abs(x + 2.0) < 0.01 and abs(y - 1.0) < 0.01
+    assert uwb_system.tracker_.getState(4)[:2] == (x, y)
+    reader.close()
+    uwb_system.closeSystem()
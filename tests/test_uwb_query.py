@@ -0,0 +1,74 @@
+import time
+import pytest
+import zenoh
+from multi_robot_datatype import UWBStampedBatch
+from uwb_history import parseSelector
+
+TAG_POS = {1: (-2.0, 1.0), 2: (-2.6, 1.2), 3: (-1.0, 2.8)}
+
+
+@pytest.fixture(scope='module')
+def manager(peer_manager, simulated_system):
+    # real peer session on loopback, the uwb system runs on a simulated serial port
+    manager = peer_manager(17447)
+    manager.uwb_system = simulated_system(TAG_POS, seed = 1)
+    manager.uwb_system.startLocalizeTag()
+    manager.zenoh_session_ = manager.openZenohSession()
+    manager.declareQueryables()
+    deadline = time.monotonic() + 5.0
+    while len(manager.uwb_system.getTagIds()) < len(TAG_POS) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    yield manager
+    manager.undeclareQueryables()
+    manager.zenoh_session_.close()
+    manager.uwb_system.closeSystem()
+
+
+def query(manager, selector) -> list:
+    replies = manager.zenoh_session_.get(selector, zenoh.Queue())
+    return [UWBStampedBatch.deserialize(reply.ok.payload) for reply in replies]
+
+
+def test_latest_state_has_every_tag(manager):
+    replies = query(manager, manager.uwb_state_key_)
+    assert len(replies) == 1
+    batch = replies[0]
+    assert sorted(batch.tag_id) == sorted(manager.uwb_system.getTagIds())
+    assert len(batch.tag_id) == len(TAG_POS)
+    for tag_id, position_x, position_y in zip(batch.tag_id, batch.position_x, batch.position_y):
+        state = manager.uwb_system.getTagPosition(tag_id)
+        assert abs(position_x - state[0]) < 0.05 and abs(position_y - state[1]) < 0.05
+
+
+def test_latest_state_of_one_tag(manager):
+    tag_id = manager.uwb_system.getTagIds()[0]
+    replies = query(manager, '{}?tag={}'.format(manager.uwb_state_key_, tag_id))
+    assert len(replies) == 1 and list(replies[0].tag_id) == [tag_id]
+
+
+def test_near_returns_every_neighbour_nearest_first(manager):
+    replies = query(manager, '{}?near=1;radius=3'.format(manager.uwb_state_key_))
+    assert len(replies) == 1
+    assert list(replies[0].tag_id) == [2, 3]
+    replies = query(manager, '{}?near=1;radius=1'.format(manager.uwb_state_key_))
+    assert list(replies[0].tag_id) == [2]
+
+
+def test_zone_returns_every_member(manager):
+    manager.uwb_system.getSpatialIndex().addZone('west', [[-3.0, 0.0], [-1.5, 0.0], [-1.5, 2.0], [-3.0, 2.0]])
+    replies = query(manager, '{}?zone=west'.format(manager.uwb_state_key_))
+    assert len(replies) == 1
+    assert sorted(replies[0].tag_id) == [1, 2]
+    replies = query(manager, '{}?zone=unknown'.format(manager.uwb_state_key_))
+    assert len(replies) == 1 and len(replies[0].tag_id) == 0
+
+
+def test_out_of_range_tag_is_rejected(manager):
+    with pytest.raises(ValueError):
+        parseSelector('tag=300;_time=[now(-10s)..now()]')
+    with pytest.raises(ValueError):
+        parseSelector('near=-1;radius=2')
+    assert query(manager, '{}?tag=300;_time=[now(-10s)..now()]'.format(manager.uwb_state_key_)) == []
+    assert query(manager, '{}?near=256'.format(manager.uwb_state_key_)) == []
+    # the queryable keeps answering
+    assert len(query(manager, manager.uwb_state_key_)) == 1
@@ -0,0 +1,40 @@
+import re
+import numpy as np
+from uwb_frame_parser import encodeFrame
+from uwb_manager import DEFAULT_ANCHOR_POS
+from uwb_recorder import UWBLogReader, UWBRecorder
+from uwb_simulator import UWBSimulator, makeTags
+
+
+def test_recorded_frames_decode_back_to_their_ranges(tmp_path):
+    log_path = tmp_path / 'frames.log'
+    rows = [[1.0 + 0.01 * index, 2.0, 3.5, index % 4] for index in range(1000)]
+    recorder = UWBRecorder(log_path, chunk_records = 64)
+    for index, row in enumerate(rows):
+        recorder.recordFrame(encodeFrame(row[:3], row[3]), 10.0 + index * 0.01)
+    recorder.close()
+    assert recorder.record_count == 1000 and recorder.getDroppedCount() == 0
+
+    log_reader = UWBLogReader(log_path)
+    assert len(log_reader) == 1000
+    assert np.allclose(log_reader.records['stamp'], 10.0 + np.arange(1000) * 0.01)
+    assert np.allclose(log_reader.decodeRanges(), rows)
+    log_reader.close()
+
+
+def test_replay_reports_every_frame(tmp_path, run_script):
+    # the summary is printed once the localize thread has taken every frame, not when the reader runs out
+    simulator = UWBSimulator(DEFAULT_ANCHOR_POS, makeTags(3, seed = 6), 100.0, seed = 6)
+    raw_data = simulator.generateFrames(np.arange(500) * 0.01)
+    log_path = tmp_path / 'frames.log'
+    recorder = UWBRecorder(log_path)
+    for index in range(0, len(raw_data), 16):
+        recorder.recordFrame(raw_data[index:index + 16], index * 1e-4)
+    recorder.close()
+
+    result = run_script('uwb_recorder.py', log_path, cwd = tmp_path)
+    match = re.search(r'(\d+) frames in .* s, (\d+) fixes, (\d+) rejected', result.stdout)
+    assert match is not None, result.stdout + result.stderr
+    frame_num, fix_num, rejected_num = (int(value) for value in match.groups())
+    assert frame_num == 1500
+    assert fix_num + rejected_num == frame_num
@@ -0,0 +1,37 @@
+import os
+import time
+from uwb_frame_parser import UWBFrameParser, encodeFrame
+from uwb_serial_link import SerialLink
+
+
+def test_stall_backoff_grows_until_frames_arrive():
+    # pty that stays present but silent: it reopens fine every time, the delay must still grow
+    master_fd, slave_fd = os.openpty()
+    link = SerialLink(os.ttyname(slave_fd), read_time_out = 0.02, min_stall_time = 0.05, max_stall_time = 0.05,
+                      min_backoff = 0.02, max_backoff = 0.16)
+    frame_parser = UWBFrameParser()
+    try:
+        open_stamps = list()
+        deadline = time.monotonic() + 2.0
+        while time.monotonic() < deadline and len(open_stamps) < 6:
+            connected = link.connected
+            link.readFrames(frame_parser)
+            if link.connected and not connected:
+                open_stamps.append(time.monotonic())
+        assert link.stall_count >= 5
+        assert link.backoff_ == 0.16
+        gaps = [b - a for a, b in zip(open_stamps, open_stamps[1:])]
+        assert gaps[-1] > gaps[0] + 0.1
+
+        deadline = time.monotonic() + 2.0
+        while time.monotonic() < deadline and not link.getStats()['connected']:
+            link.readFrames(frame_parser)
+        os.write(master_fd, encodeFrame([1.0, 2.0, 3.0], 1) * 4)
+        frames = list()
+        while time.monotonic() < deadline and not frames:
+            frames = link.readFrames(frame_parser)
+        assert frames and link.backoff_ == 0.02
+    finally:
+        link.close()
+        os.close(master_fd)
+        os.close(slave_fd)
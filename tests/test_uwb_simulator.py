@@ -0,0 +1,17 @@
+import json
+import os
+import re
+from uwb_manager import DEFAULT_ANCHOR_POS
+
+
+def test_load_test_skips_zone_events(tmp_path, run_script):
+    # a site zone around the whole floor puts ('zone', event) items into the fix queue next to the fixes
+    os.makedirs(tmp_path / 'config')
+    site_config = {'anchor_pos': DEFAULT_ANCHOR_POS,
+                   'zones': {'floor': [[-20.0, -20.0], [20.0, -20.0], [20.0, 20.0], [-20.0, 20.0]]}}
+    (tmp_path / 'config' / 'uwb_site.json').write_text(json.dumps(site_config))
+    result = run_script('uwb_simulator.py', '-n', 2, '-d', 1, '--seed', 1, cwd = tmp_path)
+    assert result.returncode == 0, result.stderr
+    match = re.search(r'fixes (\d+) .* zone events (\d+)', result.stdout)
+    assert match is not None, result.stdout
+    assert int(match.group(1)) > 100 and int(match.group(2)) >= 2
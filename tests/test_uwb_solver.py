@@ -0,0 +1,89 @@
+import numpy as np
+from uwb_manager import DEFAULT_ANCHOR_POS
+from uwb_solver import LevenbergMarquardtSolver, LinearMultilateration
+
+SQUARE_ANCHOR_POS = [[0.0, 0.0], [6.0, 0.0], [6.0, 6.0], [0.0, 6.0]]
+
+
+def rangesAt(anchor_pos, position):
+    return np.sqrt(np.sum((np.asarray(anchor_pos) - position) ** 2, axis=1))
+
+
+def lstsqPosition(anchor_pos, ranges):
+    # the per-sample normal equations the batch engine replaced, against the last anchor
+    anchor_pos = np.asarray(anchor_pos, dtype=np.float64)
+    A = 2 * (anchor_pos[:-1] - anchor_pos[-1])
+    b = np.sum(anchor_pos[:-1] ** 2, axis=1) - np.sum(anchor_pos[-1] ** 2) + ranges[-1] ** 2 - ranges[:-1] ** 2
+    return np.linalg.lstsq(A, b, rcond=None)[0]
+
+
+def test_linear_batch_matches_lstsq():
+    rng = np.random.default_rng(3)
+    for anchor_pos in (DEFAULT_ANCHOR_POS, SQUARE_ANCHOR_POS):
+        solver = LinearMultilateration()
+        solver.setAnchors(anchor_pos)
+        positions = rng.uniform(-3.0, 3.0, (200, 2))
+        range_rows = np.array([rangesAt(anchor_pos, position) for position in positions])
+        range_rows += rng.normal(0.0, 0.05, range_rows.shape)
+        tag_rows = np.hstack((range_rows, rng.integers(0, 8, (200, 1)))) # tag id column is ignored
+        batch = solver.solveBatch(tag_rows)
+        assert batch.shape == (200, 2)
+        assert np.allclose(batch, [lstsqPosition(anchor_pos, ranges) for ranges in range_rows], atol = 1e-9)
+        fix = solver.solve(list(range_rows[0]) + [5])
+        assert fix.tag_id == 5 and np.allclose((fix.position_x, fix.position_y), batch[0], atol = 1e-9)
+
+
+def test_batch_mle_keeps_the_tag_id(uwb_system):
+    range_rows = [list(rangesAt(DEFAULT_ANCHOR_POS, position)) + [tag_id]
+                  for tag_id, position in enumerate([(-2.0, 1.0), (-1.0, 2.5), (-3.0, 1.5)])]
+    tag_pos = uwb_system.processBatchMLE(range_rows)
+    assert np.allclose(tag_pos, [[-2.0, 1.0, 0], [-1.0, 2.5, 1], [-3.0, 1.5, 2]], atol = 1e-9)
+
+
+def test_lm_is_more_accurate_than_linear_on_noisy_ranges():
+    rng = np.random.default_rng(4)
+    lm_solver, linear_solver = LevenbergMarquardtSolver(), LinearMultilateration()
+    lm_solver.setAnchors(SQUARE_ANCHOR_POS)
+    linear_solver.setAnchors(SQUARE_ANCHOR_POS)
+    lm_error, linear_error = list(), list()
+    for tag_id in range(500):
+        position = rng.uniform(0.5, 5.5, 2)
+        ranges = rangesAt(SQUARE_ANCHOR_POS, position) + rng.normal(0.0, 0.05, 4)
+        for solver, error in ((lm_solver, lm_error), (linear_solver, linear_error)):
+            fix = solver.solve(list(ranges) + [tag_id])
+            error.append(np.hypot(fix.position_x - position[0], fix.position_y - position[1]))
+    lm_rms, linear_rms = np.sqrt(np.mean(np.square(lm_error))), np.sqrt(np.mean(np.square(linear_error)))
+    assert lm_rms < 0.06
+    assert lm_rms < 0.9 * linear_rms
+
+
+def test_warm_start_is_kept_per_tag():
+    solver = LevenbergMarquardtSolver()
+    solver.setAnchors(SQUARE_ANCHOR_POS)
+    solver.solve(list(rangesAt(SQUARE_ANCHOR_POS, (1.0, 1.0))) + [1])
+    solver.solve(list(rangesAt(SQUARE_ANCHOR_POS, (5.0, 4.0))) + [2])
+    # tag 1 starts from its own last fix, not from the one solved last
+    moved = rangesAt(SQUARE_ANCHOR_POS, (1.2, 1.0))
+    assert np.allclose(solver.initialGuess(moved, 1), (1.0, 1.0), atol = 1e-6)
+    fix = solver.solve(list(moved) + [1])
+    assert abs(fix.position_x - 1.2) < 1e-4 and abs(fix.position_y - 1.0) < 1e-4
+    assert np.allclose(solver.last_position_[2], (5.0, 4.0), atol = 1e-6)
+    solver.resetTag(1)
+    assert 1 not in solver.last_position_ and 2 in solver.last_position_
+
+
+def test_process_mle_rejects_on_residual_and_gdop(uwb_system):
+    ranges = list(rangesAt(uwb_system.anchor_pos_list, (-2.0, 1.0)))
+    uwb_system.processMLE([ranges[0] + 0.1, ranges[1], ranges[2], 1])
+    assert uwb_system.getStats()['counters']['fixes'] == 1 and uwb_system.getTagFix(1).residual > 0.01
+
+    uwb_system.MAX_FIX_RESIDUAL = 0.01
+    uwb_system.processMLE([ranges[0] + 0.1, ranges[1], ranges[2], 2])
+    uwb_system.MAX_FIX_RESIDUAL, uwb_system.MAX_FIX_GDOP = 0.5, 1.0
+    uwb_system.processMLE(ranges + [3])
+
+    counters = uwb_system.getStats()['counters']
+    assert counters['rejected'] == 2 and uwb_system.rejected_fix_count == 2
+    assert counters['fixes'] == 1
+    assert uwb_system.getTagFix(2) is None and uwb_system.getTagFix(3) is None
+    assert [fix.tag_id for _, fix in uwb_system.fix_queue_.popAll(timeout = 0)] == [1]
@@ -0,0 +1,42 @@
+import sys
+import threading
+import time
+from uwb_tag_table import TagTable
+
+
+def test_readers_never_see_a_torn_row():
+    # every field of a row is derived from the same counter, a mix of two writes shows up as a mismatch
+    tag_table = TagTable()
+    stop = threading.Event()
+    torn, reads = list(), [0]
+
+    def write():
+        value = 0.0
+        while not stop.is_set():
+            value += 1.0
+            tag_table.update(3, ranges = [value, value + 1.0, value + 2.0], position = (value, -value), stamp = value)
+
+    def read():
+        while not stop.is_set():
+            record = tag_table.read(3)
+            if record is None:
+                continue
+            ranges, position, stamp, seq = record
+            reads[0] += 1
+            if ranges != [stamp, stamp + 1.0, stamp + 2.0] or position != [stamp, -stamp] or seq != int(stamp):
+                torn.append(record)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5) # switch threads mid-row as often as possible
+    try:
+        threads = [threading.Thread(target = write)] + [threading.Thread(target = read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(1.0)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert reads[0] > 1000
+    assert torn == []
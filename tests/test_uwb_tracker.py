@@ -0,0 +1,50 @@
+import math
+import numpy as np
+from uwb_tracker import TagTracker, UWBTracker
+
+
+def test_constant_velocity_track_converges():
+    rng = np.random.default_rng(5)
+    tracker = UWBTracker()
+    measure_error, track_error = list(), list()
+    for step in range(200):
+        stamp = 0.1 * step
+        x, y = 1.0 + 0.5 * stamp, 2.0 - 0.3 * stamp
+        noise = rng.normal(0.0, 0.05, 2)
+        assert tracker.update(7, x + noise[0], y + noise[1], stamp)
+        if step >= 100:
+            state = tracker.getState(7)
+            measure_error.append(np.hypot(*noise))
+            track_error.append(np.hypot(state[0] - x, state[1] - y))
+    # the filtered track is closer to the truth than the fixes it was fed
+    assert np.sqrt(np.mean(np.square(track_error))) < 0.8 * np.sqrt(np.mean(np.square(measure_error)))
+    _, _, vel_x, vel_y, stamp = tracker.getState(7)
+    assert abs(vel_x - 0.5) < 0.2 and abs(vel_y + 0.3) < 0.2
+    x, y = tracker.getPosition(7, stamp + 0.5)
+    assert abs(x - (1.0 + 0.5 * (stamp + 0.5))) < 0.15 and abs(y - (2.0 - 0.3 * (stamp + 0.5))) < 0.15
+
+
+def test_outlier_is_gated_at_the_chi_square_bound():
+    track = TagTracker(gate = 9.21)
+    for step in range(50):
+        track.update(0.5 * step * 0.1, 0.0, step * 0.1)
+    stamp = 5.0
+    track.predict(stamp)
+    x, y = track.predictPosition()
+    innovation_sigma = math.sqrt(track.p_pp_ + track.range_sigma_ ** 2)
+    state = (track.pos_x, track.pos_y, track.vel_x, track.vel_y)
+
+    assert not track.update(x + math.sqrt(9.5) * innovation_sigma, y, stamp)
+    assert track.rejected_total == 1
+    assert (track.pos_x, track.pos_y, track.vel_x, track.vel_y) == state
+    assert track.update(x, y + math.sqrt(9.0) * innovation_sigma, stamp)
+
+
+def test_track_restarts_after_repeated_rejects():
+    track = TagTracker(max_reject = 5)
+    for step in range(20):
+        track.update(0.0, 0.0, step * 0.1)
+    results = [track.update(10.0, 10.0, 2.0 + step * 0.1) for step in range(5)]
+    assert results == [False] * 5
+    assert (track.pos_x, track.pos_y) == (10.0, 10.0)
+    assert track.update(10.0, 10.0, 2.6)
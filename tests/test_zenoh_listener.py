@@ -0,0 +1,49 @@
+import sys
+import time
+from cdr_codec import UWBDeltaEncoder, UWBStateEncoder, UWBStateStampedEncoder
+from zenoh_listener import TopicStats, ZenohListener
+
+
+def test_seq_gaps_latency_and_rate():
+    encoder = UWBStateStampedEncoder(frame_id = 'tb1')
+    topic_stats = TopicStats('UWBStateStamped')
+    now = time.monotonic()
+    for index in range(20):
+        payload = encoder.encode(-2.0, 1.0, 3, now, now, now)
+        if index in (5, 6, 12): # lost on the link
+            continue
+        topic_stats.record(payload, 0.1 * index, time.time() + 0.002) # one-way latency of 2 ms
+    summary = topic_stats.summary(period = 2.0)
+    assert summary['rate'] == 17 / 2.0
+    assert summary['gaps'] == 2 and summary['lost'] == 3 and topic_stats.total_lost == 3
+    assert summary['jitter_ms'] > 0.0 # the two lost spans stretch the inter-arrival time
+    assert summary['latency']['count'] == 17 and 0.0015 < summary['latency']['p50'] < 0.01
+    # the window restarts, totals do not
+    assert topic_stats.summary(period = 1.0)['rate'] == 0 and topic_stats.total_count == 17
+
+
+def test_publisher_restart_is_not_a_gap():
+    encoder = UWBDeltaEncoder()
+    topic_stats = TopicStats('UWBDeltaState')
+    for _ in range(5):
+        topic_stats.record(encoder.encodeKeyframe([1], [[-2.0, 1.0]]), time.monotonic(), time.time())
+    restarted = UWBDeltaEncoder()
+    topic_stats.record(restarted.encodeKeyframe([1], [[-2.0, 1.0]]), time.monotonic(), time.time())
+    assert topic_stats.summary(period = 1.0)['gaps'] == 0
+
+
+def test_unstamped_types_count_without_latency():
+    topic_stats = TopicStats('UWBState')
+    for index in range(10):
+        topic_stats.record(UWBStateEncoder().encode(1.0, 2.0, 3), index * 0.01, time.time())
+    summary = topic_stats.summary(period = 0.1)
+    assert summary['rate'] == 100.0 and summary['latency']['count'] == 0 and summary['kbps'] == 10 * 24 * 8e-3 / 0.1
+
+
+def test_topic_types_follow_the_key(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['zenoh_listener.py', '--stats', '-t', 'rt/*/uwb_state_stamped',
+                                      '-t', 'rt/tb1/custom:UWBState', '-t', 'rt/tb1/raw'])
+    listener = ZenohListener()
+    assert listener.stats_mode_
+    assert listener.topics_ == [('rt/*/uwb_state_stamped', 'UWBStateStamped'), ('rt/tb1/custom', 'UWBState'),
+                                ('rt/tb1/raw', None)]
@@ -0,0 +1,196 @@
+import json
+import platform
+import sys
+import time
+import numpy as np
+from uwb_frame_parser import UWBFrameParser, FRAME_LENGTH
+from uwb_manager import UWBManager, UWBLocalizationSystem, DEFAULT_ANCHOR_POS
+from uwb_solver import LinearMultilateration, LevenbergMarquardtSolver
+from uwb_simulator import UWBSimulator, SimulatedSerialPort, makeTags
+
+
+def measureRate(func, item_num, repeat = 5) -> float:
+    # items per second, best of repeat runs
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return item_num / max(best, 1e-9)
+
+
+def makeFrames(frame_num, tag_num = 8, seed = 0) -> bytes:
+    simulator = UWBSimulator(DEFAULT_ANCHOR_POS, makeTags(tag_num, seed=seed), rate=100.0, seed=seed)
+    return simulator.generateFrames(np.arange(frame_num // tag_num) / simulator.rate)
+
+
+def benchParser(frame_num) -> dict:
+    raw_data = makeFrames(frame_num)
+    frames = [raw_data[pos:pos + FRAME_LENGTH] for pos in range(0, len(raw_data), FRAME_LENGTH)]
+    uwb_manager = UWBManager.__new__(UWBManager) # processRawData needs no port
+    def processRawData():
+        for frame in frames:
+            uwb_manager.processRawData(frame)
+    def feed():
+        frame_parser = UWBFrameParser()
+        for pos in range(0, len(raw_data), 4096):
+            frame_parser.feed(raw_data[pos:pos + 4096])
+    return {'processRawData_frames_per_s': measureRate(processRawData, len(frames)),
+            'frame_parser_feed_frames_per_s': measureRate(feed, len(frames))}
+
+
+def benchSolvers(fix_num) -> dict:
+    rows = UWBFrameParser().feed(makeFrames(fix_num))
+    range_rows = np.asarray(rows, dtype=np.float64)
+    uwb_system = UWBLocalizationSystem(uwb_manager = UWBManager(serial_port = SimulatedSerialPort(
+        UWBSimulator(DEFAULT_ANCHOR_POS, []), duration = 0)))
+    uwb_system.verbose = False
+    uwb_system.initAnchorPos()
+    def processMLE():
+        for row in rows:
+            uwb_system.processMLE(row)
+    result = {'processMLE_fixes_per_s': measureRate(processMLE, len(rows))}
+    uwb_system.closeSystem()
+    for name, solver in (('linear', LinearMultilateration()), ('levenberg_marquardt', LevenbergMarquardtSolver())):
+        solver.setAnchors(DEFAULT_ANCHOR_POS)
+        def solve():
+            for row in rows:
+                solver.solve(row)
+        result['{}_solve_fixes_per_s'.format(name)] = measureRate(solve, len(rows))
+    batch_solver = LinearMultilateration()
+    batch_solver.setAnchors(DEFAULT_ANCHOR_POS)
+    result['linear_solveBatch_fixes_per_s'] = measureRate(lambda: batch_solver.solveBatch(range_rows), len(rows))
+    return result
+
+
+def sampleMessages() -> dict:
+    import multi_robot_datatype as datatype
+    joint_name = ['wheel_left_joint', 'wheel_right_joint']
+    return {
+        'Time': datatype.Time(1, 2),
+        'Header': datatype.Header(datatype.Time(1, 2), 'base_link'),
+        'JointStates': datatype.JointStates(1, 2, 'base_link', joint_name, [0.1, 0.2], [1.0, -1.0], [0.0, 0.0]),
+        'BatteryState': datatype.BatteryState(1, 2, 'battery', 12.1, 25.0, -1.2, 1.5, 1.8, 1.8, 0.8, 2, 1, 3, True),
+        'OverViewState': datatype.OverViewState(12.1, 1.8, 0.8, joint_name, [1.0, -1.0]),
+        'UWBState': datatype.UWBState(1.25, -0.5, 3),
+        'PoseStamped': datatype.PoseStamped(1, 2, 'map', 1.0, 2.0, 0.0, 0.0, 0.0, 0.0, 1.0),
+        'UWBStampedBatch': datatype.UWBStampedBatch(1, 2, 'uwb', list(range(32)), [0.0] * 32, [1.0] * 32, [2.0] * 32),
+        'FleetState': datatype.FleetState(1, 2, ['turtlebot{}'.format(i) for i in range(100)], [12.0] * 100, [0.8] * 100,
+                                          [1.0] * 100, [2.0] * 100, list(range(100)), [0.1] * 100),
+        'UWBStateStamped': datatype.UWBStateStamped(1, 2, 'turtlebot1', 7, 1.25, -0.5, 3, 0.001, 0.002),
+    }
+
+
+def benchSerialization(count) -> dict:
+    from cdr_codec import UWBStateEncoder, OverViewStateEncoder, BatteryStateView, JointStatesView
+    result = dict()
+    messages = sampleMessages()
+    for name, message in messages.items():
+        payload = message.serialize()
+        message_type = type(message)
+        def serialize():
+            for _ in range(count):
+                message.serialize()
+        def deserialize():
+            for _ in range(count):
+                message_type.deserialize(payload)
+        result[name] = {'bytes': len(payload),
+                        'serialize_per_s': measureRate(serialize, count),
+                        'deserialize_per_s': measureRate(deserialize, count)}
+
+    uwb_state_encoder = UWBStateEncoder()
+    def encodeUWBState():
+        for _ in range(count):
+            uwb_state_encoder.encode(1.25, -0.5, 3)
+    overview_encoder = OverViewStateEncoder()
+    battery_payload = messages['BatteryState'].serialize()
+    joint_payload = messages['JointStates'].serialize()
+    def encodeOverViewState():
+        for _ in range(count):
+            overview_encoder.encode(BatteryStateView(battery_payload), JointStatesView(joint_payload))
+    result['UWBState']['encoder_per_s'] = measureRate(encodeUWBState, count)
+    result['OverViewState']['lazy_view_encoder_per_s'] = measureRate(encodeOverViewState, count)
+    return result
+
+
+def benchZenoh(sample_num, endpoint) -> dict:
+    # put -> subscriber latency inside one peer session, no router needed
+    import threading
+    import zenoh
+    config = zenoh.Config()
+    config.insert_json5(zenoh.config.MODE_KEY, json.dumps('peer'))
+    config.insert_json5(zenoh.config.LISTEN_KEY, json.dumps([endpoint]))
+    session = zenoh.open(config)
+    key = 'bench/uwb_latency'
+    latency = list()
+    done = threading.Event()
+    def listener(sample):
+        latency.append(time.perf_counter() - float(bytes(sample.payload)))
+        if len(latency) >= sample_num:
+            done.set()
+    subscriber = session.declare_subscriber(key, listener)
+    publisher = session.declare_publisher(key)
+    time.sleep(0.5) # let the declarations settle
+    for _ in range(sample_num):
+        publisher.put(repr(time.perf_counter()).encode())
+        time.sleep(0.001)
+    done.wait(5.0)
+    subscriber.undeclare()
+    publisher.undeclare()
+    session.close()
+    latency = np.asarray(latency) * 1e6
+    if len(latency) == 0:
+        return {'received': 0}
+    return {'received': len(latency),
+            'latency_us_p50': float(np.percentile(latency, 50)),
+            'latency_us_p99': float(np.percentile(latency, 99)),
+            'latency_us_max': float(latency.max())}
+
+
+def compareResults(result, baseline, tolerance, prefix = '') -> list:
+    # rate metrics (*_per_s) that dropped by more than tolerance
+    regressions = list()
+    for key, value in result.items():
+        base_value = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            regressions += compareResults(value, base_value or dict(), tolerance, prefix + key + '.')
+        elif key.endswith('_per_s') and isinstance(base_value, (int, float)) and value < base_value * (1 - tolerance):
+            regressions.append((prefix + key, base_value, value))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(prog='uwb-benchmark', description='hot path benchmarks, results as json')
+    arg_parser.add_argument('-o', '--output', type=str, default='benchmark.json')
+    arg_parser.add_argument('-n', '--frames', type=int, default=20000)
+    arg_parser.add_argument('--messages', type=int, default=20000, help='serialize / deserialize calls per type')
+    arg_parser.add_argument('--zenoh', type=str, nargs='?', const='tcp/127.0.0.1:7448', default=None, metavar='ENDPOINT',
+                            help='also measure put -> subscriber latency on a local peer')
+    arg_parser.add_argument('--baseline', type=str, metavar='FILE', help='fail when a rate drops below the baseline')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2)
+    args = arg_parser.parse_args()
+
+    result = {'meta': {'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'machine': platform.machine(),
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'frames': args.frames,
+                       'messages': args.messages}}
+    result['parser'] = benchParser(args.frames)
+    result['solver'] = benchSolvers(args.frames)
+    result['serialization'] = benchSerialization(args.messages)
+    if args.zenoh is not None:
+        result['zenoh'] = benchZenoh(1000, args.zenoh)
+    print(json.dumps(result, indent=2))
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compareResults(result, json.load(f), args.tolerance)
+        for name, base_value, value in regressions:
+            print("regression {}: {:.0f} -> {:.0f} /s".format(name, base_value, value))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,195 @@
+import json
+import os
+import time
+import numpy as np
+from uwb_solver import LinearMultilateration
+
+SITE_CONFIG_PATH = './config/uwb_site.json'
+
+
+def loadSiteConfig(file_path = SITE_CONFIG_PATH) -> dict:
+    # None when the site has not been calibrated
+    if file_path is None or not os.path.exists(file_path):
+        return None
+    with open(file_path) as f:
+        site_config = json.load(f)
+    anchor_pos = site_config.get('anchor_pos')
+    if not anchor_pos or len(anchor_pos) < 3:
+        raise ValueError("{} needs at least 3 anchor_pos entries".format(file_path))
+    site_config.setdefault('range_bias', [0.0] * len(anchor_pos))
+    return site_config
+
+
+def saveSiteConfig(file_path, anchor_pos, range_bias, **info):
+    site_config = {'anchor_pos': np.asarray(anchor_pos).round(4).tolist(),
+                   'range_bias': np.asarray(range_bias).round(4).tolist()}
+    site_config.update(info)
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(file_path, 'w') as f:
+        json.dump(site_config, f, indent=2)
+
+
+class AnchorCalibrator():
+    """ Joint least squares over anchor positions, per-anchor range bias and every tag position of a session """
+
+    def __init__(self, initial_anchor_pos, estimate_bias = True, max_rows = 4000,
+                 max_iterations = 100, tolerance = 1e-9, outlier_sigma = 3.0):
+
+        # initial_anchor_pos: rough layout, anchor 0 and the bearing of anchor 1 also fix the site frame
+        self.initial_anchor_pos_ = np.asarray(initial_anchor_pos, dtype=np.float64)
+        self.estimate_bias_ = estimate_bias
+        self.max_rows_ = max_rows
+        self.max_iterations_ = max_iterations
+        self.tolerance_ = tolerance
+        self.outlier_sigma_ = outlier_sigma
+
+    def selectRows(self, range_rows) -> np.ndarray:
+        anchor_num = len(self.initial_anchor_pos_)
+        ranges = np.asarray(range_rows, dtype=np.float64)[:, :anchor_num]
+        ranges = ranges[np.all(ranges > 0, axis=1)]
+        if len(ranges) > self.max_rows_:
+            ranges = ranges[np.linspace(0, len(ranges) - 1, self.max_rows_).astype(np.int64)]
+        return ranges
+
+    def computeResidual(self, tag_pos, anchor_pos, range_bias, ranges):
+        delta = tag_pos[:, np.newaxis, :] - anchor_pos # (N, anchors, 2)
+        dist = np.maximum(np.sqrt(np.sum(delta ** 2, axis=2)), 1e-9)
+        return dist + range_bias - ranges, delta / dist[:, :, np.newaxis]
+
+    def step(self, tag_pos, anchor_pos, range_bias, ranges, damping):
+        # one damped Gauss-Newton step, tag blocks eliminated through the Schur complement
+        anchor_num = len(anchor_pos)
+        global_num = 3 * anchor_num if self.estimate_bias_ else 2 * anchor_num
+        error, unit = self.computeResidual(tag_pos, anchor_pos, range_bias, ranges)
+        outer = unit[:, :, :, np.newaxis] * unit[:, :, np.newaxis, :] # (N, anchors, 2, 2)
+
+        U = outer.sum(axis=1) + damping * np.eye(2)
+        g_tag = np.einsum('naj,na->nj', unit, error)
+        W = np.zeros((len(ranges), 2, global_num))
+        V = damping * np.eye(global_num)
+        g_global = np.zeros(global_num)
+        for anchor in range(anchor_num):
+            col = slice(2 * anchor, 2 * anchor + 2)
+            W[:, :, col] = -outer[:, anchor]
+            V[col, col] += outer[:, anchor].sum(axis=0)
+            g_global[col] = -np.einsum('nj,n->j', unit[:, anchor], error[:, anchor])
+            if self.estimate_bias_:
+                bias_col = 2 * anchor_num + anchor
+                W[:, :, bias_col] = unit[:, anchor]
+                V[col, bias_col] = V[bias_col, col] = -unit[:, anchor].sum(axis=0)
+                V[bias_col, bias_col] += len(ranges)
+                g_global[bias_col] = error[:, anchor].sum()
+
+        U_inv = np.linalg.inv(U)
+        U_inv_W = U_inv @ W # (N, 2, G)
+        S = V - np.einsum('nag,nah->gh', W, U_inv_W)
+        rhs = -g_global + np.einsum('nag,na->g', U_inv_W, g_tag)
+        delta_global = np.linalg.solve(S, rhs)
+        delta_tag = -np.einsum('nab,nb->na', U_inv, g_tag + W @ delta_global)
+
+        new_anchor_pos = anchor_pos + delta_global[:2 * anchor_num].reshape(anchor_num, 2)
+        new_range_bias = range_bias + delta_global[2 * anchor_num:] if self.estimate_bias_ else range_bias
+        return tag_pos + delta_tag, new_anchor_pos, new_range_bias
+
+    def alignFrame(self, tag_pos, anchor_pos):
+        # site frame as measured by hand: anchor 0 on its initial position, anchor 0 -> 1 along its initial bearing
+        initial = self.initial_anchor_pos_
+        angle = np.arctan2(*(initial[1] - initial[0])[::-1]) - np.arctan2(*(anchor_pos[1] - anchor_pos[0])[::-1])
+        cos, sin = np.cos(angle), np.sin(angle)
+        rotation = np.array([[cos, sin], [-sin, cos]]) # row vectors: p @ rotation
+        origin = anchor_pos[0]
+        return (tag_pos - origin) @ rotation + initial[0], (anchor_pos - origin) @ rotation + initial[0]
+
+    def optimize(self, ranges, anchor_pos, range_bias):
+        solver = LinearMultilateration()
+        solver.setAnchors(anchor_pos)
+        tag_pos = solver.solveBatch(ranges - range_bias)
+        cost = np.sum(self.computeResidual(tag_pos, anchor_pos, range_bias, ranges)[0] ** 2)
+        damping = 1e-3
+        iterations = 0
+        for iterations in range(1, self.max_iterations_ + 1):
+            new_tag_pos, new_anchor_pos, new_range_bias = self.step(tag_pos, anchor_pos, range_bias, ranges, damping)
+            new_cost = np.sum(self.computeResidual(new_tag_pos, new_anchor_pos, new_range_bias, ranges)[0] ** 2)
+            if new_cost < cost:
+                tag_pos, anchor_pos = self.alignFrame(new_tag_pos, new_anchor_pos)
+                range_bias = new_range_bias
+                converged = cost - new_cost < self.tolerance_ * max(cost, 1e-12)
+                cost = new_cost
+                damping = max(damping * 0.3, 1e-9)
+                if converged:
+                    break
+            else:
+                damping *= 10
+                if damping > 1e6:
+                    break
+        return tag_pos, anchor_pos, range_bias, iterations
+
+    def calibrate(self, range_rows) -> dict:
+        ranges = self.selectRows(range_rows)
+        anchor_num = len(self.initial_anchor_pos_)
+        if len(ranges) < 3 * anchor_num:
+            raise ValueError("not enough range rows to calibrate ({})".format(len(ranges)))
+        range_bias = np.zeros(anchor_num)
+        tag_pos, anchor_pos, range_bias, iterations = self.optimize(ranges, self.initial_anchor_pos_, range_bias)
+
+        # second pass without the rows that do not fit (nlos, multipath)
+        error = self.computeResidual(tag_pos, anchor_pos, range_bias, ranges)[0]
+        row_error = np.sqrt(np.mean(error ** 2, axis=1))
+        mad = np.median(np.abs(error)) * 1.4826
+        inlier = row_error <= max(self.outlier_sigma_ * mad, 1e-3)
+        if np.count_nonzero(inlier) >= 3 * anchor_num and not np.all(inlier):
+            ranges = ranges[inlier]
+            tag_pos, anchor_pos, range_bias, more_iterations = self.optimize(ranges, anchor_pos, range_bias)
+            iterations += more_iterations
+
+        error = self.computeResidual(tag_pos, anchor_pos, range_bias, ranges)[0]
+        return {'anchor_pos': anchor_pos,
+                'range_bias': range_bias,
+                'rms': float(np.sqrt(np.mean(error ** 2))),
+                'rows': len(ranges),
+                'iterations': iterations}
+
+
+if __name__ == "__main__":
+    import argparse
+    from uwb_manager import DEFAULT_ANCHOR_POS
+    from uwb_recorder import UWBLogReader
+
+    arg_parser = argparse.ArgumentParser(prog='uwb-calibration', description='anchor self-calibration from recorded range logs')
+    arg_parser.add_argument('logs', type=str, nargs='+', help='.uwblog files of a walk through the site')
+    arg_parser.add_argument('-o', '--output', type=str, default=SITE_CONFIG_PATH)
+    arg_parser.add_argument('--initial', type=str, default=None, metavar='X,Y;X,Y;X,Y', help='rough anchor layout, defaults to the current site config')
+    arg_parser.add_argument('--no-bias', action='store_true', help='keep the range bias at zero')
+    arg_parser.add_argument('--max-rows', type=int, default=4000)
+    args = arg_parser.parse_args()
+
+    if args.initial is not None:
+        initial_anchor_pos = [[float(v) for v in anchor.split(',')] for anchor in args.initial.split(';')]
+    else:
+        site_config = loadSiteConfig(args.output)
+        initial_anchor_pos = site_config['anchor_pos'] if site_config is not None else DEFAULT_ANCHOR_POS
+
+    range_rows = list()
+    for log_path in args.logs:
+        log_reader = UWBLogReader(log_path)
+        range_rows.append(log_reader.decodeRanges())
+        log_reader.close()
+    range_rows = np.concatenate(range_rows)
+
+    start = time.perf_counter()
+    calibrator = AnchorCalibrator(initial_anchor_pos, estimate_bias = not args.no_bias, max_rows = args.max_rows)
+    result = calibrator.calibrate(range_rows)
+    print("calibrated {} rows in {:.2f} s, {} iterations, rms {:.3f} m".format(
+        result['rows'], time.perf_counter() - start, result['iterations'], result['rms']))
+    for anchor, (position, bias) in enumerate(zip(result['anchor_pos'], result['range_bias'])):
+        print("anchor {}: x {:.3f} y {:.3f} bias {:.3f}".format(anchor, position[0], position[1], bias))
+    info = {'rms': result['rms'], 'rows': result['rows'],
+            'source': [os.path.basename(log_path) for log_path in args.logs],
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    previous_config = loadSiteConfig(args.output)
+    if previous_config is not None and 'zones' in previous_config:
+        info['zones'] = previous_config['zones'] # zones are drawn in the site frame, which the calibration keeps
+    saveSiteConfig(args.output, result['anchor_pos'], result['range_bias'], **info)
+    print("site config written to {}".format(args.output))
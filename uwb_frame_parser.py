@@ -0,0 +1,176 @@
+import struct
+import time
+
+# UWB master output frame (16 bytes), the layout the original readline() decoder relied on
+# [4]      tag id (0x0f for master tag)
+# [7..12]  anchor0..anchor2 range, little endian uint16 in cm
+# [15]     frame tail 0x0a, readline() split on it
+# UWB_HHEV.OS/UWB_manager.cc reads the same fields one byte earlier ([3], [6..11]) from raw read() chunks,
+# and no frame spec is in this tree. A header byte at [0] and a checksum at [14] (sum of [0..13] & 0xff),
+# as written by uwb_simulator.py, are only checked when asked for: header=FRAME_HEADER, check_sum=True.
+FRAME_LENGTH = 16
+FRAME_HEADER = 0x55
+FRAME_TAIL = 0x0a
+MASTER_TAG_ID = 0x0f
+TAG_ID_INDEX = 4
+RANGE_INDEX = 7
+CHECKSUM_INDEX = 14
+
+_RANGE_STRUCT = struct.Struct('<3H')
+
+
+class UWBFrameParser():
+    """ Resynchronizing decoder for the UWB master binary frames """
+
+    def __init__(self, buffer_size = 4096, header = None, check_sum = False):
+
+        self.buffer_ = bytearray(buffer_size)
+        self.buffer_view_ = memoryview(self.buffer_)
+        self.read_pos_ = 0
+        self.write_pos_ = 0
+        self.header_ = header # None: frames are found by their tail, see decodeFrames
+        self.check_sum_ = check_sum
+        self.synced_ = False # read_pos_ follows a decoded frame, the next one is expected right there
+        self.line_start_ = True # read_pos_ follows a 0x0a or starts the stream
+        self.frame_sink_ = None # called with (raw frame view, read stamp) for every valid frame
+        self.read_stamp = 0.0
+
+        self.frame_count = 0
+        self.corrupt_count = 0
+        self.dropped_count = 0
+        self.skipped_bytes = 0
+
+    def readFrom(self, stream) -> list:
+        # bulk read what the driver already holds (up to the free space), block for one byte otherwise
+        free_size = len(self.buffer_) - (self.write_pos_ - self.read_pos_)
+        read_size = getattr(stream, 'in_waiting', None)
+        if read_size is None or read_size > free_size:
+            read_size = free_size
+        raw_data = stream.read(max(read_size, 1))
+        if not raw_data:
+            return []
+        return self.feed(raw_data)
+
+    def feed(self, raw_data) -> list:
+        self.read_stamp = time.monotonic()
+        self.pushBytes(raw_data)
+        return self.decodeFrames()
+
+    def pushBytes(self, raw_data):
+        data_len = len(raw_data)
+        buffer_size = len(self.buffer_)
+        if data_len > buffer_size:
+            # keep only the newest bytes that fit
+            overflow = data_len - buffer_size
+            self.dropped_count += (overflow + self.write_pos_ - self.read_pos_) // FRAME_LENGTH
+            raw_data = memoryview(raw_data)[overflow:]
+            data_len = buffer_size
+            self.read_pos_ = self.write_pos_ = 0
+            self.synced_ = self.line_start_ = False
+        if self.write_pos_ + data_len > buffer_size:
+            self.compact()
+            pending = self.write_pos_ - self.read_pos_
+            if pending + data_len > buffer_size:
+                # consumer fell behind, drop the oldest bytes
+                overflow = pending + data_len - buffer_size
+                self.dropped_count += (overflow + FRAME_LENGTH - 1) // FRAME_LENGTH
+                self.read_pos_ += overflow
+                self.synced_ = self.line_start_ = False
+                self.compact()
+        self.buffer_[self.write_pos_:self.write_pos_ + data_len] = raw_data
+        self.write_pos_ += data_len
+
+    def compact(self):
+        pending = self.write_pos_ - self.read_pos_
+        if self.read_pos_ != 0:
+            self.buffer_[:pending] = self.buffer_view_[self.read_pos_:self.write_pos_]
+        self.read_pos_ = 0
+        self.write_pos_ = pending
+
+    def decodeFrames(self) -> list:
+        frames = list()
+        buffer = self.buffer_
+        pos = self.read_pos_
+        end = self.write_pos_
+        while end - pos >= FRAME_LENGTH:
+            if self.header_ is not None:
+                if buffer[pos] != self.header_:
+                    next_pos = buffer.find(self.header_, pos + 1, end)
+                    if next_pos < 0:
+                        next_pos = end
+                    self.skipped_bytes += next_pos - pos
+                    pos = next_pos
+                    continue
+                if buffer[pos + FRAME_LENGTH - 1] != FRAME_TAIL or not self.checkFrame(pos):
+                    # header byte inside payload or a damaged frame, resync one byte later
+                    self.corrupt_count += 1
+                    self.skipped_bytes += 1
+                    pos += 1
+                    continue
+            elif not self.synced_:
+                # out of sync only a whole 16 byte line counts, like readline(): a 0x0a in the payload loses
+                # the frame, but a window that starts in the wrong phase always holds a real tail and is refused
+                tail_pos = buffer.find(FRAME_TAIL, pos, end)
+                if tail_pos < 0:
+                    self.skipped_bytes += end - pos # longer than a frame, garbage up to the next tail
+                    pos = end
+                    self.line_start_ = False
+                    continue
+                if not self.line_start_ or tail_pos - pos != FRAME_LENGTH - 1 or not self.checkFrame(pos):
+                    self.corrupt_count += 1
+                    self.skipped_bytes += tail_pos + 1 - pos
+                    pos = tail_pos + 1
+                    self.line_start_ = True
+                    continue
+                self.synced_ = True
+            elif buffer[pos + FRAME_LENGTH - 1] != FRAME_TAIL or not self.checkFrame(pos):
+                # the next frame is not where the last one ended, the line from here on is checked out of sync
+                self.synced_ = False
+                self.line_start_ = True
+                continue
+            frames.append(self.decodeFrame(pos))
+            if self.frame_sink_ is not None:
+                self.frame_sink_(self.buffer_view_[pos:pos + FRAME_LENGTH], self.read_stamp)
+            pos += FRAME_LENGTH
+        self.frame_count += len(frames)
+        if pos == end:
+            self.read_pos_ = self.write_pos_ = 0
+        else:
+            self.read_pos_ = pos
+        return frames
+
+    def checkFrame(self, pos) -> bool:
+        if not self.check_sum_:
+            return True
+        return (sum(self.buffer_view_[pos:pos + CHECKSUM_INDEX]) & 0xff) == self.buffer_[pos + CHECKSUM_INDEX]
+
+    def decodeFrame(self, pos) -> list:
+        range0, range1, range2 = _RANGE_STRUCT.unpack_from(self.buffer_, pos + RANGE_INDEX)
+        tag_id = self.buffer_[pos + TAG_ID_INDEX]
+        if tag_id == MASTER_TAG_ID:
+            tag_id = 0
+        return [range0 / 100, range1 / 100, range2 / 100, tag_id]
+
+    def setFrameSink(self, frame_sink):
+        self.frame_sink_ = frame_sink
+
+    def getStats(self) -> dict:
+        return {'frames': self.frame_count,
+                'corrupt': self.corrupt_count,
+                'dropped': self.dropped_count,
+                'skipped_bytes': self.skipped_bytes}
+
+    def reset(self):
+        self.read_pos_ = self.write_pos_ = 0
+        self.synced_ = False
+        self.line_start_ = True
+
+
+def encodeFrame(ranges, tag_id = MASTER_TAG_ID, header = FRAME_HEADER) -> bytes:
+    frame = bytearray(FRAME_LENGTH)
+    frame[0] = header
+    frame[TAG_ID_INDEX] = tag_id
+    _RANGE_STRUCT.pack_into(frame, RANGE_INDEX, *[min(max(int(round(r * 100)), 0), 0xffff) for r in ranges[:3]])
+    frame[CHECKSUM_INDEX] = sum(frame[:CHECKSUM_INDEX]) & 0xff
+    frame[FRAME_LENGTH - 1] = FRAME_TAIL
+    return bytes(frame)
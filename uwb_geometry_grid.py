@@ -0,0 +1,158 @@
+import numpy as np
+
+
+class GeometryGrid():
+    """ Expected ranges and GDOP on a regular grid over the site, built once per anchor layout """
+
+    def __init__(self, anchor_pos_list, resolution = 0.05, margin = 2.0, bin_size = None, bin_slots = 16,
+                 max_error = 0.3):
+
+        self.anchor_pos_ = np.asarray(anchor_pos_list, dtype=np.float64)
+        self.resolution_ = resolution
+        self.max_error_ = max_error # meter, rms range mismatch of a consistent frame
+        self.origin_ = self.anchor_pos_.min(axis=0) - margin
+        self.shape_ = tuple(int(size) for size in np.ceil((self.anchor_pos_.max(axis=0) + margin - self.origin_) / resolution) + 1)
+
+        x = self.origin_[0] + np.arange(self.shape_[0]) * resolution
+        y = self.origin_[1] + np.arange(self.shape_[1]) * resolution
+        self.cell_pos_ = np.stack(np.meshgrid(x, y, indexing='ij'), axis=2).reshape(-1, 2) # (cells, 2), x major
+        delta = self.cell_pos_[:, np.newaxis, :] - self.anchor_pos_
+        dist = np.sqrt(np.sum(delta ** 2, axis=2))
+        self.cell_ranges_ = dist.astype(np.float32) # (cells, anchors)
+        self.gdop_ = computeGDOPBatch(delta, dist).reshape(self.shape_)
+        self.anchor_dist_ = np.sqrt(np.sum((self.anchor_pos_[:, np.newaxis] - self.anchor_pos_) ** 2, axis=2))
+        self.baseline_ = (self.anchor_pos_[1] - self.anchor_pos_[0]) / self.anchor_dist_[0, 1] # unit anchor 0 -> 1
+        self.baseline_normal_ = np.array([-self.baseline_[1], self.baseline_[0]])
+
+        # inverse table: (range 0, range 1) bin -> up to bin_slots cells, range 2.. picks among them
+        self.bin_size_ = bin_size if bin_size is not None else 2 * resolution
+        self.bin_num_ = int(np.ceil(dist[:, :2].max() / self.bin_size_)) + 1
+        self.bin_slots_ = bin_slots
+        bins = np.minimum((dist[:, :2] / self.bin_size_).astype(np.int64), self.bin_num_ - 1)
+        key = bins[:, 0] * self.bin_num_ + bins[:, 1]
+        order = np.argsort(key, kind='stable')
+        sorted_key = key[order]
+        group_start = np.searchsorted(sorted_key, sorted_key, side='left')
+        rank = np.arange(len(order)) - group_start
+        keep = rank < bin_slots
+        self.bin_table_ = np.full(self.bin_num_ * self.bin_num_ * bin_slots, -1, dtype=np.int32)
+        self.bin_table_[sorted_key[keep] * bin_slots + rank[keep]] = order[keep]
+        self.bin_table_ = self.bin_table_.reshape(self.bin_num_, self.bin_num_, bin_slots)
+
+    def cellIndex(self, position_x, position_y):
+        # nearest cell (ix, iy), None outside the grid
+        ix = int(round((position_x - self.origin_[0]) / self.resolution_))
+        iy = int(round((position_y - self.origin_[1]) / self.resolution_))
+        if 0 <= ix < self.shape_[0] and 0 <= iy < self.shape_[1]:
+            return ix, iy
+        return None
+
+    def getGDOP(self, position_x, position_y) -> float:
+        cell = self.cellIndex(position_x, position_y)
+        return float(self.gdop_[cell]) if cell is not None else float('inf')
+
+    def getExpectedRanges(self, position_x, position_y) -> np.ndarray:
+        cell = self.cellIndex(position_x, position_y)
+        if cell is None:
+            return None
+        return self.cell_ranges_[cell[0] * self.shape_[1] + cell[1]]
+
+    def matchRanges(self, ranges):
+        # best cell for a range vector in O(1): (position, rms range error), None when no cell fits the bin
+        ranges = np.asarray(ranges, dtype=np.float64)[:len(self.anchor_pos_)]
+        if len(ranges) < 2 or ranges[0] < 0 or ranges[1] < 0:
+            return None
+        # the 2 x 2 bins around the ranges, so noise near a bin edge still finds the cell
+        bin_0 = max(int(ranges[0] / self.bin_size_ - 0.5), 0)
+        bin_1 = max(int(ranges[1] / self.bin_size_ - 0.5), 0)
+        if bin_0 >= self.bin_num_ or bin_1 >= self.bin_num_:
+            return None
+        cells = self.bin_table_[bin_0:bin_0 + 2, bin_1:bin_1 + 2].reshape(-1)
+        cells = cells[cells >= 0]
+        if len(cells) == 0:
+            return None
+        error = np.sum((self.cell_ranges_[cells, :len(ranges)] - ranges) ** 2, axis=1)
+        best = int(np.argmin(error))
+        return self.cell_pos_[cells[best]], float(np.sqrt(error[best] / len(ranges)))
+
+    def coversRanges(self, ranges) -> bool:
+        # both positions the ranges to anchor 0 and 1 allow lie on the grid, otherwise the grid cannot judge them
+        anchor_dist = self.anchor_dist_[0, 1]
+        along = (ranges[0] ** 2 - ranges[1] ** 2 + anchor_dist ** 2) / (2 * anchor_dist)
+        across = np.sqrt(max(ranges[0] ** 2 - along ** 2, 0.0))
+        base = self.anchor_pos_[0] + along * self.baseline_
+        return all(self.cellIndex(*(base + side * across * self.baseline_normal_)) is not None for side in (1.0, -1.0))
+
+    def initialGuess(self, ranges) -> np.ndarray:
+        if not self.coversRanges(ranges):
+            return None
+        match = self.matchRanges(ranges)
+        if match is None:
+            return None
+        return match[0].copy()
+
+    def checkRanges(self, ranges) -> bool:
+        # cheap rejection before solving: triangle inequality per anchor pair, then the best cell must fit
+        # a tag off the grid (or its mirror across anchor 0 -> 1) is only held to the triangle test
+        ranges = np.asarray(ranges, dtype=np.float64)[:len(self.anchor_pos_)]
+        if np.any(ranges <= 0):
+            return False
+        anchor_dist = self.anchor_dist_[:len(ranges), :len(ranges)]
+        if np.any(np.abs(ranges[:, np.newaxis] - ranges) > anchor_dist + 2 * self.max_error_):
+            return False
+        if not self.coversRanges(ranges):
+            return True
+        match = self.matchRanges(ranges)
+        return match is not None and match[1] <= self.max_error_
+
+    def checkBatch(self, range_rows) -> np.ndarray:
+        # vectorized triangle test for (N, >= anchors) rows, True where a row may be consistent
+        ranges = np.asarray(range_rows, dtype=np.float64)[:, :len(self.anchor_pos_)]
+        anchor_dist = self.anchor_dist_[:ranges.shape[1], :ranges.shape[1]]
+        spread = np.abs(ranges[:, :, np.newaxis] - ranges[:, np.newaxis, :])
+        return np.all(ranges > 0, axis=1) & np.all(spread <= anchor_dist + 2 * self.max_error_, axis=(1, 2))
+
+    def exportGDOP(self, file_path, max_gdop = 10.0):
+        # .pgm: grayscale image (white = low GDOP, row 0 = max y), otherwise .npz with x, y and gdop
+        if file_path.endswith('.pgm'):
+            gdop = np.nan_to_num(np.minimum(self.gdop_, max_gdop), nan=max_gdop, posinf=max_gdop)
+            image = (255 * (1 - gdop / max_gdop)).astype(np.uint8).T[::-1]
+            with open(file_path, 'wb') as f:
+                f.write('P5\n{} {}\n255\n'.format(image.shape[1], image.shape[0]).encode())
+                f.write(image.tobytes())
+        else:
+            np.savez(file_path, x = self.origin_[0] + np.arange(self.shape_[0]) * self.resolution_,
+                     y = self.origin_[1] + np.arange(self.shape_[1]) * self.resolution_,
+                     gdop = self.gdop_, anchor_pos = self.anchor_pos_)
+
+
+def computeGDOPBatch(delta, dist) -> np.ndarray:
+    # uwb_solver.computeGDOP over (N, anchors, 2) offsets
+    H = delta / np.maximum(dist, 1e-9)[:, :, np.newaxis]
+    HtH = np.einsum('nai,naj->nij', H, H)
+    det = HtH[:, 0, 0] * HtH[:, 1, 1] - HtH[:, 0, 1] * HtH[:, 1, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gdop = np.sqrt((HtH[:, 0, 0] + HtH[:, 1, 1]) / det)
+    gdop[det <= 1e-12] = np.inf
+    return gdop
+
+
+if __name__ == "__main__":
+    import argparse
+    from uwb_calibration import SITE_CONFIG_PATH, loadSiteConfig
+    from uwb_manager import DEFAULT_ANCHOR_POS
+
+    arg_parser = argparse.ArgumentParser(prog='uwb-gdop', description='export the GDOP map of the anchor layout')
+    arg_parser.add_argument('output', type=str, help='.pgm image or .npz arrays')
+    arg_parser.add_argument('-c', '--config', type=str, default=SITE_CONFIG_PATH)
+    arg_parser.add_argument('-r', '--resolution', type=float, default=0.05)
+    arg_parser.add_argument('--margin', type=float, default=2.0)
+    args = arg_parser.parse_args()
+
+    site_config = loadSiteConfig(args.config)
+    anchor_pos_list = site_config['anchor_pos'] if site_config is not None else DEFAULT_ANCHOR_POS
+    geometry_grid = GeometryGrid(anchor_pos_list, args.resolution, args.margin)
+    geometry_grid.exportGDOP(args.output)
+    finite = geometry_grid.gdop_[np.isfinite(geometry_grid.gdop_)]
+    print("grid {} cells, GDOP min {:.2f} median {:.2f} max {:.2f}, written to {}".format(
+        geometry_grid.shape_, finite.min(), np.median(finite), finite.max(), args.output))
@@ -0,0 +1,98 @@
+import numpy as np
+import re
+import threading
+import time
+from uwb_tag_table import MAX_TAG_NUM
+
+_TIME_RANGE = re.compile(r'^\[(.*)\.\.(.*)\]$')
+_NOW = re.compile(r'^now\(\s*(-?[0-9.]*)\s*(ms|s|m|h)?\s*\)$')
+_UNIT = {'ms': 1e-3, 's': 1.0, 'm': 60.0, 'h': 3600.0, None: 1.0}
+
+
+class PositionHistory():
+    """ Fixed-size ring of (wall stamp, x, y) per tag, entries older than max_age are dropped on read """
+
+    def __init__(self, capacity = 1024, max_age = 60.0, max_tag_num = MAX_TAG_NUM):
+
+        self.capacity_ = capacity
+        self.max_age_ = max_age
+        self.stamp_ = np.zeros((max_tag_num, capacity))
+        self.position_ = np.zeros((max_tag_num, capacity, 2))
+        self.head_ = np.zeros(max_tag_num, dtype=np.int64) # next write slot
+        self.count_ = np.zeros(max_tag_num, dtype=np.int64)
+        self.lock_ = threading.Lock()
+
+    def add(self, tag_id, position_x, position_y, stamp = None):
+        # stamp: wall clock second (time.time())
+        if stamp is None:
+            stamp = time.time()
+        with self.lock_:
+            head = self.head_[tag_id]
+            self.stamp_[tag_id, head] = stamp
+            self.position_[tag_id, head, 0] = position_x
+            self.position_[tag_id, head, 1] = position_y
+            self.head_[tag_id] = (head + 1) % self.capacity_
+            self.count_[tag_id] = min(self.count_[tag_id] + 1, self.capacity_)
+
+    def query(self, tag_id, start = None, end = None):
+        # (stamps, positions) of tag_id with start <= stamp <= end, oldest first
+        now = time.time()
+        start = now - self.max_age_ if start is None else max(start, now - self.max_age_)
+        end = now if end is None else end
+        with self.lock_:
+            count = self.count_[tag_id]
+            index = (self.head_[tag_id] - count + np.arange(count)) % self.capacity_
+            stamps = self.stamp_[tag_id, index]
+            positions = self.position_[tag_id, index]
+        keep = (stamps >= start) & (stamps <= end)
+        return stamps[keep], positions[keep]
+
+    def getTagIds(self) -> np.ndarray:
+        return np.flatnonzero(self.count_)
+
+    def evict(self, now = None):
+        # forget the tail older than max_age, reads already skip it
+        if now is None:
+            now = time.time()
+        with self.lock_:
+            for tag_id in np.flatnonzero(self.count_):
+                count = self.count_[tag_id]
+                index = (self.head_[tag_id] - count + np.arange(count)) % self.capacity_
+                self.count_[tag_id] = np.count_nonzero(self.stamp_[tag_id, index] >= now - self.max_age_)
+
+
+def parseTimeValue(text, now) -> float:
+    text = text.strip()
+    if not text:
+        return None
+    match = _NOW.match(text)
+    if match is not None:
+        offset = float(match.group(1)) if match.group(1) not in ('', '-') else 0.0
+        return now + offset * _UNIT[match.group(2)]
+    return float(text) # unix second
+
+
+def parseSelector(parameters, now = None, max_tag_num = MAX_TAG_NUM) -> dict:
+    # "_time=[now(-10s)..now()];tag=3" -> {'_time': (start, end), 'tag': 3}, bounds may be None
+    # "near=3;radius=2.0" and "zone=dock" select tags through the spatial index
+    # ValueError for a malformed value or a tag id outside [0, max_tag_num)
+    if now is None:
+        now = time.time()
+    result = dict()
+    for item in str(parameters or '').replace('&', ';').split(';'):
+        key, _, value = item.partition('=')
+        key = key.strip()
+        if key == '_time':
+            match = _TIME_RANGE.match(value.strip())
+            if match is None:
+                raise ValueError("bad time range {}".format(value))
+            result['_time'] = (parseTimeValue(match.group(1), now), parseTimeValue(match.group(2), now))
+        elif key in ('tag', 'near'):
+            result[key] = int(value)
+            if not 0 <= result[key] < max_tag_num:
+                raise ValueError("{} {} out of range".format(key, result[key]))
+        elif key == 'radius':
+            result['radius'] = float(value)
+        elif key == 'zone':
+            result['zone'] = value.strip()
+    return result
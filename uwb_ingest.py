@@ -0,0 +1,388 @@
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+import threading
+import traceback
+import time
+import os
+from uwb_frame_parser import FRAME_HEADER, UWBFrameParser
+from uwb_serial_link import SerialLink
+from uwb_solver import UWBFix
+from uwb_tag_table import TagTable
+from block_queue import BlockQueue
+from uwb_calibration import SITE_CONFIG_PATH
+from uwb_manager import UWBLocalizationSystem
+
+# one solved frame, ranges are the raw measured ranges
+FRAME_RECORD = np.dtype([('stamp', '<f8'),
+                         ('solve_stamp', '<f8'),
+                         ('position', '<f8', (2,)),
+                         ('ranges', '<f4', (3,)),
+                         ('residual', '<f4'),
+                         ('gdop', '<f4'),
+                         ('tag_id', '<u2'),
+                         ('iterations', '<u1'),
+                         ('status', '<u1')])
+
+# record status, index into REJECT_REASONS
+FRAME_SOLVED = 0
+FRAME_INCONSISTENT = 1
+FRAME_REJECTED = 2
+REJECT_REASONS = (None, 'inconsistent', 'rejected')
+
+# ring header slots (uint64)
+WRITE_INDEX = 0
+READ_INDEX = 1
+FRAME_COUNT = 2
+CORRUPT_COUNT = 3
+PARSER_DROPPED = 4
+RING_DROPPED = 5
+WORKER_ALIVE = 6
+HEADER_SLOTS = 16 # two cache lines, read/write index never share one with records
+
+
+class SharedFrameRing():
+    """ Single producer / single consumer ring of decoded frames in shared memory """
+
+    def __init__(self, capacity = 4096, name = None):
+
+        size = HEADER_SLOTS * 8 + capacity * FRAME_RECORD.itemsize
+        self.owner_ = name is None
+        self.shm_ = shared_memory.SharedMemory(name=name, create=self.owner_, size=size if self.owner_ else 0)
+        self.capacity_ = capacity
+        self.header_ = np.ndarray((HEADER_SLOTS,), dtype=np.uint64, buffer=self.shm_.buf)
+        self.records_ = np.ndarray((capacity,), dtype=FRAME_RECORD, buffer=self.shm_.buf, offset=HEADER_SLOTS * 8)
+        if self.owner_:
+            self.header_[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm_.name
+
+    def write(self, records, count_drop = True) -> int:
+        # producer side, records is a FRAME_RECORD array, returns the number written
+        write_index = int(self.header_[WRITE_INDEX])
+        free = self.capacity_ - (write_index - int(self.header_[READ_INDEX]))
+        record_num = min(len(records), free)
+        if record_num > 0:
+            start = write_index % self.capacity_
+            first = min(record_num, self.capacity_ - start)
+            self.records_[start:start + first] = records[:first]
+            self.records_[:record_num - first] = records[first:record_num]
+        if count_drop:
+            self.header_[RING_DROPPED] += len(records) - record_num
+        self.header_[WRITE_INDEX] = write_index + record_num # publish after the records
+        return record_num
+
+    def writeAll(self, records, notify_conn, stop_event):
+        # replay sources wait for the consumer instead of dropping
+        while len(records) and not stop_event.is_set():
+            records = records[self.write(records, count_drop = False):]
+            notify_conn.send_bytes(b'\x01')
+            if len(records):
+                time.sleep(0.001)
+
+    def read(self, max_num = None) -> np.ndarray:
+        # consumer side, returns a copy of the pending records
+        read_index = int(self.header_[READ_INDEX])
+        pending = int(self.header_[WRITE_INDEX]) - read_index
+        if max_num is not None:
+            pending = min(pending, max_num)
+        if pending <= 0:
+            return self.records_[:0].copy()
+        start = read_index % self.capacity_
+        end = start + pending
+        if end <= self.capacity_:
+            records = self.records_[start:end].copy()
+        else:
+            records = np.concatenate((self.records_[start:], self.records_[:end - self.capacity_]))
+        self.header_[READ_INDEX] = read_index + pending
+        return records
+
+    def setStats(self, parser_stats):
+        self.header_[FRAME_COUNT] = parser_stats['frames']
+        self.header_[CORRUPT_COUNT] = parser_stats['corrupt']
+        self.header_[PARSER_DROPPED] = parser_stats['dropped']
+
+    def getStats(self) -> dict:
+        return {'frames': int(self.header_[FRAME_COUNT]),
+                'corrupt': int(self.header_[CORRUPT_COUNT]),
+                'dropped': int(self.header_[PARSER_DROPPED]),
+                'ring_dropped': int(self.header_[RING_DROPPED]),
+                'pending': int(self.header_[WRITE_INDEX] - self.header_[READ_INDEX])}
+
+    def close(self):
+        del self.header_, self.records_
+        self.shm_.close()
+        if self.owner_:
+            self.shm_.unlink()
+
+
+def isReplaySource(source) -> bool:
+    return source.startswith('file:')
+
+
+def openSource(source, baudrate):
+    # "file:<path>" replays a raw byte capture, anything else is a serial device
+    if isReplaySource(source):
+        return open(source[len('file:'):], 'rb')
+    return SerialLink(source, baudrate)
+
+
+class WorkerSource():
+    """ Inert frame source, lets an ingest worker build a UWBLocalizationSystem for its solver stack """
+
+    def __init__(self):
+
+        self.range_table_ = TagTable()
+        self.frame_queue_ = BlockQueue(1)
+
+    def startFetchDistance(self):
+        pass
+
+    def getRangeTable(self) -> TagTable:
+        return self.range_table_
+
+    def getFrameQueue(self) -> BlockQueue:
+        return self.frame_queue_
+
+    def getFrameStats(self) -> dict:
+        return {}
+
+    def closeUWBPort(self):
+        pass
+
+
+def solveFrames(uwb_system, frames, stamp) -> np.ndarray:
+    # range bias, geometry gate and solver of the main process, run next to the decoder
+    rows = list()
+    for tag_data in frames:
+        fix, reject_reason = uwb_system.solveFrame(uwb_system.correctRanges(tag_data))
+        status = REJECT_REASONS.index(reject_reason)
+        if fix is None:
+            rows.append((stamp, 0.0, (0.0, 0.0), tag_data[:3], 0.0, 0.0, tag_data[3], 0, status))
+        else:
+            rows.append((stamp, fix.solve_stamp, (fix.position_x, fix.position_y), tag_data[:3], fix.residual,
+                         fix.gdop, tag_data[3], min(fix.iterations, 255), status))
+    return np.array(rows, dtype=FRAME_RECORD)
+
+
+def ingestWorker(source, baudrate, ring_name, ring_capacity, notify_conn, stop_event,
+                 frame_check = False, site_config = SITE_CONFIG_PATH):
+    ring = SharedFrameRing(ring_capacity, name=ring_name)
+    frame_parser = UWBFrameParser(header = FRAME_HEADER, check_sum = True) if frame_check else UWBFrameParser()
+    try:
+        uwb_system = UWBLocalizationSystem(uwb_manager = WorkerSource(), site_config = site_config)
+        uwb_system.initAnchorPos()
+        stream = openSource(source, baudrate)
+        file_size = None if isinstance(stream, SerialLink) else os.fstat(stream.fileno()).st_size
+        ring.header_[WORKER_ALIVE] = 1
+        while not stop_event.is_set():
+            # a serial link reconnects by itself, the worker stays up while the device is away
+            frames = stream.readFrames(frame_parser) if file_size is None else frame_parser.readFrom(stream)
+            if frames:
+                records = solveFrames(uwb_system, frames, time.monotonic())
+                if file_size is None:
+                    ring.write(records)
+                    notify_conn.send_bytes(b'\x01')
+                else:
+                    ring.writeAll(records, notify_conn, stop_event)
+                ring.setStats(frame_parser.getStats())
+            if file_size is not None and stream.tell() >= file_size:
+                break # end of a replay capture
+        stream.close()
+    except Exception:
+        traceback.print_exc()
+    finally:
+        ring.setStats(frame_parser.getStats())
+        ring.header_[WORKER_ALIVE] = 0
+        notify_conn.send_bytes(b'\x00')
+        notify_conn.close()
+        del ring.header_, ring.records_
+        ring.shm_.close()
+
+
+class IngestSource():
+    """ One ingested port, same interface as UWBManager for UWBLocalizationSystem """
+
+    def __init__(self, ingest_manager, index, source):
+
+        self.ingest_manager_ = ingest_manager
+        self.index_ = index
+        self.source = source
+        self.range_table_ = TagTable() # written by the collector thread only
+        # blocks of solved frames, the collector only reads the ring while there is room here so a slow
+        # localize thread backs up into the ring: live ports count ring_dropped there, replays wait
+        self.frame_queue_ = BlockQueue(self.MAX_PENDING_BLOCKS)
+        self.active_flag_ = False
+
+    MAX_PENDING_BLOCKS = 4
+
+    def startFetchDistance(self):
+        self.active_flag_ = True
+        self.ingest_manager_.start()
+
+    def hasRoom(self) -> bool:
+        return self.frame_queue_.size() < self.MAX_PENDING_BLOCKS
+
+    def pushRecords(self, records):
+        # one queue item per block: [(tag_data, stamp, fix, reject reason), ...]
+        if len(records) == 0:
+            return
+        frames = list()
+        latest = dict()
+        for stamp, solve_stamp, position, ranges, residual, gdop, tag_id, iterations, status in records.tolist():
+            tag_data = list(ranges) + [tag_id]
+            fix = None
+            if status != FRAME_INCONSISTENT:
+                fix = UWBFix(position_x = position[0], position_y = position[1], tag_id = tag_id, residual = residual,
+                             gdop = gdop, iterations = iterations, solve_stamp = solve_stamp)
+            frames.append((tag_data, stamp, fix, REJECT_REASONS[status]))
+            latest[tag_id] = (tag_data, stamp)
+        for tag_id, (tag_data, stamp) in latest.items():
+            self.range_table_.update(tag_id, ranges = tag_data[:3], stamp = stamp)
+        self.frame_queue_.push(frames)
+
+    def getUWBDistance(self, tag_id = None) -> list:
+        if tag_id is None:
+            tag_id = self.range_table_.last_tag_id
+            if tag_id is None:
+                return None
+        return self.range_table_.getRanges(tag_id)
+
+    def getRangeTable(self) -> TagTable:
+        return self.range_table_
+
+    def getFrameQueue(self) -> BlockQueue:
+        return self.frame_queue_
+
+    def getFrameStats(self) -> dict:
+        return self.ingest_manager_.getRing(self.index_).getStats()
+
+    def closeUWBPort(self):
+        self.active_flag_ = False
+        self.frame_queue_.releaseAllCV()
+        self.ingest_manager_.releaseSource(self.index_)
+
+
+class UWBIngestManager():
+    """ Decode and solve N serial ports (or raw captures) in worker processes, one shared-memory ring each """
+
+    def __init__(self, sources = ('/dev/ttyUSB0',), baudrate = 115200, ring_capacity = 4096, frame_check = False,
+                 site_config = SITE_CONFIG_PATH):
+
+        self.baudrate_ = baudrate
+        self.ring_capacity_ = ring_capacity
+        self.frame_check_ = frame_check # header + checksum, passed to the worker parsers
+        self.site_config_ = site_config # each worker loads the anchors and range bias itself
+        self.rings_ = [SharedFrameRing(ring_capacity) for _ in sources]
+        self.sources_ = [IngestSource(self, index, source) for index, source in enumerate(sources)]
+        self.workers_ = list()
+        self.notify_conns_ = list()
+        self.stop_event_ = mp.Event()
+        self.collect_thread_ = None
+        self.active_sources_ = set()
+        self.lock_ = threading.Lock()
+
+    def getSource(self, index) -> IngestSource:
+        return self.sources_[index]
+
+    def getSources(self) -> list:
+        return list(self.sources_)
+
+    def getRing(self, index) -> SharedFrameRing:
+        return self.rings_[index]
+
+    def start(self):
+        with self.lock_:
+            if self.collect_thread_ is not None:
+                return
+            for index, source in enumerate(self.sources_):
+                recv_conn, send_conn = mp.Pipe(duplex=False)
+                worker = mp.Process(target=ingestWorker,
+                                    args=(source.source, self.baudrate_, self.rings_[index].name,
+                                          self.ring_capacity_, send_conn, self.stop_event_, self.frame_check_,
+                                          self.site_config_),
+                                    daemon=True)
+                worker.start()
+                send_conn.close()
+                self.workers_.append(worker)
+                self.notify_conns_.append(recv_conn)
+                self.active_sources_.add(index)
+            self.collect_thread_ = threading.Thread(target=self.collectFrames, daemon=True)
+            self.collect_thread_.start()
+
+    def collectFrames(self):
+        conn_index = {conn: index for index, conn in enumerate(self.notify_conns_)}
+        open_conns = list(self.notify_conns_)
+        backlog = set(range(len(self.sources_))) # rings that may hold records
+        while (open_conns or backlog) and not self.stop_event_.is_set():
+            # poll quickly while a ring waits for room in its source queue
+            for conn in wait(open_conns, timeout=0.005 if backlog else 0.5):
+                try:
+                    while conn.poll():
+                        conn.recv_bytes()
+                except EOFError:
+                    open_conns.remove(conn)
+                backlog.add(conn_index[conn])
+            for index in list(backlog):
+                source = self.sources_[index]
+                if source.hasRoom():
+                    source.pushRecords(self.rings_[index].read(self.ring_capacity_ // source.MAX_PENDING_BLOCKS))
+                if self.rings_[index].getStats()['pending'] == 0:
+                    backlog.discard(index)
+
+    def releaseSource(self, index):
+        with self.lock_:
+            self.active_sources_.discard(index)
+            if self.active_sources_:
+                return
+        self.close()
+
+    def close(self):
+        self.stop_event_.set()
+        for worker in self.workers_:
+            worker.join(1.0)
+            if worker.is_alive():
+                worker.terminate()
+        if self.collect_thread_ is not None:
+            self.collect_thread_.join()
+        for conn in self.notify_conns_:
+            conn.close()
+        for ring in self.rings_:
+            ring.close()
+        self.workers_.clear()
+        self.notify_conns_.clear()
+        print("UWB ingest closed complete")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(prog='uwb-ingest', description='multi port uwb ingestion')
+    arg_parser.add_argument('sources', nargs='+', help='serial device or file:<raw capture>, one per anchor network')
+    arg_parser.add_argument('-b', '--baudrate', type=int, default=115200)
+    arg_parser.add_argument('--frame-check', action='store_true', help='require the frame header and checksum')
+    arg_parser.add_argument('--site-config', default=SITE_CONFIG_PATH, help='calibrated anchors and range bias')
+    args = arg_parser.parse_args()
+
+    ingest_manager = UWBIngestManager(args.sources, args.baudrate, frame_check = args.frame_check,
+                                      site_config = args.site_config)
+    uwb_systems = list()
+    for source in ingest_manager.getSources():
+        uwb_system = UWBLocalizationSystem(uwb_manager = source, site_config = args.site_config)
+        uwb_system.startLocalizeTag()
+        uwb_systems.append(uwb_system)
+    while True:
+        try:
+            cmd = input("CMD: ")
+            if cmd == "q":
+                break
+            for source in ingest_manager.getSources():
+                print(source.source, source.getFrameStats())
+        except Exception as e:
+            traceback.print_exc()
+            break
+    for uwb_system in uwb_systems:
+        uwb_system.closeSystem()
@@ -1,27 +1,51 @@
 import numpy as np
-import serial, time, datetime
+import time, datetime
 import threading
 import traceback
 import math
 import pickle
+from uwb_frame_parser import FRAME_HEADER, UWBFrameParser
+from uwb_serial_link import SerialLink
+from uwb_solver import LinearMultilateration, LevenbergMarquardtSolver
+from uwb_tracker import UWBTracker
+from uwb_tag_table import TagTable
+from block_queue import BlockQueue
+from uwb_recorder import UWBRecorder
+from latency_stats import PipelineStats
+from uwb_calibration import SITE_CONFIG_PATH, loadSiteConfig
+from uwb_geometry_grid import GeometryGrid
+from readiness_events import ReadinessEvents
+from uwb_position_bus import PositionBusWriter
+from uwb_spatial_index import SpatialIndex
+
+DEFAULT_ANCHOR_POS = [[0, 0], [-0.5, 3.65], [-4.34, 1.13]] # anchor 0, 1, 2
 
 class UWBManager():
 
-    def __init__(self):
+    READ_TIME_OUT = 0.1 # second, bounds how long closeUWBPort waits for the reader
 
-        self.serial_port_ = serial.Serial("/dev/ttyUSB0", 115200)
-        self.tag_data = None
-        self.active_flag_ = False
+    def __init__(self, port = "/dev/ttyUSB0", baudrate = 115200, serial_port = None, drop_frames = True, readiness = None,
+                 frame_check = False):
 
-        self.serial_port_.flush()
+        # serial_port: any opened stream with read/in_waiting, e.g. a UWBReplaySource
+        # a device port is reopened with backoff when it stalls or disappears, the reader thread keeps running
+        # frame_check: firmware sends the FRAME_HEADER byte and the checksum, see uwb_frame_parser
+        self.serial_link_ = SerialLink(port, baudrate, serial_port, read_time_out = self.READ_TIME_OUT, readiness = readiness)
+        self.frame_parser_ = UWBFrameParser(header = FRAME_HEADER, check_sum = True) if frame_check else UWBFrameParser()
+        self.recorder_ = None
+        self.range_table_ = TagTable() # written by the update thread only
+        self.frame_queue_ = BlockQueue(64, drop_oldest = drop_frames) # replay sources block instead of dropping
+        self.active_flag_ = False
+        self.thread_update_data = None
   
     def updateSensorData(self):
         while self.active_flag_:
-            if self.serial_port_.is_open:
-                raw_data = self.serial_port_.readline()
-                if len(raw_data) == 16:  # data length should be 16 bytes
-                    self.tag_data = self.processRawData(raw_data)
-                    # print("distace: {} distance: {} distance: {} ".format(self.tag_distance[0], self.tag_distance[1], self.tag_distance[2]))
+            frames = self.serial_link_.readFrames(self.frame_parser_)
+            stamp = time.monotonic()
+            for tag_data in frames:
+                self.range_table_.update(tag_data[3], ranges = tag_data[:3], stamp = stamp)
+                self.frame_queue_.push((tag_data, stamp))
+                # print("distace: {} distance: {} distance: {} ".format(tag_data[0], tag_data[1], tag_data[2]))
             
     def processRawData(self, raw_data) -> list:
         distance_data = [0, 0, 0, 0]  
@@ -37,9 +61,41 @@ class UWBManager():
     def stitchup(self, high_byte, low_byte):
         return float((high_byte * 256 + low_byte) / 100)
     
-    def getUWBDistance(self) -> list:
-        return self.tag_data
+    def getUWBDistance(self, tag_id = None) -> list:
+        if tag_id is None:
+            tag_id = self.range_table_.last_tag_id
+            if tag_id is None:
+                return None
+        return self.range_table_.getRanges(tag_id)
+
+    def getRangeTable(self) -> TagTable:
+        return self.range_table_
+
+    def getFrameQueue(self) -> BlockQueue:
+        return self.frame_queue_
+
+    def getFrameStats(self) -> dict:
+        stats = self.frame_parser_.getStats()
+        stats['link'] = self.serial_link_.getStats()
+        return stats
+
+    def getSerialLink(self) -> SerialLink:
+        return self.serial_link_
     
+    def startRecording(self, file_path):
+        self.stopRecording()
+        self.recorder_ = UWBRecorder(file_path)
+        self.frame_parser_.setFrameSink(self.recorder_.recordFrame)
+
+    def stopRecording(self):
+        recorder = self.recorder_
+        if recorder is None:
+            return
+        self.frame_parser_.setFrameSink(None)
+        self.recorder_ = None
+        recorder.close()
+        print("UWB frames recorded: {} {}".format(recorder.file_path, recorder.record_count))
+
     def startFetchDistance(self):
         self.active_flag_ = True
         self.thread_update_data= threading.Thread(
@@ -50,23 +106,46 @@ class UWBManager():
 
     def closeUWBPort(self):
         self.active_flag_ = False
-        self.serial_port_.close()
-        if not self.serial_port_.is_open:
-            print("UWB port closed complete")
+        self.frame_queue_.releaseAllCV()
+        self.stopRecording()
+        # let the reader return from read() before the port goes away under it
+        if self.thread_update_data is not None and threading.current_thread() is not self.thread_update_data:
+            self.thread_update_data.join(self.READ_TIME_OUT * 5)
+        self.serial_link_.close()
+        print("UWB port closed complete")
 
 class UWBLocalizationSystem():
 
-    def __init__(self):
-        self.uwb_manager_ = UWBManager()
+    def __init__(self, solver = None, uwb_manager = None, site_config = SITE_CONFIG_PATH, readiness = None):
+        # readiness: shared with the uwb manager and the publisher, marks first_frame and first_fix here
+        self.readiness_ = readiness if readiness is not None else ReadinessEvents()
+        self.uwb_manager_ = uwb_manager if uwb_manager is not None else UWBManager(readiness = self.readiness_)
         self.uwb_is_active_ = False
 
-        self.tag_data = None
+        self.tag_table_ = TagTable() # written by the localize thread only
+        self.tag_fix = dict()
+        self.range_seq_ = self.uwb_manager_.getRangeTable().getSeq()
         self.anchor_pos_list = list() # max 4 anchor pos
+        self.site_config_path_ = site_config # calibrated anchors, DEFAULT_ANCHOR_POS when missing
+        self.range_bias_ = None # per anchor, subtracted from the measured ranges
+        self.geometry_grid_ = None # built by initAnchorPos, gates frames and seeds the solver
+        self.mle_solver_ = LinearMultilateration() # batch engine for recorded data
+        self.solver_ = solver if solver is not None else LevenbergMarquardtSolver()
+        self.rejected_fix_count = 0
+        self.verbose = True
+        self.tracker_ = UWBTracker()
+        self.fix_queue_ = BlockQueue(64, drop_oldest = True)
+        self.position_bus_ = None # optional shared-memory copy of the tracker state for local readers
+        self.spatial_index_ = SpatialIndex() # filtered positions on a grid hash, proximity / zone queries and events
+        self.stats_ = PipelineStats() # written by the localize thread only
         self.save_pos_x = list()
         self.save_pos_y = list()
         self.time_out_count = 0
         self.MAX_ANCHOR_NUM = 4
-        self.TIME_OUT_COUNT = 200
+        self.TIME_OUT_COUNT = 4
+        self.FRAME_TIME_OUT = 0.5 # second, wait per frame before counting a time out
+        self.MAX_FIX_RESIDUAL = 0.5 # meter
+        self.MAX_FIX_GDOP = 10.0
         self.activateUWBManager()
     
     def activateUWBManager(self):
@@ -74,25 +153,85 @@ class UWBLocalizationSystem():
         self.uwb_is_active_ = True
 
     def caculateTagPosition(self):
-        tag_data = self.uwb_manager_.getUWBDistance()
-        if tag_data is None:
+        range_table = self.uwb_manager_.getRangeTable()
+        if range_table.last_tag_id is None:
             return False
-        if not any(tag_data) == 0:
-            self.processMLE(tag_data)
+        for tag_id in range_table.getUpdatedTags(self.range_seq_):
+            record = range_table.read(tag_id)
+            if record is None:
+                continue
+            tag_data = record[0] + [int(tag_id)]
+            if not any(tag_data) == 0:
+                self.processMLE(tag_data, record[2])
         return True
     
-    def processMLE(self, tag_dis):
-        A = np.array([[2 * (self.anchor_pos_list[0][0] - self.anchor_pos_list[-1][0]),2 * (self.anchor_pos_list[0][1] - self.anchor_pos_list[-1][1])],
-                      [2 * (self.anchor_pos_list[1][0] - self.anchor_pos_list[-1][0]),2 * (self.anchor_pos_list[1][1] - self.anchor_pos_list[-1][1])]])
-        b = np.array([[pow(self.anchor_pos_list[0][0],2) - pow(self.anchor_pos_list[-1][0],2) + pow(self.anchor_pos_list[0][1],2) - pow(self.anchor_pos_list[-1][1],2) + pow(tag_dis[2],2) - pow(tag_dis[0],2)],
-                      [pow(self.anchor_pos_list[1][0],2) - pow(self.anchor_pos_list[-1][0],2) + pow(self.anchor_pos_list[1][1],2) - pow(self.anchor_pos_list[-1][1],2) + pow(tag_dis[2],2) - pow(tag_dis[1],2)]])
-        temp_X = np.dot(np.linalg.inv(np.dot(A.T,A)),A.T) 
-        X = np.dot(temp_X, b)
-        self.tag_data =  [X.T[0,0], X.T[0,1], tag_dis[3]]
-        print("tag X: {} Y: {} ID: {}".format(self.tag_data[0], self.tag_data[1], self.tag_data[2]))
+    def processMLE(self, tag_dis, stamp = None):
+        if stamp is None:
+            stamp = time.monotonic()
+        tag_dis = self.correctRanges(tag_dis)
+        fix, reject_reason = self.solveFrame(tag_dis)
+        self.processFix(fix, reject_reason, tag_dis[:-1], stamp)
+
+    def correctRanges(self, tag_dis) -> list:
+        if self.range_bias_ is None:
+            return tag_dis
+        return [distance - bias for distance, bias in zip(tag_dis[:-1], self.range_bias_)] + [tag_dis[-1]]
+
+    def solveFrame(self, tag_dis):
+        # geometry gate and solver on corrected ranges, also run inside the ingest workers
+        # (fix, None), (fix, 'rejected') on a residual / GDOP above the limits, (None, 'inconsistent')
+        if self.geometry_grid_ is not None and not self.geometry_grid_.checkRanges(tag_dis[:-1]):
+            return None, 'inconsistent'
+        fix = self.solver_.solve(tag_dis)
+        fix.solve_stamp = time.monotonic()
+        if fix.residual > self.MAX_FIX_RESIDUAL or fix.gdop > self.MAX_FIX_GDOP:
+            return fix, 'rejected'
+        return fix, None
+
+    def processFix(self, fix, reject_reason, ranges, stamp):
+        # tracking, position bus, spatial index and the fix queue for a solved frame
+        if fix is not None:
+            self.stats_.record('frame_to_solve', fix.solve_stamp - stamp)
+        if reject_reason is not None:
+            self.rejected_fix_count += 1
+            self.stats_.count(reject_reason)
+            return
+        self.stats_.count('fixes')
+        self.readiness_.set('first_fix', fix.solve_stamp)
+        fix.stamp = stamp
+        self.tag_fix[fix.tag_id] = fix
+        self.tag_table_.update(fix.tag_id, ranges = ranges, position = (fix.position_x, fix.position_y), stamp = stamp)
+        self.tracker_.update(fix.tag_id, fix.position_x, fix.position_y, stamp, fix.gdop)
+        state = self.tracker_.getState(fix.tag_id)
+        if self.position_bus_ is not None:
+            self.position_bus_.write(fix.tag_id, state[0], state[1], state[2], state[3], state[4], fix.gdop)
+        self.fix_queue_.push(('fix', fix))
+        self.pushZoneEvents(self.spatial_index_.update(fix.tag_id, state[0], state[1], stamp))
+        if self.verbose:
+            print("tag X: {} Y: {} ID: {}".format(fix.position_x, fix.position_y, fix.tag_id))
         # For Data Collect 
-        # self.save_pos_x.append(self.tag_data[0])
-        # self.save_pos_y.append(self.tag_data[1])
+        # self.save_pos_x.append(fix.position_x)
+        # self.save_pos_y.append(fix.position_y)
+
+    def pushZoneEvents(self, events):
+        # zone enter / exit go through the fix queue, so consumers see them in order with the fixes
+        for event in events:
+            self.stats_.count('zone_enter' if event.entered else 'zone_exit')
+            self.fix_queue_.push(('zone', event))
+
+    def expireTags(self, stamp = None):
+        # tags without fixes leave the spatial index and their zones
+        self.pushZoneEvents(self.spatial_index_.expire(stamp))
+
+    def processBatchMLE(self, range_rows) -> np.ndarray:
+        # range_rows: (N, anchors + 1) rows of [ranges..., tag id], e.g. a recorded log
+        range_rows = np.array(range_rows, dtype=np.float64)
+        if self.range_bias_ is not None:
+            range_rows[:, :len(self.range_bias_)] -= self.range_bias_
+        tag_pos = np.empty((len(range_rows), 3))
+        tag_pos[:, :2] = self.mle_solver_.solveBatch(range_rows)
+        tag_pos[:, 2] = range_rows[:, -1]
+        return tag_pos
 
     def setAanchorPos(self, anchor_x, anchor_y):
         if len(self.anchor_pos_list) < self.MAX_ANCHOR_NUM:
@@ -100,35 +239,125 @@ class UWBLocalizationSystem():
             anchor_pos[0] = anchor_x
             anchor_pos[1] = anchor_y
             self.anchor_pos_list.append(anchor_pos)
+            self.mle_solver_.setAnchors(self.anchor_pos_list)
+            self.solver_.setAnchors(self.anchor_pos_list)
         else:
             print("Anchor pos num out of range")
 
-    def getTagPosition(self):
-        if self.tag_data is not None:
-            return self.tag_data
-        else:
-            self.tag_data = [0, 0, 0]
-            return self.tag_data
+    def setSolver(self, solver):
+        solver.setAnchors(self.anchor_pos_list)
+        if self.geometry_grid_ is not None and hasattr(solver, 'setGeometryGrid'):
+            solver.setGeometryGrid(self.geometry_grid_)
+        self.solver_ = solver
+
+    def buildGeometryGrid(self, resolution = 0.05, margin = 2.0):
+        # expected ranges / GDOP over the site, rebuild after the anchors change
+        if len(self.anchor_pos_list) < 3:
+            return
+        self.geometry_grid_ = GeometryGrid(self.anchor_pos_list, resolution, margin)
+        if hasattr(self.solver_, 'setGeometryGrid'):
+            self.solver_.setGeometryGrid(self.geometry_grid_)
+
+    def openPositionBus(self, path = None):
+        # call before startLocalizeTag, the localize thread is the only writer
+        self.position_bus_ = PositionBusWriter(path) if path is not None else PositionBusWriter()
+        print("UWB position bus: {}".format(self.position_bus_.path))
+
+    def getReadiness(self) -> ReadinessEvents:
+        return self.readiness_
+
+    def getGeometryGrid(self) -> GeometryGrid:
+        return self.geometry_grid_
+
+    def getSpatialIndex(self) -> SpatialIndex:
+        return self.spatial_index_
+
+    def getTagFix(self, tag_id = None):
+        if tag_id is None:
+            tag_id = self.tag_table_.last_tag_id
+        return self.tag_fix.get(tag_id)
+
+    def setFixQueue(self, fix_queue):
+        # consumers may share one queue between fixes and their own events
+        self.fix_queue_ = fix_queue
+
+    def getFixQueue(self) -> BlockQueue:
+        return self.fix_queue_
+
+    def getTagTable(self) -> TagTable:
+        return self.tag_table_
+
+    def getStats(self) -> dict:
+        # counters (fixes, rejected, timeouts, queue drops), latency histograms and serial frame stats
+        stats = self.stats_.getStats()
+        stats['counters']['frame_queue_dropped'] = self.uwb_manager_.getFrameQueue().dropped_count
+        stats['counters']['fix_queue_dropped'] = self.fix_queue_.dropped_count
+        stats['frames'] = self.uwb_manager_.getFrameStats()
+        return stats
+
+    def getTagIds(self, max_age = None) -> list:
+        return self.tag_table_.getActiveTags(max_age).tolist()
+
+    def getTagPosition(self, tag_id = None, stamp = None):
+        # filtered position extrapolated to stamp (time.monotonic()), None before the first fix
+        if tag_id is None:
+            tag_id = self.tag_table_.last_tag_id
+            if tag_id is None:
+                return None
+        position = self.tracker_.getPosition(tag_id, stamp)
+        if position is None:
+            return None
+        return [position[0], position[1], tag_id]
     
     def processLoop(self):
+        frame_queue = self.uwb_manager_.getFrameQueue()
         while not self.stop_localize_thread_:
-            connect_ok = self.caculateTagPosition()
-            if not connect_ok:
-                self.checkTimeOut()
-            time.sleep(0.01)
+            item = frame_queue.pop(timeout = self.FRAME_TIME_OUT)
+            self.expireTags()
+            if item is None:
+                if not frame_queue.isReleased():
+                    self.checkTimeOut()
+                continue
+            if self.time_out_count >= self.TIME_OUT_COUNT:
+                print(" UWB Master Connection Restored ")
+            self.time_out_count = 0
+            if isinstance(item, list):
+                # a block an ingest worker already solved: [(tag_data, stamp, fix, reject reason), ...]
+                self.readiness_.set('first_frame', item[0][1])
+                for tag_data, stamp, fix, reject_reason in item:
+                    self.processFix(fix, reject_reason, self.correctRanges(tag_data)[:-1], stamp)
+                continue
+            tag_data, stamp = item
+            self.readiness_.set('first_frame', stamp)
+            if not any(tag_data) == 0:
+                self.processMLE(tag_data, stamp)
     
     def checkTimeOut(self):
+        # the uwb manager reconnects on its own, the solver and the fix consumers keep running
         self.time_out_count += 1
+        self.stats_.count('timeouts')
         if self.time_out_count == self.TIME_OUT_COUNT:
-            self.closeSystem()
+            self.stats_.count('connection_lost')
             print(" UWB Master Connection Lost ")
 
     
+    def initAnchorPos(self):
+        anchor_pos_list = DEFAULT_ANCHOR_POS
+        site_config = loadSiteConfig(self.site_config_path_)
+        if site_config is not None:
+            anchor_pos_list = site_config['anchor_pos']
+            if any(site_config['range_bias']):
+                self.range_bias_ = list(site_config['range_bias'])
+            for name, polygon in site_config.get('zones', {}).items():
+                self.spatial_index_.addZone(name, polygon)
+            print("UWB site config loaded: {}".format(self.site_config_path_))
+        for anchor_x, anchor_y in anchor_pos_list:
+            self.setAanchorPos(anchor_x, anchor_y)
+        self.buildGeometryGrid()
+
     def startLocalizeTag(self):
         if self.uwb_is_active_:
-            self.setAanchorPos(0,0) # anchor 0
-            self.setAanchorPos(-0.5, 3.65) # anchor 1
-            self.setAanchorPos(-4.34, 1.13) # anchor 2
+            self.initAnchorPos()
             self.stop_localize_thread_ = False
             self.track_data_thread = threading.Thread(
                 target=self.processLoop,
@@ -151,6 +380,12 @@ class UWBLocalizationSystem():
     def closeSystem(self):
         self.stop_localize_thread_ = True
         self.uwb_manager_.closeUWBPort()
+        track_data_thread = getattr(self, 'track_data_thread', None)
+        if track_data_thread is not None and threading.current_thread() is not track_data_thread:
+            track_data_thread.join()
+        if self.position_bus_ is not None:
+            self.position_bus_.close()
+            self.position_bus_ = None
     
 
         
@@ -165,6 +400,10 @@ if __name__ == "__main__":
             if cmd == "q":
                 manager.saveData()
                 break
+            elif cmd == "r":
+                manager.uwb_manager_.startRecording(datetime.datetime.now().strftime("./data/%Y-%m-%d_%H%M%S.uwblog"))
+            elif cmd == "s":
+                manager.uwb_manager_.stopRecording()
         except Exception as e:
             traceback.print_exc()
             break
@@ -0,0 +1,176 @@
+import numpy as np
+import mmap
+import os
+import struct
+import time
+from uwb_tag_table import MAX_TAG_NUM
+
+POSITION_BUS_PATH = '/dev/shm/uwb_position_bus'
+POSITION_BUS_MAGIC = 0x5355425f42575521 # "!UWB_BUS" little endian
+POSITION_BUS_LAYOUT = 1
+
+# one cache line per tag, version is odd while the writer is inside the record
+POSITION_RECORD = np.dtype([('version', '<u8'),
+                            ('seq', '<u8'),
+                            ('stamp', '<f8'), # time.monotonic() of the fix, same clock in every process
+                            ('position', '<f8', (2,)),
+                            ('velocity', '<f8', (2,)),
+                            ('gdop', '<f4'),
+                            ('tag_id', '<u4')])
+
+# header slots (uint64)
+MAGIC = 0
+LAYOUT = 1
+TAG_NUM = 2
+WRITE_COUNT = 3
+WRITER_PID = 4
+WRITER_ALIVE = 5
+HEADER_SLOTS = 8
+RECORD_OFFSET = HEADER_SLOTS * 8
+BUS_SIZE = RECORD_OFFSET + MAX_TAG_NUM * POSITION_RECORD.itemsize
+
+_VERSION_STRUCT = struct.Struct('<Q')
+_RECORD_STRUCT = struct.Struct('<QQ5dfI') # POSITION_RECORD, read without numpy on the hot path
+
+
+class PositionBusWriter():
+    """ Latest filtered position per tag in a memory-mapped file, one writer process """
+
+    def __init__(self, path = POSITION_BUS_PATH):
+
+        # the file is reused across restarts, so readers that mapped it keep working
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != BUS_SIZE:
+                os.ftruncate(fd, BUS_SIZE)
+            self.mmap_ = mmap.mmap(fd, BUS_SIZE, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        self.header_ = np.ndarray((HEADER_SLOTS,), dtype=np.uint64, buffer=self.mmap_)
+        self.records_ = np.ndarray((MAX_TAG_NUM,), dtype=POSITION_RECORD, buffer=self.mmap_, offset=RECORD_OFFSET)
+        self.version_ = self.records_['version']
+        self.seq_ = self.records_['seq']
+        self.stamp_ = self.records_['stamp']
+        self.position_ = self.records_['position']
+        self.velocity_ = self.records_['velocity']
+        self.gdop_ = self.records_['gdop']
+
+        self.header_[WRITER_ALIVE] = 0
+        self.version_ |= 1 # a reader caught in a stale record retries until the reset below is done
+        self.seq_[:] = 0
+        self.records_['tag_id'] = np.arange(MAX_TAG_NUM)
+        self.version_ += 1
+        self.header_[MAGIC] = POSITION_BUS_MAGIC
+        self.header_[LAYOUT] = POSITION_BUS_LAYOUT
+        self.header_[TAG_NUM] = MAX_TAG_NUM
+        self.header_[WRITER_PID] = os.getpid()
+        self.header_[WRITER_ALIVE] = 1
+
+    def write(self, tag_id, position_x, position_y, vel_x = 0.0, vel_y = 0.0, stamp = None, gdop = 1.0):
+        # single writer thread, no lock
+        if stamp is None:
+            stamp = time.monotonic()
+        self.version_[tag_id] += 1
+        self.position_[tag_id] = (position_x, position_y)
+        self.velocity_[tag_id] = (vel_x, vel_y)
+        self.stamp_[tag_id] = stamp
+        self.gdop_[tag_id] = gdop
+        self.seq_[tag_id] += 1
+        self.version_[tag_id] += 1
+        self.header_[WRITE_COUNT] += 1
+
+    def close(self):
+        # the file stays, readers see the writer gone and keep the last positions
+        self.header_[WRITER_ALIVE] = 0
+        del self.header_, self.records_, self.version_, self.seq_, self.stamp_, self.position_, self.velocity_, self.gdop_
+        self.mmap_.close()
+
+
+class PositionBusReader():
+    """ Read side of PositionBusWriter, a seqlock read of one record takes a few microseconds """
+
+    MAX_RETRY = 10000 # a writer killed inside a record leaves it odd
+
+    def __init__(self, path = POSITION_BUS_PATH):
+
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap_ = mmap.mmap(f.fileno(), BUS_SIZE, mmap.MAP_SHARED, mmap.PROT_READ)
+        self.header_ = np.ndarray((HEADER_SLOTS,), dtype=np.uint64, buffer=self.mmap_)
+        if self.header_[MAGIC] != POSITION_BUS_MAGIC or self.header_[LAYOUT] != POSITION_BUS_LAYOUT:
+            self.mmap_.close()
+            raise ValueError("{} is not a uwb position bus (layout {})".format(path, POSITION_BUS_LAYOUT))
+        self.records_ = np.ndarray((MAX_TAG_NUM,), dtype=POSITION_RECORD, buffer=self.mmap_, offset=RECORD_OFFSET)
+        self.seq_ = self.records_['seq']
+
+    def read(self, tag_id):
+        # returns (x, y, vel_x, vel_y, stamp, gdop, seq) or None if the tag was never written
+        offset = RECORD_OFFSET + tag_id * POSITION_RECORD.itemsize
+        for _ in range(self.MAX_RETRY):
+            version = _VERSION_STRUCT.unpack_from(self.mmap_, offset)[0]
+            if version & 1:
+                continue
+            _, seq, stamp, position_x, position_y, vel_x, vel_y, gdop, _ = _RECORD_STRUCT.unpack_from(self.mmap_, offset)
+            if _VERSION_STRUCT.unpack_from(self.mmap_, offset)[0] == version:
+                if seq == 0:
+                    return None
+                return position_x, position_y, vel_x, vel_y, stamp, gdop, seq
+        return None
+
+    def getPosition(self, tag_id, stamp = None, max_age = 2.0):
+        # [x, y, tag_id] extrapolated to stamp (time.monotonic()) like UWBLocalizationSystem.getTagPosition
+        record = self.read(tag_id)
+        if record is None:
+            return None
+        if stamp is None:
+            stamp = time.monotonic()
+        dt = stamp - record[4]
+        if max_age is not None and dt > max_age:
+            return None
+        return [record[0] + record[2] * dt, record[1] + record[3] * dt, tag_id]
+
+    def getTagIds(self) -> list:
+        return np.flatnonzero(self.seq_ > 0).tolist()
+
+    def getUpdatedTags(self, last_seq) -> np.ndarray:
+        # tag ids written since last_seq (start with np.zeros(MAX_TAG_NUM, np.uint64)), refreshed in place
+        seq = self.seq_.copy()
+        updated = np.flatnonzero(seq != last_seq)
+        last_seq[updated] = seq[updated]
+        return updated
+
+    def getWriteCount(self) -> int:
+        return int(self.header_[WRITE_COUNT])
+
+    def isWriterAlive(self) -> bool:
+        return bool(self.header_[WRITER_ALIVE])
+
+    def close(self):
+        del self.header_, self.records_, self.seq_
+        self.mmap_.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(prog='uwb-position-bus', description='print positions from the local uwb position bus')
+    arg_parser.add_argument('-p', '--path', type=str, default=POSITION_BUS_PATH)
+    arg_parser.add_argument('-r', '--rate', type=float, default=10.0, metavar='HZ')
+    args = arg_parser.parse_args()
+
+    reader = PositionBusReader(args.path)
+    try:
+        while True:
+            stamp = time.monotonic()
+            for tag_id in reader.getTagIds():
+                position = reader.getPosition(tag_id, stamp)
+                if position is not None:
+                    print("tag X: {:.3f} Y: {:.3f} ID: {}".format(*position))
+            if not reader.isWriterAlive():
+                print("writer stopped, last positions above")
+                break
+            time.sleep(1.0 / args.rate)
+    except KeyboardInterrupt:
+        pass
+    reader.close()
@@ -0,0 +1,89 @@
+import numpy as np
+import time
+from uwb_tag_table import MAX_TAG_NUM
+
+
+class PublishPolicy():
+    """ Per tag publish decision: dead-band on the filtered position, max / min rate and a fleet-wide heartbeat """
+
+    def __init__(self, dead_band = 0.0, max_rate = 0.0, min_rate = 0.0, heartbeat = 0.0, max_tag_num = MAX_TAG_NUM):
+
+        # every limit at 0 publishes each fix, as before
+        self.dead_band_ = dead_band # meter moved since the last published position
+        self.min_period_ = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.max_period_ = 1.0 / min_rate if min_rate > 0 else float('inf') # a still tag is republished this often
+        self.heartbeat_ = heartbeat # second, every known tag is republished even without fixes
+        self.heartbeat_deadline_ = None
+        self.last_position_ = np.zeros((max_tag_num, 2))
+        self.last_stamp_ = np.full(max_tag_num, -np.inf) # time.monotonic() of the last publish
+        self.pending_ = dict() # tag id -> (deadline, position_x, position_y, fix), latest fix held back by max_rate
+
+        self.published_count = 0
+        self.dead_band_count = 0
+        self.rate_count = 0
+        self.heartbeat_count = 0
+
+    def check(self, tag_id, position_x, position_y, now = None, fix = None) -> bool:
+        # True when the fix should go out, the tag then counts as published
+        # a fix inside the max_rate interval is held and handed out by releaseDue once the interval ends
+        if now is None:
+            now = time.monotonic()
+        if self.pending_.pop(tag_id, None) is not None:
+            self.rate_count += 1 # superseded by this fix
+        elapsed = now - self.last_stamp_[tag_id]
+        if elapsed < self.min_period_:
+            self.pending_[tag_id] = (self.last_stamp_[tag_id] + self.min_period_, position_x, position_y, fix)
+            return False
+        return self.checkDeadBand(tag_id, position_x, position_y, now, elapsed)
+
+    def checkDeadBand(self, tag_id, position_x, position_y, now, elapsed) -> bool:
+        if elapsed < self.max_period_:
+            last_x, last_y = self.last_position_[tag_id]
+            if (position_x - last_x) ** 2 + (position_y - last_y) ** 2 < self.dead_band_ ** 2:
+                self.dead_band_count += 1
+                return False
+        self.last_position_[tag_id] = (position_x, position_y)
+        self.last_stamp_[tag_id] = now
+        self.published_count += 1
+        return True
+
+    def getPendingDeadline(self):
+        # time.monotonic() when the next held fix is due, None when none is held
+        if not self.pending_:
+            return None
+        return min(pending[0] for pending in self.pending_.values())
+
+    def releaseDue(self, now = None) -> list:
+        # [(fix, position_x, position_y), ...] of the held fixes whose interval ended and that pass the dead-band
+        if now is None:
+            now = time.monotonic()
+        released = list()
+        for tag_id in [tag_id for tag_id, pending in self.pending_.items() if pending[0] <= now]:
+            _, position_x, position_y, fix = self.pending_.pop(tag_id)
+            if self.checkDeadBand(tag_id, position_x, position_y, now, now - self.last_stamp_[tag_id]):
+                released.append((fix, position_x, position_y))
+        return released
+
+    def getHeartbeatDeadline(self):
+        # time.monotonic() of the next heartbeat, None when disabled
+        if self.heartbeat_ <= 0:
+            return None
+        if self.heartbeat_deadline_ is None:
+            self.heartbeat_deadline_ = time.monotonic() + self.heartbeat_
+        return self.heartbeat_deadline_
+
+    def heartbeatDue(self, now = None) -> bool:
+        deadline = self.getHeartbeatDeadline()
+        if now is None:
+            now = time.monotonic()
+        if deadline is None or now < deadline:
+            return False
+        self.heartbeat_deadline_ = now + self.heartbeat_
+        self.heartbeat_count += 1
+        return True
+
+    def getStats(self) -> dict:
+        return {'published': self.published_count,
+                'suppressed_dead_band': self.dead_band_count,
+                'suppressed_rate': self.rate_count,
+                'heartbeats': self.heartbeat_count}
@@ -0,0 +1,198 @@
+import numpy as np
+import mmap
+import struct
+import threading
+import time
+from block_queue import BlockQueue
+from uwb_frame_parser import FRAME_LENGTH, UWBFrameParser
+
+# file header: magic, record size, frame length
+LOG_MAGIC = b'UWBLOG01'
+LOG_HEADER = struct.Struct('<8sII')
+# record: monotonic receive stamp (second), raw serial frame
+LOG_RECORD = struct.Struct('<d{}s'.format(FRAME_LENGTH))
+LOG_RECORD_DTYPE = np.dtype([('stamp', '<f8'), ('frame', 'u1', (FRAME_LENGTH,))])
+
+
+class UWBRecorder():
+    """ Append-only fixed-record log of raw frames, file IO runs on its own thread """
+
+    def __init__(self, file_path, chunk_records = 256, flush_interval = 0.5, max_pending_chunks = 64):
+
+        self.file_path = file_path
+        self.chunk_size_ = chunk_records * LOG_RECORD.size
+        self.flush_interval_ = flush_interval
+        self.chunk_ = bytearray(self.chunk_size_)
+        self.chunk_pos_ = 0
+        self.chunk_stamp_ = time.monotonic()
+        self.chunk_queue_ = BlockQueue(max_pending_chunks, drop_oldest = True)
+        self.free_chunks_ = BlockQueue(max_pending_chunks + 2, drop_oldest = True)
+        self.record_count = 0
+        self.lock_ = threading.Lock() # uncontended except while closing
+
+        self.log_file_ = open(file_path, 'ab')
+        if self.log_file_.tell() == 0:
+            self.log_file_.write(LOG_HEADER.pack(LOG_MAGIC, LOG_RECORD.size, FRAME_LENGTH))
+        self.write_thread_ = threading.Thread(target=self.writeLoop, daemon=True)
+        self.write_thread_.start()
+
+    def recordFrame(self, raw_frame, stamp):
+        # called on the reader thread, never touches the file
+        with self.lock_:
+            if self.chunk_ is None:
+                return
+            LOG_RECORD.pack_into(self.chunk_, self.chunk_pos_, stamp, bytes(raw_frame))
+            self.chunk_pos_ += LOG_RECORD.size
+            self.record_count += 1
+            if self.chunk_pos_ == self.chunk_size_ or stamp - self.chunk_stamp_ > self.flush_interval_:
+                self.swapChunk(stamp)
+
+    def swapChunk(self, stamp):
+        self.chunk_queue_.push(memoryview(self.chunk_)[:self.chunk_pos_])
+        chunk = self.free_chunks_.pop(timeout = 0)
+        self.chunk_ = chunk if chunk is not None else bytearray(self.chunk_size_)
+        self.chunk_pos_ = 0
+        self.chunk_stamp_ = stamp
+
+    def writeLoop(self):
+        while True:
+            chunk = self.chunk_queue_.pop()
+            if chunk is None:
+                break
+            self.log_file_.write(chunk)
+            self.log_file_.flush()
+            buffer = chunk.obj
+            chunk.release()
+            self.free_chunks_.push(buffer)
+
+    def getDroppedCount(self) -> int:
+        return self.chunk_queue_.dropped_count * (self.chunk_size_ // LOG_RECORD.size)
+
+    def close(self):
+        with self.lock_:
+            if self.chunk_ is None:
+                return
+            if self.chunk_pos_ > 0:
+                self.swapChunk(time.monotonic())
+            self.chunk_ = None
+        self.chunk_queue_.releaseAllCV()
+        self.write_thread_.join()
+        self.log_file_.close()
+
+
+class UWBLogReader():
+    """ Memory-mapped view of a recorded log """
+
+    def __init__(self, file_path):
+
+        self.log_file_ = open(file_path, 'rb')
+        self.mmap_ = mmap.mmap(self.log_file_.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size, frame_length = LOG_HEADER.unpack_from(self.mmap_, 0)
+        if magic != LOG_MAGIC or record_size != LOG_RECORD.size or frame_length != FRAME_LENGTH:
+            raise ValueError("{} is not a UWB frame log".format(file_path))
+        record_num = (len(self.mmap_) - LOG_HEADER.size) // LOG_RECORD.size # a torn last record is ignored
+        self.records = np.frombuffer(self.mmap_, dtype=LOG_RECORD_DTYPE, count=record_num, offset=LOG_HEADER.size)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def decodeRanges(self) -> np.ndarray:
+        # (N, 4) rows of [range0, range1, range2, tag_id], ready for processBatchMLE
+        raw_data = self.records['frame'].tobytes()
+        frame_parser = UWBFrameParser(buffer_size = max(len(raw_data), FRAME_LENGTH)) # one pass, nothing may be dropped
+        tag_data = frame_parser.feed(raw_data)
+        return np.asarray(tag_data, dtype=np.float64).reshape(-1, 4)
+
+    def close(self):
+        self.records = None
+        self.mmap_.close()
+        self.log_file_.close()
+
+
+class UWBReplaySource():
+    """ Serial-port-like stream replaying a log; speed 1.0 real time, 0 as fast as possible """
+
+    def __init__(self, file_path, speed = 1.0, timeout = 0.1):
+
+        self.log_reader_ = UWBLogReader(file_path)
+        self.records_ = self.log_reader_.records
+        self.speed_ = speed
+        self.timeout = timeout
+        self.index_ = 0
+        self.is_open = True
+        self.port = file_path
+        self.start_time_ = None
+        self.first_stamp_ = float(self.records_['stamp'][0]) if len(self.records_) else 0.0
+        self.stamps_ = self.records_['stamp']
+
+    def dueIndex(self) -> int:
+        if self.speed_ <= 0:
+            return len(self.records_)
+        if self.start_time_ is None:
+            self.start_time_ = time.monotonic()
+        replay_stamp = self.first_stamp_ + (time.monotonic() - self.start_time_) * self.speed_
+        return int(np.searchsorted(self.stamps_, replay_stamp, side='right'))
+
+    @property
+    def in_waiting(self) -> int:
+        return (self.dueIndex() - self.index_) * FRAME_LENGTH
+
+    def isFinished(self) -> bool:
+        return self.index_ >= len(self.records_)
+
+    def read(self, size = 1) -> bytes:
+        if self.isFinished():
+            time.sleep(self.timeout)
+            return b''
+        due_index = self.dueIndex()
+        if due_index <= self.index_:
+            # wait for the next record, at most one timeout
+            wait = (self.stamps_[self.index_] - self.first_stamp_) / self.speed_ - (time.monotonic() - self.start_time_)
+            time.sleep(min(max(wait, 0.0), self.timeout))
+            due_index = self.dueIndex()
+        end_index = min(due_index, self.index_ + max(size // FRAME_LENGTH, 1))
+        raw_data = self.records_['frame'][self.index_:end_index].tobytes()
+        self.index_ = end_index
+        return raw_data
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.records_ = self.stamps_ = None
+            self.log_reader_.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from uwb_manager import UWBLocalizationSystem, UWBManager
+
+    arg_parser = argparse.ArgumentParser(prog='uwb-replay', description='replay a recorded uwb frame log')
+    arg_parser.add_argument('log', type=str)
+    arg_parser.add_argument('-s', '--speed', type=float, default=0.0, help='1.0 real time, 0 as fast as possible')
+    args = arg_parser.parse_args()
+
+    replay_source = UWBReplaySource(args.log, args.speed)
+    frame_num = len(replay_source.records_)
+    # every frame the localize thread does not skip as empty ends up as a fix, a reject or a drop
+    solve_num = int(np.count_nonzero(replay_source.log_reader_.decodeRanges().any(axis=1)))
+    uwb_system = UWBLocalizationSystem(uwb_manager = UWBManager(serial_port = replay_source, drop_frames = False))
+    uwb_system.verbose = False
+    start = time.perf_counter()
+    uwb_system.startLocalizeTag()
+    while uwb_system.track_data_thread.is_alive():
+        counters = uwb_system.getStats()['counters']
+        if sum(counters.get(name, 0) for name in ('fixes', 'rejected', 'inconsistent', 'frame_queue_dropped')) >= solve_num:
+            break
+        time.sleep(0.01)
+    replay_time = time.perf_counter() - start
+    counters = uwb_system.getStats()['counters']
+    print("{} frames in {:.2f} s, {} fixes, {} rejected, frame stats {}".format(
+        frame_num, replay_time, counters.get('fixes', 0), uwb_system.rejected_fix_count,
+        uwb_system.uwb_manager_.getFrameStats()))
+    uwb_system.closeSystem()
@@ -0,0 +1,161 @@
+import select
+import time
+import serial
+
+
+class SerialLink():
+    """ Serial port read with a deadline, stall detection from the measured frame rate and reopen with backoff """
+
+    RATE_WINDOW = 1.0 # second, frame rate measurement window
+
+    def __init__(self, port = "/dev/ttyUSB0", baudrate = 115200, serial_port = None, read_time_out = 0.1,
+                 stall_periods = 20, min_stall_time = 0.5, max_stall_time = 3.0, min_backoff = 0.1, max_backoff = 5.0,
+                 readiness = None):
+
+        # serial_port: already opened stream (simulator, replay), read as is and never reopened
+        self.port = serial_port.port if serial_port is not None else port
+        self.baudrate_ = baudrate
+        self.serial_port_ = serial_port
+        self.reconnectable_ = serial_port is None
+        self.read_time_out_ = read_time_out
+        self.stall_periods_ = stall_periods # frame periods without data before the link counts as stalled
+        self.min_stall_time_ = min_stall_time
+        self.max_stall_time_ = max_stall_time # also used before the first rate measurement
+        self.min_backoff_ = min_backoff
+        self.max_backoff_ = max_backoff
+        self.backoff_ = min_backoff
+        self.next_open_stamp_ = 0.0
+
+        self.frame_rate = 0.0 # frames per second, smoothed over RATE_WINDOW
+        self.window_start_ = time.monotonic()
+        self.window_frames_ = 0
+        self.last_frame_stamp_ = self.window_start_
+        self.connected = serial_port is not None
+        self.reconnect_count = 0
+        self.stall_count = 0
+        self.error_count = 0
+        self.readiness_ = readiness # ReadinessEvents, 'serial_open' is set on the first open
+        if self.reconnectable_:
+            self.open()
+        elif readiness is not None:
+            readiness.set('serial_open')
+
+    def open(self) -> bool:
+        # nonblocking port, the reader waits in select; on failure the next try is pushed back exponentially
+        now = time.monotonic()
+        try:
+            self.serial_port_ = serial.Serial(self.port, self.baudrate_, timeout=0)
+            self.serial_port_.reset_input_buffer()
+        except (serial.SerialException, OSError, ValueError) as e:
+            self.serial_port_ = None
+            self.next_open_stamp_ = now + self.backoff_
+            print("UWB port {} open failed: {}, retry in {:.1f} s".format(self.port, e, self.backoff_))
+            self.backoff_ = min(self.backoff_ * 2, self.max_backoff_)
+            return False
+        if self.next_open_stamp_ > 0:
+            self.reconnect_count += 1
+            print("UWB port {} reconnected".format(self.port))
+        self.connected = True
+        self.last_frame_stamp_ = self.window_start_ = now
+        self.window_frames_ = 0
+        if self.readiness_ is not None:
+            self.readiness_.set('serial_open', now)
+        return True
+
+    def reopen(self) -> bool:
+        # reader thread side, sleeps at most one read time out so the caller can check its stop flag
+        if not self.reconnectable_:
+            time.sleep(self.read_time_out_)
+            return False
+        wait = self.getRetryDelay()
+        if wait > 0:
+            time.sleep(min(wait, self.read_time_out_))
+            return False
+        return self.open()
+
+    def getRetryDelay(self) -> float:
+        return max(self.next_open_stamp_ - time.monotonic(), 0.0)
+
+    def lost(self, reason, stalled = False):
+        # a stalled port usually reopens fine, so the backoff grows here until frames arrive again
+        self.connected = False
+        self.next_open_stamp_ = time.monotonic() + self.backoff_
+        print("UWB port {} {}, reconnecting in {:.1f} s".format(self.port, reason, self.backoff_))
+        if stalled:
+            self.stall_count += 1
+            self.backoff_ = min(self.backoff_ * 2, self.max_backoff_)
+        self.closePort()
+
+    def readFrames(self, frame_parser) -> list:
+        # one reader step: decoded frames, [] on a time out, a stall or while the port is away
+        if not self.connected:
+            if self.reopen():
+                frame_parser.reset()
+            return []
+        try:
+            if hasattr(self.serial_port_, 'fileno'):
+                readable, _, _ = select.select([self.serial_port_.fileno()], [], [], self.read_time_out_)
+                frames = frame_parser.readFrom(self.serial_port_) if readable else []
+            else:
+                frames = frame_parser.readFrom(self.serial_port_) # blocks up to the stream's own timeout
+        except (serial.SerialException, OSError, TypeError, ValueError) as e:
+            # pyserial raises on a readable port without data when the device is unplugged
+            self.error_count += 1
+            self.lost("read failed: {}".format(e))
+            return []
+        now = time.monotonic()
+        self.updateRate(len(frames), now)
+        if self.isStalled(now):
+            self.lost("stalled, no frame for {:.1f} s".format(now - self.last_frame_stamp_), stalled = True)
+        return frames
+
+    def updateRate(self, frame_num, now):
+        if frame_num:
+            self.last_frame_stamp_ = now
+            self.window_frames_ += frame_num
+            self.backoff_ = self.min_backoff_ # only a port that delivers again resets the backoff
+        elapsed = now - self.window_start_
+        if elapsed >= self.RATE_WINDOW:
+            if self.window_frames_ == 0:
+                return # a silent window says nothing about the expected rate
+            window_rate = self.window_frames_ / elapsed
+            self.frame_rate = window_rate if self.frame_rate == 0 else 0.7 * self.frame_rate + 0.3 * window_rate
+            self.window_start_ = now
+            self.window_frames_ = 0
+
+    def getStallTime(self) -> float:
+        if self.frame_rate <= 0:
+            return self.max_stall_time_
+        return min(max(self.stall_periods_ / self.frame_rate, self.min_stall_time_), self.max_stall_time_)
+
+    def isStalled(self, now = None) -> bool:
+        # replay and simulated streams may pause on purpose, only real ports stall
+        if not self.reconnectable_ or not self.connected:
+            return False
+        if now is None:
+            now = time.monotonic()
+        return now - self.last_frame_stamp_ > self.getStallTime()
+
+    def fileno(self) -> int:
+        return self.serial_port_.fileno()
+
+    def getStats(self) -> dict:
+        return {'connected': self.connected,
+                'frame_rate': round(self.frame_rate, 2),
+                'reconnects': self.reconnect_count,
+                'stalls': self.stall_count,
+                'errors': self.error_count}
+
+    def closePort(self):
+        serial_port, self.serial_port_ = self.serial_port_, None
+        if serial_port is not None:
+            try:
+                serial_port.close()
+            except (serial.SerialException, OSError):
+                pass
+
+    def close(self):
+        self.connected = False
+        self.reconnectable_ = False
+        if self.serial_port_ is not None:
+            self.serial_port_.close()
@@ -0,0 +1,258 @@
+import numpy as np
+import os
+import threading
+import time
+from uwb_frame_parser import FRAME_LENGTH, FRAME_HEADER, FRAME_TAIL, MASTER_TAG_ID, TAG_ID_INDEX, RANGE_INDEX, CHECKSUM_INDEX
+
+
+def staticTrajectory(x, y):
+    def trajectory(t):
+        return np.full(np.shape(t), float(x)), np.full(np.shape(t), float(y))
+    return trajectory
+
+def circleTrajectory(center_x, center_y, radius, period):
+    def trajectory(t):
+        angle = 2 * np.pi * np.asarray(t) / period
+        return center_x + radius * np.cos(angle), center_y + radius * np.sin(angle)
+    return trajectory
+
+def lineTrajectory(start_pos, end_pos, period):
+    # back and forth between two points
+    def trajectory(t):
+        phase = np.abs(((np.asarray(t) / period) % 1.0) * 2 - 1) # 1 -> 0 -> 1
+        ratio = 1 - phase
+        return (start_pos[0] + (end_pos[0] - start_pos[0]) * ratio,
+                start_pos[1] + (end_pos[1] - start_pos[1]) * ratio)
+    return trajectory
+
+
+class SimulatedTag():
+
+    def __init__(self, tag_id, trajectory):
+
+        self.tag_id = tag_id # raw frame id, MASTER_TAG_ID for the master tag
+        self.trajectory = trajectory
+
+
+class UWBSimulator():
+    """ Synthetic range frames, byte exact with the UWB master output """
+
+    def __init__(self, anchor_pos_list, tags, rate = 100.0, range_sigma = 0.02,
+                 nlos_prob = 0.0, nlos_bias = (0.2, 1.0), dropout_prob = 0.0, seed = None):
+
+        self.anchor_pos_ = np.asarray(anchor_pos_list, dtype=np.float64)[:3]
+        self.tags_ = list(tags)
+        self.tag_ids_ = np.array([tag.tag_id for tag in self.tags_], dtype=np.uint8)
+        self.rate = rate # frames per second per tag
+        self.range_sigma_ = range_sigma
+        self.nlos_prob_ = nlos_prob
+        self.nlos_bias_ = nlos_bias
+        self.dropout_prob_ = dropout_prob
+        self.rng_ = np.random.default_rng(seed)
+
+    def truePosition(self, tag_index, t):
+        return self.tags_[tag_index].trajectory(t)
+
+    def generateFrames(self, tick_stamps) -> bytes:
+        # one frame per tag for every tick stamp (second since simulation start)
+        tick_stamps = np.asarray(tick_stamps, dtype=np.float64)
+        tick_num, tag_num = len(tick_stamps), len(self.tags_)
+        if tick_num == 0 or tag_num == 0:
+            return b''
+        position = np.empty((tick_num, tag_num, 2))
+        for index, tag in enumerate(self.tags_):
+            position[:, index, 0], position[:, index, 1] = tag.trajectory(tick_stamps)
+        delta = position[:, :, np.newaxis, :] - self.anchor_pos_
+        ranges = np.sqrt(np.sum(delta ** 2, axis=3)) # (ticks, tags, anchors)
+        ranges += self.rng_.normal(0.0, self.range_sigma_, ranges.shape)
+        if self.nlos_prob_ > 0:
+            nlos = self.rng_.random(ranges.shape) < self.nlos_prob_
+            ranges += nlos * self.rng_.uniform(self.nlos_bias_[0], self.nlos_bias_[1], ranges.shape)
+
+        ranges = ranges.reshape(-1, 3)
+        tag_ids = np.broadcast_to(self.tag_ids_, (tick_num, tag_num)).reshape(-1)
+        if self.dropout_prob_ > 0:
+            keep = self.rng_.random(len(ranges)) >= self.dropout_prob_
+            ranges, tag_ids = ranges[keep], tag_ids[keep]
+        return encodeFrames(ranges, tag_ids)
+
+
+def encodeFrames(ranges, tag_ids) -> bytes:
+    # vectorized uwb_frame_parser.encodeFrame
+    frames = np.zeros((len(ranges), FRAME_LENGTH), dtype=np.uint8)
+    frames[:, 0] = FRAME_HEADER
+    frames[:, TAG_ID_INDEX] = tag_ids
+    ranges_cm = np.clip(np.rint(np.asarray(ranges) * 100), 0, 0xffff).astype('<u2')
+    frames[:, RANGE_INDEX:RANGE_INDEX + 6] = ranges_cm.view(np.uint8).reshape(-1, 6)
+    frames[:, CHECKSUM_INDEX] = frames[:, :CHECKSUM_INDEX].sum(axis=1, dtype=np.uint32) & 0xff
+    frames[:, FRAME_LENGTH - 1] = FRAME_TAIL
+    return frames.tobytes()
+
+
+class SimulatedSerialPort():
+    """ In-memory transport, frames become readable when their tick is due """
+
+    def __init__(self, simulator, duration = None, timeout = 0.1):
+
+        self.simulator_ = simulator
+        self.duration_ = duration
+        self.timeout = timeout
+        self.start_time_ = None
+        self.next_tick_ = 0
+        self.frames_per_tick_ = max(len(simulator.tags_), 1)
+        self.pending_ = b''
+        self.is_open = True
+        self.port = 'sim'
+
+    def startTime(self) -> float:
+        if self.start_time_ is None:
+            self.start_time_ = time.monotonic()
+        return self.start_time_
+
+    def dueTick(self) -> int:
+        due_tick = int((time.monotonic() - self.startTime()) * self.simulator_.rate) + 1
+        if self.duration_ is not None:
+            due_tick = min(due_tick, int(self.duration_ * self.simulator_.rate))
+        return due_tick
+
+    def isFinished(self) -> bool:
+        return self.duration_ is not None and self.next_tick_ >= int(self.duration_ * self.simulator_.rate) and not self.pending_
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.pending_) + max(self.dueTick() - self.next_tick_, 0) * self.frames_per_tick_ * FRAME_LENGTH
+
+    def read(self, size = 1) -> bytes:
+        if not self.pending_:
+            due_tick = self.dueTick()
+            if due_tick <= self.next_tick_:
+                if self.isFinished():
+                    time.sleep(self.timeout)
+                    return b''
+                wait = self.next_tick_ / self.simulator_.rate - (time.monotonic() - self.startTime())
+                time.sleep(min(max(wait, 0.0), self.timeout))
+                due_tick = self.dueTick()
+            tick_stamps = np.arange(self.next_tick_, due_tick) / self.simulator_.rate
+            self.next_tick_ = max(due_tick, self.next_tick_)
+            self.pending_ = self.simulator_.generateFrames(tick_stamps)
+        raw_data, self.pending_ = self.pending_[:size], self.pending_[size:]
+        return raw_data
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class UWBPtySimulator():
+    """ Writes simulated frames to a pty, open port_name like a real /dev/ttyUSB device """
+
+    def __init__(self, simulator):
+
+        self.simulator_ = simulator
+        self.master_fd_, self.slave_fd_ = os.openpty()
+        self.port_name = os.ttyname(self.slave_fd_)
+        self.active_flag_ = False
+        self.paused = False # a silent device, the reader should detect the stall and reconnect
+        self.write_thread_ = None
+
+    def start(self):
+        self.active_flag_ = True
+        self.write_thread_ = threading.Thread(target=self.writeLoop, daemon=True)
+        self.write_thread_.start()
+
+    def writeLoop(self):
+        rate = self.simulator_.rate
+        start_time = time.monotonic()
+        next_tick = 0
+        while self.active_flag_:
+            due_tick = int((time.monotonic() - start_time) * rate) + 1
+            if due_tick > next_tick:
+                raw_data = self.simulator_.generateFrames(np.arange(next_tick, due_tick) / rate)
+                next_tick = due_tick
+                if not self.paused:
+                    os.write(self.master_fd_, raw_data)
+            time.sleep(max(next_tick / rate - (time.monotonic() - start_time), 0.0))
+
+    def stop(self):
+        self.active_flag_ = False
+        if self.write_thread_ is not None:
+            self.write_thread_.join()
+        os.close(self.master_fd_)
+        os.close(self.slave_fd_)
+
+
+def makeTags(tag_num, area = ((-4.0, 0.0), (0.0, 3.5)), seed = None) -> list:
+    # master tag on a circle, the others on random lines inside the area
+    rng = np.random.default_rng(seed)
+    (min_x, max_x), (min_y, max_y) = area
+    center_x, center_y = (min_x + max_x) / 2, (min_y + max_y) / 2
+    tags = [SimulatedTag(MASTER_TAG_ID, circleTrajectory(center_x, center_y, 1.0, 20.0))]
+    slave_ids = [tag_id for tag_id in range(1, 256) if tag_id != MASTER_TAG_ID]
+    for tag_id in slave_ids[:max(tag_num - 1, 0)]:
+        start_pos = (rng.uniform(min_x, max_x), rng.uniform(min_y, max_y))
+        end_pos = (rng.uniform(min_x, max_x), rng.uniform(min_y, max_y))
+        tags.append(SimulatedTag(tag_id, lineTrajectory(start_pos, end_pos, rng.uniform(5.0, 30.0))))
+    return tags[:tag_num]
+
+
+if __name__ == "__main__":
+    import argparse
+    from uwb_manager import UWBLocalizationSystem, UWBManager, DEFAULT_ANCHOR_POS
+
+    arg_parser = argparse.ArgumentParser(prog='uwb-simulator', description='synthetic uwb range frames')
+    arg_parser.add_argument('-n', '--tags', type=int, default=1)
+    arg_parser.add_argument('-r', '--rate', type=float, default=100.0, help='frames per second per tag')
+    arg_parser.add_argument('-d', '--duration', type=float, default=5.0)
+    arg_parser.add_argument('--sigma', type=float, default=0.02, help='range noise std in meter')
+    arg_parser.add_argument('--nlos', type=float, default=0.0, help='nlos probability per range')
+    arg_parser.add_argument('--dropout', type=float, default=0.0, help='frame drop probability')
+    arg_parser.add_argument('--pty', action='store_true', help='serve frames on a pty until q')
+    arg_parser.add_argument('--seed', type=int, default=None)
+    args = arg_parser.parse_args()
+
+    simulator = UWBSimulator(DEFAULT_ANCHOR_POS, makeTags(args.tags, seed=args.seed), args.rate,
+                             args.sigma, args.nlos, dropout_prob=args.dropout, seed=args.seed)
+    if args.pty:
+        pty_simulator = UWBPtySimulator(simulator)
+        pty_simulator.start()
+        print("simulated uwb master on {} (p: pause / resume, q: quit)".format(pty_simulator.port_name))
+        cmd = input("CMD: ")
+        while cmd != "q":
+            if cmd == "p":
+                pty_simulator.paused = not pty_simulator.paused
+                print("paused" if pty_simulator.paused else "resumed")
+            cmd = input("CMD: ")
+        pty_simulator.stop()
+        raise SystemExit(0)
+
+    # end-to-end load test: simulated port -> parser -> solver -> fix queue
+    serial_port = SimulatedSerialPort(simulator, args.duration)
+    uwb_system = UWBLocalizationSystem(uwb_manager = UWBManager(serial_port = serial_port))
+    uwb_system.verbose = False
+    fix_queue = uwb_system.getFixQueue()
+    latency = list()
+    zone_event_num = 0
+    uwb_system.startLocalizeTag()
+    while not serial_port.isFinished() or fix_queue.size():
+        item = fix_queue.pop(timeout = 0.2)
+        if item is None:
+            continue
+        event, payload = item
+        if event == 'fix':
+            latency.append(time.monotonic() - payload.stamp)
+        elif event == 'zone': # zone enter / exit of a site config zone, carries no frame stamp
+            zone_event_num += 1
+    frame_stats = uwb_system.uwb_manager_.getFrameStats()
+    uwb_system.closeSystem()
+    latency = np.asarray(latency) * 1e3
+    print("tags {} rate {} Hz: frames {} fixes {} rejected {} dropped {} zone events {}".format(
+        args.tags, args.rate, frame_stats['frames'], len(latency), uwb_system.rejected_fix_count,
+        uwb_system.uwb_manager_.getFrameQueue().dropped_count, zone_event_num))
+    if len(latency):
+        print("frame -> fix latency ms p50 {:.3f} p99 {:.3f} max {:.3f}".format(
+            np.percentile(latency, 50), np.percentile(latency, 99), latency.max()))
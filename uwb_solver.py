@@ -0,0 +1,177 @@
+import numpy as np
+from dataclasses import dataclass
+
+
+@dataclass
+class UWBFix:
+    position_x: float
+    position_y: float
+    tag_id: int
+    residual: float = 0.0 # rms range residual in meter
+    gdop: float = 0.0
+    iterations: int = 0
+    stamp: float = 0.0 # monotonic receive time of the frame
+    solve_stamp: float = 0.0 # monotonic time the fix was solved
+
+
+class UWBSolver():
+    """ Solver interface, tag_dis is [range_0, ..., range_n, tag_id] """
+
+    def __init__(self):
+
+        self.anchor_pos_ = None
+        self.anchor_num_ = 0
+
+    def setAnchors(self, anchor_pos_list):
+        self.anchor_pos_ = np.asarray(anchor_pos_list, dtype=np.float64)
+        self.anchor_num_ = len(self.anchor_pos_)
+
+    def isReady(self) -> bool:
+        return self.anchor_num_ >= 3
+
+    def solve(self, tag_dis) -> UWBFix:
+        raise NotImplementedError
+
+    def splitTagData(self, tag_dis):
+        range_num = min(self.anchor_num_, len(tag_dis) - 1)
+        return np.asarray(tag_dis[:range_num], dtype=np.float64), int(tag_dis[-1])
+
+    def evaluateFix(self, position, ranges, tag_id, iterations = 0) -> UWBFix:
+        anchor_pos = self.anchor_pos_[:len(ranges)]
+        delta = position - anchor_pos
+        dist = np.sqrt(np.sum(delta ** 2, axis=1))
+        residual = float(np.sqrt(np.mean((dist - ranges) ** 2)))
+        return UWBFix(position_x = float(position[0]),
+                      position_y = float(position[1]),
+                      tag_id = tag_id,
+                      residual = residual,
+                      gdop = computeGDOP(delta, dist),
+                      iterations = iterations)
+
+
+def computeGDOP(delta, dist) -> float:
+    H = delta / np.maximum(dist, 1e-9)[:, np.newaxis]
+    HtH = H.T @ H
+    det = HtH[0, 0] * HtH[1, 1] - HtH[0, 1] * HtH[1, 0]
+    if det <= 1e-12:
+        return float('inf')
+    return float(np.sqrt((HtH[0, 0] + HtH[1, 1]) / det))
+
+
+class LinearMultilateration(UWBSolver):
+    """ Linearized multilateration against the last anchor, geometry factorized once """
+
+    def __init__(self):
+        super().__init__()
+
+        self.pinv_A_ = None
+        self.anchor_term_ = None
+
+    def setAnchors(self, anchor_pos_list):
+        super().setAnchors(anchor_pos_list)
+        if self.anchor_num_ < 3:
+            self.pinv_A_ = None
+            return
+        anchor_pos = self.anchor_pos_
+        ref_pos = anchor_pos[-1]
+        A = 2 * (anchor_pos[:-1] - ref_pos)
+        self.pinv_A_ = np.linalg.pinv(A) # (2, anchors - 1)
+        self.anchor_term_ = np.sum(anchor_pos[:-1] ** 2, axis=1) - np.sum(ref_pos ** 2)
+
+    def isReady(self) -> bool:
+        return self.pinv_A_ is not None
+
+    def solve(self, tag_dis) -> UWBFix:
+        ranges, tag_id = self.splitTagData(tag_dis)
+        position = self.solveBatch(ranges[np.newaxis, :])[0]
+        return self.evaluateFix(position, ranges, tag_id)
+
+    def solveBatch(self, range_rows) -> np.ndarray:
+        # range_rows: (N, >= anchors), extra columns such as the tag id are ignored
+        if self.pinv_A_ is None:
+            raise RuntimeError("anchor geometry requires at least 3 anchors")
+        ranges_sq = np.square(np.asarray(range_rows, dtype=np.float64)[:, :self.anchor_num_])
+        b = self.anchor_term_ + ranges_sq[:, -1:] - ranges_sq[:, :-1]
+        return b @ self.pinv_A_.T
+
+
+class LevenbergMarquardtSolver(UWBSolver):
+    """ Weighted nonlinear least squares over every anchor, warm started per tag """
+
+    def __init__(self, range_sigma = None, max_iterations = 10, tolerance = 1e-4, damping = 1e-3):
+        super().__init__()
+
+        self.range_sigma_ = range_sigma # per anchor range std in meter, None for equal weight
+        self.max_iterations_ = max_iterations
+        self.tolerance_ = tolerance
+        self.damping_ = damping
+        self.weight_ = None
+        self.init_solver_ = LinearMultilateration()
+        self.geometry_grid_ = None # cold start from the nearest grid cell when set
+        self.last_position_ = dict() # tag id -> previous fix
+
+    def setAnchors(self, anchor_pos_list):
+        super().setAnchors(anchor_pos_list)
+        self.init_solver_.setAnchors(anchor_pos_list)
+        if self.range_sigma_ is None:
+            self.weight_ = np.ones(self.anchor_num_)
+        else:
+            self.weight_ = 1.0 / np.square(np.asarray(self.range_sigma_, dtype=np.float64)[:self.anchor_num_])
+        self.last_position_.clear()
+
+    def setGeometryGrid(self, geometry_grid):
+        self.geometry_grid_ = geometry_grid
+
+    def resetTag(self, tag_id = None):
+        if tag_id is None:
+            self.last_position_.clear()
+        else:
+            self.last_position_.pop(tag_id, None)
+
+    def initialGuess(self, ranges, tag_id) -> np.ndarray:
+        position = self.last_position_.get(tag_id)
+        if position is not None:
+            return position.copy()
+        if self.geometry_grid_ is not None:
+            position = self.geometry_grid_.initialGuess(ranges)
+            if position is not None:
+                return position
+        if len(ranges) == self.anchor_num_:
+            return self.init_solver_.solveBatch(ranges[np.newaxis, :])[0]
+        return np.mean(self.anchor_pos_[:len(ranges)], axis=0)
+
+    def solve(self, tag_dis) -> UWBFix:
+        ranges, tag_id = self.splitTagData(tag_dis)
+        anchor_pos = self.anchor_pos_[:len(ranges)]
+        weight = self.weight_[:len(ranges)]
+        position = self.initialGuess(ranges, tag_id)
+        damping = self.damping_
+
+        delta = position - anchor_pos
+        dist = np.sqrt(np.sum(delta ** 2, axis=1))
+        cost = np.sum(weight * (dist - ranges) ** 2)
+        iterations = 0
+        while iterations < self.max_iterations_:
+            iterations += 1
+            J = delta / np.maximum(dist, 1e-9)[:, np.newaxis]
+            JtW = J.T * weight
+            JtWJ = JtW @ J
+            grad = JtW @ (dist - ranges)
+            JtWJ[0, 0] += damping * JtWJ[0, 0] + 1e-12
+            JtWJ[1, 1] += damping * JtWJ[1, 1] + 1e-12
+            step = -np.linalg.solve(JtWJ, grad)
+            if np.abs(step).max() < self.tolerance_:
+                break
+
+            new_position = position + step
+            new_delta = new_position - anchor_pos
+            new_dist = np.sqrt(np.sum(new_delta ** 2, axis=1))
+            new_cost = np.sum(weight * (new_dist - ranges) ** 2)
+            if new_cost <= cost:
+                position, delta, dist, cost = new_position, new_delta, new_dist, new_cost
+                damping *= 0.1
+            else:
+                damping *= 10.0
+
+        self.last_position_[tag_id] = position
+        return self.evaluateFix(position, ranges, tag_id, iterations)
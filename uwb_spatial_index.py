@@ -0,0 +1,214 @@
+import math
+import threading
+import time
+import numpy as np
+from dataclasses import dataclass
+from uwb_tag_table import MAX_TAG_NUM
+
+
+@dataclass
+class ZoneEvent:
+    zone: str
+    tag_id: int
+    entered: bool # False: left the zone, or its track expired inside
+    position_x: float
+    position_y: float
+    stamp: float = 0.0 # monotonic time of the fix
+
+
+class Zone():
+    """ Polygon zone with membership per tag, a tag leaves only once it is hysteresis meter outside """
+
+    def __init__(self, name, polygon, hysteresis = 0.1, max_tag_num = MAX_TAG_NUM):
+
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError("zone {} needs at least 3 vertices".format(name))
+        self.hysteresis_ = hysteresis
+        self.edge_start_ = self.polygon
+        self.edge_vector_ = np.roll(self.polygon, -1, axis=0) - self.polygon
+        self.edge_length2_ = np.maximum(np.sum(self.edge_vector_ ** 2, axis=1), 1e-12)
+        self.min_ = self.polygon.min(axis=0)
+        self.max_ = self.polygon.max(axis=0)
+        self.inside_ = np.zeros(max_tag_num, dtype=bool)
+
+    def contains(self, points) -> np.ndarray:
+        # even-odd rule for (N, 2) points
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        x = points[:, 0:1]
+        y = points[:, 1:2]
+        y0 = self.edge_start_[:, 1]
+        y1 = y0 + self.edge_vector_[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cross_x = self.edge_start_[:, 0] + (y - y0) * self.edge_vector_[:, 0] / self.edge_vector_[:, 1]
+        crossing = ((y0 > y) != (y1 > y)) & (x < cross_x)
+        return np.count_nonzero(crossing, axis=1) % 2 == 1
+
+    def distance(self, position_x, position_y) -> float:
+        # to the closest edge
+        offset = np.array([position_x, position_y]) - self.edge_start_
+        t = np.clip(np.sum(offset * self.edge_vector_, axis=1) / self.edge_length2_, 0.0, 1.0)
+        return float(np.sqrt(np.min(np.sum((offset - t[:, np.newaxis] * self.edge_vector_) ** 2, axis=1))))
+
+    def update(self, tag_id, position_x, position_y):
+        # True on enter, False on exit, None when the membership did not change
+        inside = self.inside_[tag_id]
+        margin = self.hysteresis_ if inside else 0.0
+        if (position_x < self.min_[0] - margin or position_x > self.max_[0] + margin or
+                position_y < self.min_[1] - margin or position_y > self.max_[1] + margin):
+            now_inside = False
+        else:
+            now_inside = bool(self.contains((position_x, position_y))[0])
+            if inside and not now_inside:
+                now_inside = self.distance(position_x, position_y) <= self.hysteresis_
+        if now_inside == inside:
+            return None
+        self.inside_[tag_id] = now_inside
+        return now_inside
+
+
+class SpatialIndex():
+    """ Uniform grid hash over the latest tag positions, answers radius and zone queries without a full scan """
+
+    EXPIRE_PERIOD = 0.5 # second, stale tags are looked for at most this often
+
+    def __init__(self, cell_size = 1.0, max_age = 2.0, max_tag_num = MAX_TAG_NUM):
+
+        self.cell_size_ = cell_size # meter, about the usual query radius
+        self.max_age_ = max_age # second, tags without a fix this long leave the index and their zones
+        self.max_tag_num_ = max_tag_num
+        self.cells_ = dict() # (ix, iy) -> set of tag ids
+        self.tag_cell_ = dict() # tag id -> (ix, iy)
+        self.position_ = np.zeros((max_tag_num, 2))
+        self.stamp_ = np.zeros(max_tag_num)
+        self.zones_ = dict() # name -> Zone
+        self.next_expire_stamp_ = 0.0
+        self.lock_ = threading.Lock() # one writer thread, queries from zenoh / consumer threads
+
+    def getCell(self, position_x, position_y) -> tuple:
+        return math.floor(position_x / self.cell_size_), math.floor(position_y / self.cell_size_)
+
+    def update(self, tag_id, position_x, position_y, stamp = None) -> list:
+        # moves the tag, returns the zone events it caused
+        if stamp is None:
+            stamp = time.monotonic()
+        cell = self.getCell(position_x, position_y)
+        events = list()
+        with self.lock_:
+            last_cell = self.tag_cell_.get(tag_id)
+            if cell != last_cell:
+                if last_cell is not None:
+                    self.removeFromCell(tag_id, last_cell)
+                self.cells_.setdefault(cell, set()).add(tag_id)
+                self.tag_cell_[tag_id] = cell
+            self.position_[tag_id] = (position_x, position_y)
+            self.stamp_[tag_id] = stamp
+            for zone in self.zones_.values():
+                entered = zone.update(tag_id, position_x, position_y)
+                if entered is not None:
+                    events.append(ZoneEvent(zone.name, tag_id, entered, position_x, position_y, stamp))
+        return events
+
+    def removeFromCell(self, tag_id, cell):
+        tags = self.cells_[cell]
+        tags.discard(tag_id)
+        if not tags:
+            del self.cells_[cell]
+
+    def remove(self, tag_id, stamp = None) -> list:
+        # exit events for the zones the tag was in
+        if stamp is None:
+            stamp = time.monotonic()
+        events = list()
+        with self.lock_:
+            cell = self.tag_cell_.pop(tag_id, None)
+            if cell is None:
+                return events
+            self.removeFromCell(tag_id, cell)
+            position_x, position_y = self.position_[tag_id].tolist()
+            for zone in self.zones_.values():
+                if zone.inside_[tag_id]:
+                    zone.inside_[tag_id] = False
+                    events.append(ZoneEvent(zone.name, tag_id, False, position_x, position_y, stamp))
+        return events
+
+    def expire(self, stamp = None) -> list:
+        # drops tags older than max_age, cheap to call on every frame
+        if stamp is None:
+            stamp = time.monotonic()
+        if stamp < self.next_expire_stamp_:
+            return []
+        self.next_expire_stamp_ = stamp + self.EXPIRE_PERIOD
+        stale = [tag_id for tag_id in list(self.tag_cell_) if stamp - self.stamp_[tag_id] > self.max_age_]
+        events = list()
+        for tag_id in stale:
+            events.extend(self.remove(tag_id, stamp))
+        return events
+
+    def queryRadius(self, position_x, position_y, radius, exclude = None) -> list:
+        # [(tag_id, distance), ...] within radius, nearest first
+        ix_min, iy_min = self.getCell(position_x - radius, position_y - radius)
+        ix_max, iy_max = self.getCell(position_x + radius, position_y + radius)
+        with self.lock_:
+            if (ix_max - ix_min + 1) * (iy_max - iy_min + 1) > len(self.cells_):
+                # radius larger than the occupied area, walking the occupied cells is cheaper
+                cells = [tags for (ix, iy), tags in self.cells_.items() if ix_min <= ix <= ix_max and iy_min <= iy <= iy_max]
+            else:
+                cells = [self.cells_[(ix, iy)] for ix in range(ix_min, ix_max + 1) for iy in range(iy_min, iy_max + 1)
+                         if (ix, iy) in self.cells_]
+            tag_ids = np.fromiter((tag_id for tags in cells for tag_id in tags if tag_id != exclude), dtype=np.int64)
+            offset = self.position_[tag_ids] - (position_x, position_y)
+        distance = np.sqrt(np.sum(offset ** 2, axis=1))
+        within = np.flatnonzero(distance <= radius)
+        within = within[np.argsort(distance[within], kind='stable')]
+        return list(zip(tag_ids[within].tolist(), distance[within].tolist()))
+
+    def getNeighbors(self, tag_id, radius) -> list:
+        # tags within radius of tag_id, None when the tag is not indexed
+        if tag_id not in self.tag_cell_:
+            return None
+        position_x, position_y = self.position_[tag_id].tolist()
+        return self.queryRadius(position_x, position_y, radius, exclude = tag_id)
+
+    def queryPolygon(self, polygon) -> list:
+        # tags inside an arbitrary polygon, no hysteresis
+        zone = Zone('', polygon, 0.0, 1)
+        (ix_min, iy_min), (ix_max, iy_max) = self.getCell(*zone.min_), self.getCell(*zone.max_)
+        with self.lock_:
+            tag_ids = np.fromiter((tag_id for (ix, iy), tags in self.cells_.items()
+                                   if ix_min <= ix <= ix_max and iy_min <= iy <= iy_max for tag_id in tags), dtype=np.int64)
+            positions = self.position_[tag_ids]
+        return np.sort(tag_ids[zone.contains(positions)]).tolist()
+
+    def addZone(self, name, polygon, hysteresis = 0.1) -> list:
+        # replaces a zone of the same name, returns enter events for the tags already inside
+        zone = Zone(name, polygon, hysteresis, self.max_tag_num_)
+        events = list()
+        with self.lock_:
+            self.zones_[name] = zone
+            for tag_id in self.tag_cell_:
+                position_x, position_y = self.position_[tag_id].tolist()
+                if zone.update(tag_id, position_x, position_y):
+                    events.append(ZoneEvent(name, tag_id, True, position_x, position_y, float(self.stamp_[tag_id])))
+        return events
+
+    def removeZone(self, name):
+        with self.lock_:
+            self.zones_.pop(name, None)
+
+    def getZoneTags(self, name) -> list:
+        # tags currently inside the zone, None for an unknown zone
+        zone = self.zones_.get(name)
+        if zone is None:
+            return None
+        return np.flatnonzero(zone.inside_).tolist()
+
+    def getTagZones(self, tag_id) -> list:
+        return [name for name, zone in list(self.zones_.items()) if zone.inside_[tag_id]]
+
+    def getZones(self) -> dict:
+        return {name: zone.polygon.tolist() for name, zone in list(self.zones_.items())}
+
+    def getTagIds(self) -> list:
+        return sorted(self.tag_cell_)
@@ -0,0 +1,90 @@
+import numpy as np
+import time
+
+MAX_TAG_NUM = 256 # tag id is one byte in the serial frame
+MAX_RANGE_NUM = 4
+
+
+class TagTable():
+    """ Latest ranges / fix per tag id, one writer thread and any number of readers """
+
+    def __init__(self, max_tag_num = MAX_TAG_NUM, max_range_num = MAX_RANGE_NUM):
+
+        self.ranges_ = np.zeros((max_tag_num, max_range_num))
+        self.range_num_ = np.zeros(max_tag_num, dtype=np.int32)
+        self.position_ = np.zeros((max_tag_num, 2))
+        self.has_position_ = np.zeros(max_tag_num, dtype=bool)
+        self.stamp_ = np.zeros(max_tag_num)
+        self.seq_ = np.zeros(max_tag_num, dtype=np.int64)
+        self.version_ = np.zeros(max_tag_num, dtype=np.int64) # odd while a row is written
+        self.last_tag_id = None
+
+    def update(self, tag_id, ranges = None, position = None, stamp = None):
+        # only one thread may call update on a given table
+        if stamp is None:
+            stamp = time.monotonic()
+        self.version_[tag_id] += 1
+        if ranges is not None:
+            range_num = len(ranges)
+            self.ranges_[tag_id, :range_num] = ranges
+            self.range_num_[tag_id] = range_num
+        if position is not None:
+            self.position_[tag_id, 0] = position[0]
+            self.position_[tag_id, 1] = position[1]
+            self.has_position_[tag_id] = True
+        self.stamp_[tag_id] = stamp
+        self.seq_[tag_id] += 1
+        self.version_[tag_id] += 1
+        self.last_tag_id = tag_id
+
+    def read(self, tag_id):
+        # returns (ranges, position, stamp, seq) or None if the tag was never seen
+        while True:
+            version = self.version_[tag_id]
+            if version & 1:
+                time.sleep(0) # yield the GIL so the writer can finish the row
+                continue
+            seq = int(self.seq_[tag_id])
+            if seq == 0:
+                return None
+            ranges = self.ranges_[tag_id, :self.range_num_[tag_id]].tolist()
+            position = self.position_[tag_id].tolist() if self.has_position_[tag_id] else None
+            stamp = float(self.stamp_[tag_id])
+            if self.version_[tag_id] == version:
+                return ranges, position, stamp, seq
+            time.sleep(0)
+
+    def getRanges(self, tag_id):
+        record = self.read(tag_id)
+        if record is None:
+            return None
+        return record[0] + [tag_id]
+
+    def getPosition(self, tag_id):
+        record = self.read(tag_id)
+        if record is None or record[1] is None:
+            return None
+        return record[1] + [tag_id]
+
+    def getSeq(self) -> np.ndarray:
+        return self.seq_.copy()
+
+    def getUpdatedTags(self, last_seq) -> np.ndarray:
+        # tag ids written since last_seq, last_seq is refreshed in place
+        updated = np.flatnonzero(self.seq_ != last_seq)
+        last_seq[updated] = self.seq_[updated]
+        return updated
+
+    def getActiveTags(self, max_age = None, stamp = None) -> np.ndarray:
+        active = self.seq_ > 0
+        if max_age is not None:
+            if stamp is None:
+                stamp = time.monotonic()
+            active &= (stamp - self.stamp_) <= max_age
+        return np.flatnonzero(active)
+
+    def clear(self):
+        self.version_ += 2
+        self.seq_[:] = 0
+        self.has_position_[:] = False
+        self.last_tag_id = None
@@ -0,0 +1,130 @@
+import time
+
+
+class TagTracker():
+    """ Constant velocity Kalman filter, x and y share one covariance (isotropic noise) """
+
+    def __init__(self, accel_noise = 0.5, range_sigma = 0.1, gate = 9.21, max_reject = 5):
+
+        self.accel_noise_ = accel_noise # white acceleration spectral density (m^2/s^3)
+        self.range_sigma_ = range_sigma
+        self.gate_ = gate # chi-square 2 dof, 99%
+        self.max_reject_ = max_reject
+
+        self.pos_x = 0.0
+        self.pos_y = 0.0
+        self.vel_x = 0.0
+        self.vel_y = 0.0
+        self.p_pp_ = 0.0
+        self.p_pv_ = 0.0
+        self.p_vv_ = 0.0
+        self.stamp = None
+        self.reject_count_ = 0
+        self.rejected_total = 0
+
+    def isInitialized(self) -> bool:
+        return self.stamp is not None
+
+    def initialize(self, x, y, stamp, measure_var):
+        self.pos_x = x
+        self.pos_y = y
+        self.vel_x = 0.0
+        self.vel_y = 0.0
+        self.p_pp_ = measure_var
+        self.p_pv_ = 0.0
+        self.p_vv_ = 1.0
+        self.stamp = stamp
+        self.reject_count_ = 0
+
+    def predict(self, stamp):
+        dt = stamp - self.stamp
+        if dt <= 0.0:
+            return
+        q = self.accel_noise_
+        self.pos_x += self.vel_x * dt
+        self.pos_y += self.vel_y * dt
+        p_pp, p_pv, p_vv = self.p_pp_, self.p_pv_, self.p_vv_
+        self.p_pp_ = p_pp + dt * (2.0 * p_pv + dt * p_vv) + q * dt * dt * dt / 3.0
+        self.p_pv_ = p_pv + dt * p_vv + q * dt * dt / 2.0
+        self.p_vv_ = p_vv + q * dt
+        self.stamp = stamp
+
+    def update(self, x, y, stamp, gdop = 1.0) -> bool:
+        measure_var = (self.range_sigma_ * gdop) ** 2
+        if self.stamp is None:
+            self.initialize(x, y, stamp, measure_var)
+            return True
+        self.predict(stamp)
+
+        innovation_var = self.p_pp_ + measure_var
+        inno_x = x - self.pos_x
+        inno_y = y - self.pos_y
+        if (inno_x * inno_x + inno_y * inno_y) / innovation_var > self.gate_:
+            self.reject_count_ += 1
+            self.rejected_total += 1
+            if self.reject_count_ >= self.max_reject_:
+                # consistently far away, the track is lost rather than the fixes
+                self.initialize(x, y, stamp, measure_var)
+            return False
+
+        self.reject_count_ = 0
+        gain_p = self.p_pp_ / innovation_var
+        gain_v = self.p_pv_ / innovation_var
+        self.pos_x += gain_p * inno_x
+        self.pos_y += gain_p * inno_y
+        self.vel_x += gain_v * inno_x
+        self.vel_y += gain_v * inno_y
+        self.p_vv_ -= gain_v * self.p_pv_
+        self.p_pv_ -= gain_p * self.p_pv_
+        self.p_pp_ -= gain_p * self.p_pp_
+        return True
+
+    def predictPosition(self, stamp = None):
+        if stamp is None:
+            return self.pos_x, self.pos_y
+        dt = stamp - self.stamp
+        return self.pos_x + self.vel_x * dt, self.pos_y + self.vel_y * dt
+
+
+class UWBTracker():
+    """ Tracking stage keyed by tag id """
+
+    def __init__(self, accel_noise = 0.5, range_sigma = 0.1, gate = 9.21, max_age = 2.0):
+
+        self.accel_noise_ = accel_noise
+        self.range_sigma_ = range_sigma
+        self.gate_ = gate
+        self.max_age_ = max_age # second, stop extrapolating stale tracks
+        self.tracks_ = dict()
+
+    def update(self, tag_id, x, y, stamp = None, gdop = 1.0) -> bool:
+        if stamp is None:
+            stamp = time.monotonic()
+        track = self.tracks_.get(tag_id)
+        if track is None:
+            track = TagTracker(self.accel_noise_, self.range_sigma_, self.gate_)
+            self.tracks_[tag_id] = track
+        return track.update(x, y, stamp, gdop)
+
+    def getPosition(self, tag_id, stamp = None):
+        track = self.tracks_.get(tag_id)
+        if track is None or not track.isInitialized():
+            return None
+        if stamp is None:
+            stamp = time.monotonic()
+        if stamp - track.stamp > self.max_age_:
+            return None
+        return track.predictPosition(stamp)
+
+    def getState(self, tag_id):
+        # (x, y, vel_x, vel_y, stamp) of the last update, None before the first one
+        track = self.tracks_.get(tag_id)
+        if track is None or not track.isInitialized():
+            return None
+        return track.pos_x, track.pos_y, track.vel_x, track.vel_y, track.stamp
+
+    def getTagIds(self) -> list:
+        return list(self.tracks_.keys())
+
+    def removeTag(self, tag_id):
+        self.tracks_.pop(tag_id, None)
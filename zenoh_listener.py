@@ -0,0 +1,196 @@
+import argparse
+import json
+import threading
+import time
+import traceback
+import numpy as np
+import zenoh
+import multi_robot_datatype
+from cdr_codec import CDRView, UWBStateStampedView, decodeUWBDeltaSeq
+from latency_stats import LatencyHistogram
+
+# topic suffix -> message type, override with -t KEY:TYPE
+TOPIC_TYPES = {'uwb_state': 'UWBState',
+               'uwb_state_stamped': 'UWBStateStamped',
+               'uwb_batch': 'UWBStampedBatch',
+               'uwb_delta': 'UWBDeltaState',
+               'uwb_zone_event': 'UWBZoneEvent',
+               'overview_state': 'OverViewState',
+               'fleet_state': 'FleetState',
+               'battery_state': 'BatteryState',
+               'joint_states': 'JointStates',
+               'pose_output': 'PoseStamped'}
+# types starting with stamp_sec / stamp_nsec
+STAMPED_TYPES = {'UWBStateStamped', 'UWBStampedBatch', 'UWBDeltaState', 'UWBZoneEvent', 'FleetState', 'BatteryState', 'JointStates', 'PoseStamped'}
+# types with a per topic uint32 seq, type -> seq reader
+SEQ_TYPES = {'UWBStateStamped': lambda payload: UWBStateStampedView(payload).seq,
+             'UWBDeltaState': decodeUWBDeltaSeq}
+
+
+class TopicStats():
+    """ Per key receive statistics over the current print window """
+
+    def __init__(self, type_name):
+
+        self.type_name = type_name
+        self.lock_ = threading.Lock()
+        self.total_count = 0
+        self.total_lost = 0
+        self.last_seq_ = None
+        self.last_stamp_ = None
+        self.reset()
+
+    def reset(self):
+        self.count_ = 0
+        self.bytes_ = 0
+        self.intervals_ = list()
+        self.gaps_ = 0
+        self.lost_ = 0
+        self.latency_ = LatencyHistogram()
+
+    def record(self, payload, stamp, wall_time):
+        with self.lock_:
+            self.count_ += 1
+            self.total_count += 1
+            self.bytes_ += len(payload)
+            if self.last_stamp_ is not None:
+                self.intervals_.append(stamp - self.last_stamp_)
+            self.last_stamp_ = stamp
+            if self.type_name in STAMPED_TYPES:
+                view = CDRView(payload)
+                self.latency_.record(wall_time - (view.stamp_sec + view.stamp_nsec * 1e-9))
+            if self.type_name in SEQ_TYPES:
+                seq = SEQ_TYPES[self.type_name](payload)
+                if self.last_seq_ is not None and seq != (self.last_seq_ + 1) & 0xffffffff:
+                    lost = (seq - self.last_seq_ - 1) & 0xffffffff
+                    if lost < 0x80000000: # otherwise a publisher restart or reorder
+                        self.gaps_ += 1
+                        self.lost_ += lost
+                        self.total_lost += lost
+                self.last_seq_ = seq
+
+    def summary(self, period) -> dict:
+        # window summary, the window restarts
+        with self.lock_:
+            intervals = np.asarray(self.intervals_)
+            summary = {'rate': self.count_ / period,
+                       'kbps': self.bytes_ * 8e-3 / period,
+                       'jitter_ms': float(intervals.std() * 1e3) if len(intervals) > 1 else 0.0,
+                       'gaps': self.gaps_,
+                       'lost': self.lost_,
+                       'latency': self.latency_.getStats()}
+            self.reset()
+        return summary
+
+
+class ZenohListener():
+
+    def __init__(self):
+
+        self.arg_parser_ = argparse.ArgumentParser(prog='zenoh-listener',
+                                                description='zenoh topic listener')
+        self.arg_parser_.add_argument('-e', '--connect', type=str, metavar='ENDPOINT', action='append')
+        self.arg_parser_.add_argument('-m', '--mode', type=str, default='client')
+        self.arg_parser_.add_argument('-l', '--listen', type=str, metavar='ENDPOINT', action='append')
+        self.arg_parser_.add_argument('-c', '--config', type=str, metavar='FILE')
+        self.arg_parser_.add_argument('-t', '--topic', type=str, metavar='KEY[:TYPE]', action='append',
+                                      help='key expression, wildcards allowed, type from the last key chunk by default')
+        self.arg_parser_.add_argument('--stats', action='store_true', help='print a rolling per key summary instead of samples')
+        self.arg_parser_.add_argument('--period', type=float, default=1.0, metavar='SECOND')
+        self.zenoh_config_ = None
+        self.zenoh_session_ = None
+        self.topics_ = list() # (key expression, type name)
+        self.subscribers_ = list()
+        self.topic_stats_ = dict() # received key -> TopicStats
+        self.stats_mode_ = False
+        self.period_ = 1.0
+
+        self.zenohInit()
+
+    def zenohInit(self):
+        zenoh_arg = self.arg_parser_.parse_args()
+        self.zenoh_config_ = zenoh.config_from_file(zenoh_arg.config) if zenoh_arg.config is not None else zenoh.Config()
+        if zenoh_arg.mode is not None:
+            self.zenoh_config_.insert_json5(zenoh.config.MODE_KEY, json.dumps(zenoh_arg.mode))
+        if zenoh_arg.connect is not None:
+            self.zenoh_config_.insert_json5(zenoh.config.CONNECT_KEY, json.dumps(zenoh_arg.connect))
+        if zenoh_arg.listen is not None:
+            self.zenoh_config_.insert_json5(zenoh.config.LISTEN_KEY, json.dumps(zenoh_arg.listen))
+        for topic in zenoh_arg.topic or ['rt/turtlebot1/uwb_state']:
+            key, _, type_name = topic.partition(':')
+            type_name = type_name or TOPIC_TYPES.get(key.rsplit('/', 1)[-1])
+            if type_name is not None and not hasattr(multi_robot_datatype, type_name):
+                self.arg_parser_.error("unknown message type {}".format(type_name))
+            self.topics_.append((key, type_name))
+        self.stats_mode_ = zenoh_arg.stats
+        self.period_ = zenoh_arg.period
+
+    def makeListener(self, type_name):
+        message_type = getattr(multi_robot_datatype, type_name) if type_name is not None else None
+        def listener(sample):
+            if self.stats_mode_:
+                self.getTopicStats(str(sample.key_expr), type_name).record(bytes(sample.payload), time.monotonic(), time.time())
+            elif message_type is not None:
+                print('{}: {}'.format(sample.key_expr, message_type.deserialize(sample.payload)))
+            else:
+                print('{}: {} bytes'.format(sample.key_expr, len(sample.payload)))
+        return listener
+
+    def getTopicStats(self, key, type_name) -> TopicStats:
+        topic_stats = self.topic_stats_.get(key)
+        if topic_stats is None:
+            topic_stats = self.topic_stats_.setdefault(key, TopicStats(type_name))
+        return topic_stats
+
+    def printSummary(self):
+        print(time.strftime('%H:%M:%S'))
+        for key, topic_stats in sorted(list(self.topic_stats_.items())):
+            summary = topic_stats.summary(self.period_)
+            latency = summary['latency']
+            latency_text = ''
+            if latency['count']:
+                latency_text = ' latency ms p50 {:.2f} p99 {:.2f} max {:.2f}'.format(
+                    latency['p50'] * 1e3, latency['p99'] * 1e3, latency['max'] * 1e3)
+            print('  {}: {:.1f} Hz {:.1f} kbit/s jitter {:.2f} ms gaps {} lost {} (total {}/{}){}'.format(
+                key, summary['rate'], summary['kbps'], summary['jitter_ms'], summary['gaps'], summary['lost'],
+                topic_stats.total_lost, topic_stats.total_count + topic_stats.total_lost, latency_text))
+
+    def statsLoop(self, stop_event):
+        next_time = time.monotonic()
+        while True:
+            next_time += self.period_
+            if stop_event.wait(max(next_time - time.monotonic(), 0.0)):
+                break
+            self.printSummary()
+
+    def activeListener(self):
+        zenoh.init_logger()
+        print("Initial Zenoh...")
+        self.zenoh_session_ = zenoh.open(self.zenoh_config_)
+        for key, type_name in self.topics_:
+            self.subscribers_.append(self.zenoh_session_.declare_subscriber(key, self.makeListener(type_name)))
+
+    def closeListener(self):
+        for subscriber in self.subscribers_:
+            subscriber.undeclare()
+        self.zenoh_session_.close()
+
+if __name__ == "__main__":
+
+    listener = ZenohListener()
+    listener.activeListener()
+    stop_event = threading.Event()
+    if listener.stats_mode_:
+        threading.Thread(target=listener.statsLoop, args=(stop_event,), daemon=True).start()
+
+    while True:
+        try:
+            cmd = input("CMD: ")
+            if cmd == "q":
+                break
+        except Exception as e:
+            traceback.print_exc()
+            break
+
+    stop_event.set()
+    listener.closeListener()